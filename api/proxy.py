@@ -1,32 +1,98 @@
 """
 Vercel Serverless Function - Audio Proxy
 Proxies audio files from GitHub releases with CORS headers
+
+Ranged GETs are answered from fixed, aligned blocks: the function reads
+/api/proxy?url=...&block=N through the edge of PROXY_EDGE_ORIGIN (so each
+block is cached there once, whatever ranges listeners seek to) and slices
+the client's exact range out of them.
 """
 from http.server import BaseHTTPRequestHandler
+import os
 import urllib.request
 import urllib.parse
 import json
+import re
 import ssl
+from functools import lru_cache
+
+@lru_cache(maxsize=None)
+def ssl_context():
+    """SSL context for GitHub, built on the first request rather than at cold start"""
+    # Try to use certifi for SSL certificates, fallback to unverified context if not available
+    try:
+        import certifi
+        return ssl.create_default_context(cafile=certifi.where())
+    except ImportError:
+        # If certifi is not available, create an unverified context (less secure but works)
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        return context
+
+# Release assets never change under the same name, so the edge can keep them
+# for a year; browsers revalidate daily and may serve stale copies meanwhile.
+CACHE_CONTROL = 'public, max-age=86400, s-maxage=31536000, stale-while-revalidate=604800'
+
+# Request headers forwarded to GitHub so it can answer conditionally
+FORWARDED_REQUEST_HEADERS = ('Range', 'If-None-Match', 'If-Modified-Since', 'If-Range')
+
+# Validators passed back so the edge and browsers can revalidate
+VALIDATOR_HEADERS = ('ETag', 'Last-Modified')
+
+# Size of the aligned blocks requested from GitHub and cached at the edge
+BLOCK_SIZE = 1024 * 1024
+
+# Total size of the asset, sent along with each block
+ASSET_SIZE_HEADER = 'X-Asset-Size'
 
-# Try to use certifi for SSL certificates, fallback to unverified context if not available
-try:
-    import certifi
-    import ssl
-    ssl_context = ssl.create_default_context(cafile=certifi.where())
-except ImportError:
-    # If certifi is not available, create an unverified context (less secure but works)
-    ssl_context = ssl.create_default_context()
-    ssl_context.check_hostname = False
-    ssl_context.verify_mode = ssl.CERT_NONE
+# Public address of this deployment (e.g. https://example.vercel.app) to read
+# blocks through, so the edge caches them. Only ever taken from configuration:
+# the Host header is chosen by the client. Unset, blocks come from GitHub.
+EDGE_ORIGIN = os.environ.get('PROXY_EDGE_ORIGIN', '').rstrip('/')
+
+def parse_byte_range(range_header):
+    """(start, end) of a single 'bytes=start-end' Range (end None if open).
+
+    A missing header means the whole file; returns None for suffix or
+    multi-part ranges, which are passed upstream unchanged.
+    """
+    if not range_header:
+        return 0, None
+    match = re.fullmatch(r'bytes=(\d+)-(\d*)', range_header.strip())
+    if not match:
+        return None
+    start = int(match.group(1))
+    end = int(match.group(2)) if match.group(2) else None
+    if end is not None and end < start:
+        raise ValueError('Invalid range')
+    return start, end
+
+def asset_size(response):
+    """Total size of the asset a block or ranged response belongs to"""
+    if response.headers.get(ASSET_SIZE_HEADER):
+        return int(response.headers[ASSET_SIZE_HEADER])
+    match = re.match(r'bytes \d+-\d+/(\d+)', response.headers.get('Content-Range') or '')
+    if match:
+        return int(match.group(1))
+    if response.getcode() == 200 and response.headers.get('Content-Length'):
+        return int(response.headers['Content-Length'])
+    return None
+
+def audio_content_type(content_type):
+    """GitHub serves assets as octet-stream; players want audio/mpeg"""
+    if not content_type or content_type == 'application/octet-stream':
+        return 'audio/mpeg'
+    return content_type
 
 class handler(BaseHTTPRequestHandler):
     
     def send_cors_headers(self):
         """Send CORS headers"""
         self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Range')
-        self.send_header('Access-Control-Expose-Headers', 'Content-Length, Content-Range, Accept-Ranges')
+        self.send_header('Access-Control-Allow-Methods', 'GET, HEAD, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Range, If-None-Match, If-Modified-Since, If-Range')
+        self.send_header('Access-Control-Expose-Headers', 'Content-Length, Content-Range, Accept-Ranges, ETag, Last-Modified')
     
     def do_OPTIONS(self):
         """Handle CORS preflight"""
@@ -36,47 +102,200 @@ class handler(BaseHTTPRequestHandler):
     
     def do_GET(self):
         """Proxy audio file from GitHub"""
+        url = self.get_release_url()
+        if not url:
+            return
+        query_params = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        block = query_params.get('block', [None])[0]
         try:
-            # Get URL from query parameter
-            parsed_path = urllib.parse.urlparse(self.path)
-            query_params = urllib.parse.parse_qs(parsed_path.query)
-            url = query_params.get('url', [None])[0]
-            
-            if not url:
-                self.send_error_response(400, 'Missing url parameter')
+            if block is not None:
+                self.send_block(url, int(block))
+                return
+            byte_range = parse_byte_range(self.headers.get('Range'))
+        except ValueError:
+            self.send_error_response(400, 'Invalid block or range')
+            return
+        if byte_range is None or not self.headers.get('Range'):
+            # Whole file (one upstream request, not a chain of blocks), or a
+            # suffix or multi-part range: pass it through as-is
+            self.proxy_request()
+        else:
+            self.send_from_blocks(url, *byte_range)
+    
+    def do_HEAD(self):
+        """Proxy only the headers of an audio file, without downloading it"""
+        self.proxy_request(head_only=True)
+    
+    def get_release_url(self):
+        """The validated ?url= of the request, or None after answering with an error"""
+        query_params = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        url = query_params.get('url', [None])[0]
+        
+        if not url:
+            self.send_error_response(400, 'Missing url parameter')
+            return None
+        
+        # Validate that URL is from GitHub releases
+        if 'github.com' not in url or '/releases/download/' not in url:
+            self.send_error_response(400, 'Invalid URL. Must be a GitHub release download URL')
+            return None
+        return url
+    
+    def send_block(self, url, index):
+        """Serve one aligned block as a plain, edge-cacheable 200 response"""
+        start = index * BLOCK_SIZE
+        req = urllib.request.Request(url)
+        req.add_header('Range', f'bytes={start}-{start + BLOCK_SIZE - 1}')
+        try:
+            response = urllib.request.urlopen(req, timeout=30, context=ssl_context())
+        except urllib.error.HTTPError as e:
+            self.send_error_response(e.code, f'Error fetching file: {e.reason}')
+            return
+        except Exception as e:
+            self.send_error_response(500, f'Error: {str(e)}')
+            return
+        
+        try:
+            data = response.read()
+            total = asset_size(response)
+            if response.getcode() == 200:
+                # GitHub ignored the range and sent the whole file
+                data = data[start:start + BLOCK_SIZE]
+            self.send_response(200)
+            self.send_header('Content-Type', audio_content_type(response.headers.get('Content-Type')))
+            self.send_cors_headers()
+            self.send_header('Content-Length', str(len(data)))
+            if total is not None:
+                self.send_header(ASSET_SIZE_HEADER, str(total))
+            self.send_validator_headers(response.headers)
+            self.send_header('Cache-Control', CACHE_CONTROL)
+            self.end_headers()
+            self.wfile.write(data)
+        finally:
+            response.close()
+    
+    def fetch_block(self, url, index):
+        """Read one block, through the edge cache when PROXY_EDGE_ORIGIN is set"""
+        if EDGE_ORIGIN:
+            query = urllib.parse.urlencode({'url': url, 'block': index})
+            try:
+                response = urllib.request.urlopen(f'{EDGE_ORIGIN}/api/proxy?{query}',
+                                                  timeout=30, context=ssl_context())
+                if response.headers.get(ASSET_SIZE_HEADER):
+                    return response
+                response.close()
+            except urllib.error.HTTPError as e:
+                if e.code == 416:
+                    raise
+            except Exception:
+                pass
+        # No edge to go through (or it failed): ask GitHub for the block directly
+        start = index * BLOCK_SIZE
+        req = urllib.request.Request(url)
+        req.add_header('Range', f'bytes={start}-{start + BLOCK_SIZE - 1}')
+        return urllib.request.urlopen(req, timeout=30, context=ssl_context())
+    
+    def send_from_blocks(self, url, start, end):
+        """Answer a ranged GET from aligned blocks.
+
+        An open-ended range (what players send) is answered up to the end of
+        its first block; players ask for the rest as they need it.
+        """
+        index = start // BLOCK_SIZE
+        try:
+            response = self.fetch_block(url, index)
+        except urllib.error.HTTPError as e:
+            self.send_error_response(e.code, f'Error fetching file: {e.reason}')
+            return
+        except Exception as e:
+            self.send_error_response(500, f'Error: {str(e)}')
+            return
+        
+        try:
+            total = asset_size(response)
+            if total is None:
+                self.send_error_response(502, 'Upstream did not report the size of the file')
+                return
+            etag = response.headers.get('ETag')
+            if etag and self.headers.get('If-None-Match') == etag:
+                self.send_not_modified(response.headers)
                 return
             
-            # Validate that URL is from GitHub releases
-            if 'github.com' not in url or '/releases/download/' not in url:
-                self.send_error_response(400, 'Invalid URL. Must be a GitHub release download URL')
+            if end is None:
+                end = (index + 1) * BLOCK_SIZE - 1
+            end = min(end, total - 1)
+            if start > end:
+                self.send_response(416)
+                self.send_cors_headers()
+                self.send_header('Content-Range', f'bytes */{total}')
+                self.end_headers()
                 return
             
-            # Get Range header for partial content support (for seeking)
-            range_header = self.headers.get('Range', '')
+            self.send_response(206)
+            self.send_header('Content-Type', audio_content_type(response.headers.get('Content-Type')))
+            self.send_cors_headers()
+            self.send_header('Content-Length', str(end - start + 1))
+            self.send_header('Content-Range', f'bytes {start}-{end}/{total}')
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_validator_headers(response.headers)
+            self.send_header('Cache-Control', CACHE_CONTROL)
+            self.end_headers()
+            
+            position = start
+            while True:
+                block_start = index * BLOCK_SIZE
+                data = response.read()
+                if response.getcode() == 200 and ASSET_SIZE_HEADER not in response.headers:
+                    # GitHub ignored the range and sent the whole file
+                    data = data[block_start:block_start + BLOCK_SIZE]
+                response.close()
+                self.wfile.write(data[position - block_start:end + 1 - block_start])
+                position = block_start + len(data)
+                if position > end or len(data) < min(BLOCK_SIZE, total - block_start):
+                    # Done, or the block came up short and the body can only be cut short
+                    return
+                index += 1
+                response = self.fetch_block(url, index)
+        finally:
+            response.close()
+    
+    def proxy_request(self, head_only=False):
+        """Forward a (possibly conditional) request to GitHub and relay the answer"""
+        try:
+            url = self.get_release_url()
+            if not url:
+                return
             
             # Create request to GitHub
-            req = urllib.request.Request(url)
+            req = urllib.request.Request(url, method='HEAD' if head_only else 'GET')
             
-            # Forward Range header if present
-            if range_header:
-                req.add_header('Range', range_header)
+            # Forward Range (for seeking) and the edge's validators
+            for header in FORWARDED_REQUEST_HEADERS:
+                value = self.headers.get(header)
+                if value:
+                    req.add_header(header, value)
             
             # Fetch the file
             try:
                 # Set a timeout and use SSL context
-                response = urllib.request.urlopen(req, timeout=30, context=ssl_context)
-                
+                response = urllib.request.urlopen(req, timeout=30, context=ssl_context())
+            except urllib.error.HTTPError as e:
+                if e.code == 304:
+                    # Still fresh: answer without moving any audio bytes
+                    self.send_not_modified(e.headers)
+                else:
+                    self.send_error_response(e.code, f'Error fetching file: {e.reason}')
+                return
+            except Exception as e:
+                self.send_error_response(500, f'Error: {str(e)}')
+                return
+            
+            try:
                 # Get status code
                 status_code = response.getcode()
                 
                 # Get headers from GitHub response
-                content_type = response.headers.get('Content-Type', 'audio/mpeg')
-                if not content_type or content_type == 'application/octet-stream':
-                    # Try to determine from URL
-                    if url.endswith('.mp3'):
-                        content_type = 'audio/mpeg'
-                    else:
-                        content_type = 'audio/mpeg'  # Default to MP3
+                content_type = audio_content_type(response.headers.get('Content-Type'))
                 
                 content_length = response.headers.get('Content-Length')
                 content_range = response.headers.get('Content-Range')
@@ -96,29 +315,43 @@ class handler(BaseHTTPRequestHandler):
                 if content_range:
                     self.send_header('Content-Range', content_range)
                 self.send_header('Accept-Ranges', accept_ranges)
-                self.send_header('Cache-Control', 'public, max-age=31536000')
+                self.send_validator_headers(response.headers)
+                self.send_header('Cache-Control', CACHE_CONTROL)
                 
                 self.end_headers()
                 
+                # For HEAD requests, don't send body
+                if head_only:
+                    return
+                
                 # Stream the file in chunks
                 chunk_size = 8192
-                try:
-                    while True:
-                        chunk = response.read(chunk_size)
-                        if not chunk:
-                            break
-                        self.wfile.write(chunk)
-                finally:
-                    response.close()
-                        
-            except urllib.error.HTTPError as e:
-                self.send_error_response(e.code, f'Error fetching file: {e.reason}')
-            except Exception as e:
-                self.send_error_response(500, f'Error: {str(e)}')
+                while True:
+                    chunk = response.read(chunk_size)
+                    if not chunk:
+                        break
+                    self.wfile.write(chunk)
+            finally:
+                response.close()
                 
         except Exception as e:
             self.send_error_response(500, f'Error: {str(e)}')
     
+    def send_validator_headers(self, upstream_headers):
+        """Pass ETag / Last-Modified from GitHub through to the client"""
+        for header in VALIDATOR_HEADERS:
+            value = upstream_headers.get(header)
+            if value:
+                self.send_header(header, value)
+    
+    def send_not_modified(self, upstream_headers):
+        """Send a bodiless 304 carrying the validators and caching directives"""
+        self.send_response(304)
+        self.send_cors_headers()
+        self.send_validator_headers(upstream_headers)
+        self.send_header('Cache-Control', CACHE_CONTROL)
+        self.end_headers()
+    
     def send_error_response(self, code, message):
         """Send error response"""
         self.send_response(code)
@@ -128,4 +361,3 @@ class handler(BaseHTTPRequestHandler):
         self.wfile.write(json.dumps({
             'error': message
         }).encode())
-
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Watch the audio folder for tracks being added or removed.
+
+Uses inotify on Linux (through ctypes, no extra dependency) and falls back
+to polling the directory elsewhere. The callback is called with no
+arguments whenever the set of MP3 files may have changed; callers are
+expected to debounce it.
+"""
+import ctypes
+import ctypes.util
+import os
+import struct
+import sys
+import threading
+import time
+
+# inotify event masks (from <sys/inotify.h>)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+
+EVENT_HEADER = struct.Struct('iIII')
+
+POLL_INTERVAL = 2.0
+
+
+def is_track_name(name):
+    """Whether a file name is a finished MP3 (not a yt-dlp/ffmpeg temp file)"""
+    return name.endswith('.mp3') and not name.endswith('.temp.mp3')
+
+
+class AudioWatcher:
+    """Background watcher calling on_change when MP3 files come or go"""
+
+    def __init__(self, audio_dir, on_change, poll_interval=POLL_INTERVAL):
+        self.audio_dir = str(audio_dir)
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self.backend = None
+
+    def start(self):
+        """Start watching in a daemon thread; returns the backend name"""
+        os.makedirs(self.audio_dir, exist_ok=True)
+        fd = self._open_inotify()
+        if fd is not None:
+            self.backend = 'inotify'
+            target = lambda: self._watch_inotify(fd)
+        else:
+            self.backend = 'polling'
+            target = self._watch_polling
+        threading.Thread(target=target, daemon=True).start()
+        return self.backend
+
+    def _open_inotify(self):
+        """Set up an inotify watch, or return None if inotify isn't available"""
+        if not sys.platform.startswith('linux'):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            fd = libc.inotify_init1(os.O_CLOEXEC)
+            if fd < 0:
+                return None
+            wd = libc.inotify_add_watch(fd, os.fsencode(self.audio_dir), WATCH_MASK)
+            if wd < 0:
+                os.close(fd)
+                return None
+            return fd
+        except (OSError, AttributeError):
+            return None
+
+    def _watch_inotify(self, fd):
+        while True:
+            try:
+                data = os.read(fd, 64 * 1024)
+            except OSError as e:
+                print(f"Audio watcher stopped: {e}")
+                return
+            changed = False
+            offset = 0
+            while offset + EVENT_HEADER.size <= len(data):
+                _, mask, _, name_len = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset:offset + name_len].rstrip(b'\0').decode('utf-8', 'surrogateescape')
+                offset += name_len
+                if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                    print("Audio watcher: audio/ was removed, switching to polling")
+                    os.close(fd)
+                    self.backend = 'polling'
+                    self._watch_polling()
+                    return
+                if is_track_name(name):
+                    changed = True
+            if changed:
+                self.on_change()
+
+    def _snapshot(self):
+        """Map of track name -> (size, mtime) for the audio folder"""
+        snapshot = {}
+        try:
+            with os.scandir(self.audio_dir) as entries:
+                for entry in entries:
+                    if is_track_name(entry.name):
+                        stat = entry.stat()
+                        snapshot[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        except FileNotFoundError:
+            pass
+        return snapshot
+
+    def _watch_polling(self):
+        # Adds, removes and renames bump the directory mtime, so a single
+        # stat per interval is enough; the full listing is only read when
+        # it changes, or when a file was still growing last time.
+        previous = self._snapshot()
+        last_dir_mtime = None
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                dir_mtime = os.stat(self.audio_dir).st_mtime_ns
+            except FileNotFoundError:
+                dir_mtime = None
+            if dir_mtime == last_dir_mtime:
+                continue
+            current = self._snapshot()
+            if current != previous:
+                previous = current
+                # Re-check next round in case a file is still being written
+                last_dir_mtime = None
+                self.on_change()
+            else:
+                last_dir_mtime = dir_mtime
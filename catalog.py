@@ -0,0 +1,519 @@
+#!/usr/bin/env python3
+"""
+Library catalog for the audio folder, kept in a SQLite database.
+
+Every track gets a stable id derived from its content, and the playlist
+order is stored here instead of being encoded in filename prefixes.
+Adding a track appends one row; nothing else is renamed. Rows also keep
+the size and mtime the id was computed from, the duration, the release
+asset URL, the YouTube video id and the integrity scan result, so tools
+look tracks up instead of rescanning audio/ (or downloading a video
+again).
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import unicodedata
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.parse import unquote
+
+import mp3_frames
+
+CATALOG_DB = 'catalog.db'
+
+# Catalog of earlier versions, imported into the database on first use
+LEGACY_CATALOG_FILE = 'catalog.json'
+
+# Number of hex digits kept from the content hash
+TRACK_ID_LENGTH = 16
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    file TEXT PRIMARY KEY,      -- name inside the audio folder
+    id TEXT NOT NULL,           -- content hash, kept across renames
+    title TEXT NOT NULL,
+    position INTEGER NOT NULL,  -- playlist order
+    size INTEGER NOT NULL,      -- size and mtime the id was computed from
+    mtime REAL NOT NULL,
+    duration REAL,
+    asset_url TEXT,             -- where the track is published, if it is
+    asset_key TEXT NOT NULL,    -- release_asset_key(file)
+    video_id TEXT,              -- YouTube video it was downloaded from
+    integrity TEXT              -- check_audio result for this size and mtime (JSON)
+);
+CREATE INDEX IF NOT EXISTS tracks_by_id ON tracks (id);
+CREATE INDEX IF NOT EXISTS tracks_by_position ON tracks (position);
+CREATE INDEX IF NOT EXISTS tracks_by_asset_url ON tracks (asset_url);
+CREATE INDEX IF NOT EXISTS tracks_by_asset_key ON tracks (asset_key);
+CREATE TABLE IF NOT EXISTS playlist_changes (
+    revision INTEGER PRIMARY KEY AUTOINCREMENT,  -- never reused
+    change TEXT NOT NULL        -- JSON: {"type", "id", "index", "track"}
+);
+"""
+
+# Playlist changes kept for delta sync; clients further behind get a snapshot
+MAX_PLAYLIST_CHANGES = 1000
+
+TRACK_FIELDS = ('id', 'file', 'title', 'size', 'mtime', 'duration', 'asset_url', 'video_id')
+
+# Legacy numbered prefix ("07_Title.mp3"): exactly two digits, so titles
+# such as "1979_Smashing" keep their number
+LEGACY_PREFIX = re.compile(r'^\d{2}_(.+)$')
+
+# "[video_id]" tag that downloads carry in their name until import_download()
+VIDEO_ID_TAG = re.compile(r'\[([A-Za-z0-9_-]{11})\]$')
+
+# Databases whose schema has been checked by this process
+_initialized = set()
+
+
+class _HashingReader:
+    """File wrapper hashing everything read through it"""
+
+    def __init__(self, f):
+        self.f = f
+        self.digest = hashlib.sha1()
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        self.digest.update(data)
+        return data
+
+
+def scan_track(file_path):
+    """Read a file once; return its content-derived id and duration in seconds"""
+    with open(file_path, 'rb') as f:
+        reader = _HashingReader(f)
+        duration = sum(header.samples / header.sample_rate
+                       for _, header, _ in mp3_frames.iter_frames(reader))
+        while reader.read(1024 * 1024):
+            pass
+    return reader.digest.hexdigest()[:TRACK_ID_LENGTH], round(duration, 3)
+
+
+def title_from_filename(filename):
+    """Derive a display title from a file name.
+
+    Strips the extension, legacy numeric prefixes ("07_Title") and
+    YouTube id tags ("[video_id]").
+    """
+    title = Path(filename).stem
+    prefix_match = LEGACY_PREFIX.match(title)
+    if prefix_match:
+        title = prefix_match.group(1)
+    return re.sub(r'\[.*?\]', '', title).strip()
+
+
+def release_asset_key(name):
+    """Normalize a file or release asset name for matching the two.
+
+    GitHub rewrites uploaded asset names (spaces and symbols become dots,
+    accents and emoji are dropped), so "01_Golden (Cover) 🎧.mp3" is
+    published as "01_Golden.Cover.mp3". Both sides map to the same key.
+    """
+    name = unquote(name)
+    name = unicodedata.normalize('NFKD', name)
+    name = ''.join(c for c in name if not unicodedata.combining(c))
+    name = re.sub(r'[^A-Za-z0-9_\-]+', '.', name)
+    return name.strip('.').lower()
+
+
+def write_text_atomic(path, text):
+    """Write text to a temp file next to path, then rename it into place.
+
+    Readers see either the old file or the new one, never a partial write.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f'.{os.path.basename(path)}.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def write_json_atomic(path, data, **dump_options):
+    """Write JSON to path atomically (see write_text_atomic)"""
+    write_text_atomic(path, json.dumps(data, **dump_options))
+
+
+@contextmanager
+def open_catalog(db_path=CATALOG_DB, write=True):
+    """Open the catalog database (creating it if needed) for one transaction.
+
+    Write transactions take the database lock up front, so concurrent
+    writers (a script and the server) queue up instead of failing.
+    """
+    db = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    db.row_factory = sqlite3.Row
+    try:
+        # Keyed by absolute path: the same relative name can move with the cwd
+        if os.path.abspath(db_path) not in _initialized:
+            # WAL lets the server read while a script is writing
+            db.execute('PRAGMA journal_mode=WAL')
+            db.executescript(SCHEMA)
+            _migrate(db)
+            _import_legacy_catalog(db)
+            _initialized.add(os.path.abspath(db_path))
+        db.execute('BEGIN IMMEDIATE' if write else 'BEGIN')
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+    finally:
+        db.close()
+
+
+def _migrate(db):
+    """Bring databases created by earlier versions up to SCHEMA"""
+    columns = {row['name'] for row in db.execute('PRAGMA table_info(tracks)')}
+    if 'video_id' not in columns:
+        db.execute('ALTER TABLE tracks ADD COLUMN video_id TEXT')
+    db.execute('CREATE INDEX IF NOT EXISTS tracks_by_video_id ON tracks (video_id)')
+    if 'integrity' not in columns:
+        db.execute('ALTER TABLE tracks ADD COLUMN integrity TEXT')
+
+
+def _import_legacy_catalog(db):
+    """Copy the tracks of an old catalog.json (order included) into an empty database"""
+    if not os.path.exists(LEGACY_CATALOG_FILE):
+        return
+    db.execute('BEGIN IMMEDIATE')
+    if db.execute('SELECT 1 FROM tracks LIMIT 1').fetchone() is not None:
+        db.execute('ROLLBACK')
+        return
+    with open(LEGACY_CATALOG_FILE, 'r', encoding='utf-8') as f:
+        tracks = json.load(f).get('tracks', [])
+    for position, track in enumerate(tracks):
+        _insert_track(db, dict(track, position=position))
+    db.execute('COMMIT')
+    print(f"Catalog: imported {len(tracks)} track(s) from {LEGACY_CATALOG_FILE} "
+          f"(it is no longer used)")
+
+
+def _insert_track(db, track):
+    db.execute(
+        'INSERT OR REPLACE INTO tracks'
+        ' (file, id, title, position, size, mtime, duration, asset_url, asset_key, video_id)'
+        ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        (track['file'], track['id'], track['title'], track['position'],
+         track['size'], track['mtime'], track.get('duration'), track.get('asset_url'),
+         release_asset_key(track['file']), track.get('video_id')))
+
+
+def _unique_id(db, track_id, file_name):
+    """track_id, suffixed ("-2", "-3"...) if another file already uses it.
+
+    Identical audio saved under two names has the same content hash, but
+    players tell tracks apart by id.
+    """
+    candidate = track_id
+    counter = 1
+    while db.execute('SELECT 1 FROM tracks WHERE id = ? AND file != ?',
+                     (candidate, file_name)).fetchone():
+        counter += 1
+        candidate = f'{track_id}-{counter}'
+    return candidate
+
+
+def _content_hash(track_id):
+    """The content hash part of a track id (see _unique_id)"""
+    return track_id.split('-')[0]
+
+
+def _track(row):
+    return {key: row[key] for key in TRACK_FIELDS}
+
+
+def list_tracks(db_path=CATALOG_DB):
+    """Return every track in playlist order, without looking at the disk"""
+    with open_catalog(db_path, write=False) as db:
+        return [_track(row) for row in db.execute('SELECT * FROM tracks ORDER BY position')]
+
+
+def find_by_asset_url(url, db_path=CATALOG_DB):
+    """Return the track published at url, or None"""
+    with open_catalog(db_path, write=False) as db:
+        row = db.execute('SELECT * FROM tracks WHERE asset_url = ?', (url,)).fetchone()
+    return _track(row) if row else None
+
+
+def find_by_asset_name(name, db_path=CATALOG_DB):
+    """Return the tracks a release asset name may refer to (see release_asset_key).
+
+    The normalized names are lossy, so several tracks can match; callers
+    must check the content before treating one as the asset.
+    """
+    with open_catalog(db_path, write=False) as db:
+        return [_track(row) for row in
+                db.execute('SELECT * FROM tracks WHERE asset_key = ? ORDER BY position',
+                           (release_asset_key(name),))]
+
+
+def find_by_video_id(video_id, db_path=CATALOG_DB):
+    """Return the track downloaded from a YouTube video, or None"""
+    with open_catalog(db_path, write=False) as db:
+        row = db.execute('SELECT * FROM tracks WHERE video_id = ? ORDER BY position',
+                         (video_id,)).fetchone()
+    return _track(row) if row else None
+
+
+def list_video_ids(db_path=CATALOG_DB):
+    """{video id: file name} of every track downloaded from YouTube"""
+    with open_catalog(db_path, write=False) as db:
+        return {row['video_id']: row['file'] for row in
+                db.execute('SELECT video_id, file FROM tracks WHERE video_id IS NOT NULL')}
+
+
+def set_asset_urls(asset_urls, db_path=CATALOG_DB):
+    """Record where tracks are published: {file name: release asset URL}"""
+    with open_catalog(db_path) as db:
+        db.executemany('UPDATE tracks SET asset_url = ? WHERE file = ?',
+                       [(url, name) for name, url in asset_urls.items()])
+
+
+def list_integrity(db_path=CATALOG_DB):
+    """{file name: (size, mtime, integrity scan result or None)} of every track"""
+    with open_catalog(db_path, write=False) as db:
+        return {row['file']: (row['size'], row['mtime'],
+                              json.loads(row['integrity']) if row['integrity'] else None)
+                for row in db.execute('SELECT file, size, mtime, integrity FROM tracks')}
+
+
+def set_integrity(results, db_path=CATALOG_DB):
+    """Store integrity scan results: {file name: (size, mtime, result)}.
+
+    A result is only kept if the file still has the size and mtime it
+    was scanned at.
+    """
+    with open_catalog(db_path) as db:
+        db.executemany('UPDATE tracks SET integrity = ? WHERE file = ? AND size = ? AND mtime = ?',
+                       [(json.dumps(result, ensure_ascii=False), name, size, mtime)
+                        for name, (size, mtime, result) in results.items()])
+
+
+def rename_track(old_name, new_name, db_path=CATALOG_DB):
+    """Point a track at its new file name (id and position unchanged)"""
+    with open_catalog(db_path) as db:
+        db.execute('UPDATE tracks SET file = ?, asset_key = ? WHERE file = ?',
+                   (new_name, release_asset_key(new_name), old_name))
+
+
+def _latest_revision(db):
+    row = db.execute("SELECT seq FROM sqlite_sequence WHERE name = 'playlist_changes'").fetchone()
+    return row[0] if row else 0
+
+
+def append_playlist_changes(db, changes):
+    """Log playlist changes in an open write transaction; returns the new revision.
+
+    Each change gets its own revision. Only the last MAX_PLAYLIST_CHANGES
+    are kept.
+    """
+    for change in changes:
+        db.execute('INSERT INTO playlist_changes (change) VALUES (?)',
+                   (json.dumps(change, ensure_ascii=False),))
+    latest = _latest_revision(db)
+    db.execute('DELETE FROM playlist_changes WHERE revision <= ?', (latest - MAX_PLAYLIST_CHANGES,))
+    return latest
+
+
+def playlist_changes_since(revision, db_path=CATALOG_DB):
+    """Return (latest revision, changes made after revision, oldest first).
+
+    The changes are None when some of them are no longer logged (or the
+    revision is unknown): the caller needs a full snapshot instead.
+    """
+    with open_catalog(db_path, write=False) as db:
+        latest = _latest_revision(db)
+        if revision > latest or revision < 0:
+            return latest, None
+        rows = db.execute('SELECT revision, change FROM playlist_changes WHERE revision > ?'
+                          ' ORDER BY revision', (revision,)).fetchall()
+    if len(rows) != latest - revision:
+        return latest, None
+    return latest, [dict(json.loads(change), revision=number) for number, change in rows]
+
+
+def sync_catalog(audio_dir, db_path=CATALOG_DB):
+    """Bring the catalog in line with the MP3 files in audio_dir.
+
+    One directory listing is compared against the stored size and mtime;
+    only new or changed files are read. New files are appended (oldest
+    first); a file that was renamed keeps its id and position. Rows whose
+    file disappeared are dropped. Returns the ordered list of tracks.
+
+    Files are read before the write transaction starts, so a long first
+    scan doesn't hold the catalog lock (and make downloads wait on it).
+    """
+    on_disk = {}
+    with os.scandir(audio_dir) as entries:
+        for entry in entries:
+            if not entry.name.endswith('.mp3') or entry.name.endswith('.temp.mp3'):
+                # .temp.mp3: ffmpeg output still being written
+                continue
+            stat = entry.stat()
+            on_disk[entry.name] = (Path(entry.path), stat.st_size, stat.st_mtime)
+
+    with open_catalog(db_path, write=False) as db:
+        known = {row['file']: row for row in
+                 db.execute('SELECT file, size, mtime, duration FROM tracks').fetchall()}
+    scans = {}  # file name -> (content hash, duration)
+    for name, (mp3_file, size, mtime) in on_disk.items():
+        row = known.get(name)
+        if row is None or _needs_scan(row, size, mtime):
+            try:
+                scans[name] = scan_track(mp3_file)
+            except OSError as e:
+                # Gone or unreadable since the listing: the next sync sees it again
+                print(f"Catalog: could not read {name}: {e}")
+
+    with open_catalog(db_path) as db:
+        missing = {}  # file name -> content hash, for rows whose file is gone
+        for row in db.execute('SELECT file, id, size, mtime, duration FROM tracks').fetchall():
+            current = on_disk.pop(row['file'], None)
+            if current is None:
+                missing[row['file']] = _content_hash(row['id'])
+                continue
+            _, size, mtime = current
+            if _needs_scan(row, size, mtime) and row['file'] in scans:
+                track_id, duration = scans[row['file']]
+                if _content_hash(row['id']) == track_id:
+                    track_id = row['id']
+                else:
+                    track_id = _unique_id(db, track_id, row['file'])
+                db.execute('UPDATE tracks SET id = ?, size = ?, mtime = ?, duration = ?,'
+                           ' integrity = NULL WHERE file = ?',
+                           (track_id, size, mtime, duration, row['file']))
+
+        def arrival_order(item):
+            # Files still carrying a legacy "NN_" prefix keep that order
+            name, (_, _, mtime) = item
+            prefix_match = re.match(r'^(\d{2})_', name)
+            if prefix_match:
+                return (0, int(prefix_match.group(1)), mtime)
+            return (1, 0, mtime)
+
+        position = db.execute('SELECT COALESCE(MAX(position) + 1, 0) FROM tracks').fetchone()[0]
+        for name, (_, size, mtime) in sorted(on_disk.items(), key=arrival_order):
+            if name not in scans:
+                continue
+            track_id, duration = scans[name]
+            previous = next((file for file, content_hash in missing.items()
+                             if content_hash == track_id), None)
+            if previous is not None:
+                del missing[previous]
+                # Same content under a new name: keep its place in the order
+                print(f"Catalog: {previous} was renamed to {name}")
+                db.execute('UPDATE tracks SET file = ?, asset_key = ?, size = ?, mtime = ?'
+                           ' WHERE file = ?',
+                           (name, release_asset_key(name), size, mtime, previous))
+                continue
+            # Files downloaded outside the app may still carry their video id
+            tag = VIDEO_ID_TAG.search(Path(name).stem)
+            _insert_track(db, {
+                'id': _unique_id(db, track_id, name),
+                'file': name,
+                'title': title_from_filename(name),
+                'position': position,
+                'size': size,
+                'mtime': mtime,
+                'duration': duration,
+                'video_id': tag.group(1) if tag else None,
+            })
+            position += 1
+            print(f"Catalog: added {name}")
+
+        for name in missing:
+            db.execute('DELETE FROM tracks WHERE file = ?', (name,))
+            print(f"Catalog: removed {name}")
+
+        return [_track(row) for row in db.execute('SELECT * FROM tracks ORDER BY position')]
+
+
+def _needs_scan(row, size, mtime):
+    """Whether a cataloged file changed since it was read (rows imported
+    from catalog.json have no duration yet)"""
+    return row['size'] != size or row['mtime'] != mtime or row['duration'] is None
+
+
+def add_track(file_path, video_id=None, previous_name=None, db_path=CATALOG_DB):
+    """Catalog one file right away, at the end of the order, without a full sync.
+
+    previous_name is the name the file had until just now (a download's
+    tagged name): if a sync cataloged it under that name already, the row
+    moves to the new name, keeping its id and position.
+    """
+    file_path = Path(file_path)
+    stat = file_path.stat()
+    track_id, duration = scan_track(file_path)
+    with open_catalog(db_path) as db:
+        query = 'SELECT id, position, asset_url, video_id FROM tracks WHERE file = ?'
+        row = db.execute(query, (file_path.name,)).fetchone()
+        if row is None and previous_name:
+            row = db.execute(query, (previous_name,)).fetchone()
+            if row:
+                db.execute('DELETE FROM tracks WHERE file = ?', (previous_name,))
+        if row:
+            position = row['position']
+        else:
+            position = db.execute('SELECT COALESCE(MAX(position) + 1, 0) FROM tracks').fetchone()[0]
+        if row and _content_hash(row['id']) == track_id:
+            track_id = row['id']
+        else:
+            track_id = _unique_id(db, track_id, file_path.name)
+        _insert_track(db, {
+            'id': track_id,
+            'file': file_path.name,
+            'title': title_from_filename(file_path.name),
+            'position': position,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'duration': duration,
+            'asset_url': row['asset_url'] if row else None,
+            'video_id': video_id or (row['video_id'] if row else None),
+        })
+
+
+def import_download(file_path, video_id=None):
+    """Give a finished yt-dlp download its final name and catalog it.
+
+    The "[video_id]" tag is dropped from the name and kept in the catalog
+    instead; video_id is only used for files without one. Returns the new
+    path.
+    """
+    file_path = Path(file_path)
+    tag = VIDEO_ID_TAG.search(file_path.stem)
+    if tag:
+        video_id = tag.group(1)
+    title = title_from_filename(file_path.name)
+    new_path = file_path.parent / f"{title}{file_path.suffix}"
+    if file_path != new_path:
+        new_path = unique_track_path(file_path.parent, title, file_path.suffix)
+        file_path.rename(new_path)
+        print(f"Renamed downloaded file: {file_path.name} -> {new_path.name}")
+    add_track(new_path, video_id, previous_name=file_path.name)
+    return new_path
+
+
+def unique_track_path(audio_dir, title, extension='.mp3'):
+    """Return a path for a new track named after its title, avoiding clashes"""
+    audio_dir = Path(audio_dir)
+    new_path = audio_dir / f"{title}{extension}"
+    counter = 1
+    while new_path.exists():
+        new_path = audio_dir / f"{title}_{counter}{extension}"
+        counter += 1
+    return new_path
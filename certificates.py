@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+"""
+SSL context for HTTPS requests to GitHub.
+
+Uses certifi's CA bundle when it is installed (Python on macOS often has
+no usable system certificates), and is built on first use since loading
+the certificates takes a while.
+"""
+import ssl
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def ssl_context():
+    # Try to use certifi for SSL certificates, fallback to unverified context if not available
+    try:
+        import certifi
+        return ssl.create_default_context(cafile=certifi.where())
+    except ImportError:
+        # If certifi is not available, create an unverified context (less secure but works)
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        return context
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Script to find truncated or corrupt MP3 files in the audio folder.
+
+Walks every frame sync header, checks that frames follow each other
+without (more than a few bytes of) gaps and that the last frame ends
+where the file does. Files are scanned in parallel and each result is
+stored in the file's catalog row, so only new or modified files are read
+again.
+
+Usage: python3 check_audio.py   (exits with status 1 if bad files are found)
+"""
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import catalog
+import mp3_frames
+
+# A real track has at least this many frames (~0.25 s)
+MIN_FRAMES = 10
+
+# Bytes of junk tolerated between frames / after the last frame that
+# aren't explained by a trailing tag (encoders and taggers leave a few
+# stray bytes in otherwise fine files)
+MAX_GAP = 256
+
+# Size of an ID3v1 tag at the end of a file
+ID3V1_SIZE = 128
+
+
+def trailing_tag_size(path, file_size):
+    """Size of the ID3v1 / APEv2 tags at the end of a file"""
+    with open(path, 'rb') as f:
+        size = 0
+        if file_size >= ID3V1_SIZE:
+            f.seek(file_size - ID3V1_SIZE)
+            if f.read(3) == b'TAG':
+                size += ID3V1_SIZE
+        if file_size - size >= 32:
+            f.seek(file_size - size - 32)
+            footer = f.read(32)
+            if footer[:8] == b'APETAGEX':
+                size += int.from_bytes(footer[12:16], 'little') + 32
+    return size
+
+
+def scan_file(path):
+    """Check one MP3 file; returns a dict with ok, frames, duration and issues"""
+    file_size = os.path.getsize(path)
+    issues = []
+    frames = 0
+    duration = 0.0
+    expected = None
+    end = 0
+    sample_rate = None
+    with open(path, 'rb') as f:
+        head = f.read(10)
+        f.seek(0)
+        start = mp3_frames.id3v2_size(head)
+        for offset, header, _ in mp3_frames.iter_frames(f):
+            if expected is None:
+                expected = max(start, 0)
+            gap = offset - expected
+            if gap > MAX_GAP:
+                issues.append(f'{gap} bytes of garbage at offset {expected}')
+            if sample_rate is None:
+                sample_rate = header.sample_rate
+            elif header.sample_rate != sample_rate:
+                issues.append(f'sample rate changes at offset {offset}')
+                sample_rate = header.sample_rate
+            frames += 1
+            duration += header.samples / header.sample_rate
+            expected = end = offset + header.length
+
+    if frames < MIN_FRAMES:
+        issues.append(f'only {frames} audio frames')
+    else:
+        leftover = file_size - trailing_tag_size(path, file_size) - end
+        if leftover > 0:
+            with open(path, 'rb') as f:
+                f.seek(end)
+                # A frame header there means the last frame was cut short
+                cut_frame = mp3_frames.parse_frame_header(f.read(4)) is not None
+            if cut_frame or leftover > MAX_GAP:
+                issues.append(f'truncated: {leftover} bytes of an incomplete frame at the end')
+
+    # Keep reports short for badly broken files
+    if len(issues) > 5:
+        issues = issues[:5] + [f'... and {len(issues) - 5} more problems']
+
+    return {
+        'ok': not issues,
+        'frames': frames,
+        'duration': round(duration, 3),
+        'issues': issues,
+    }
+
+
+def scan_library(audio_dir='audio', workers=None):
+    """Scan every MP3 in audio_dir; returns {file name: result}.
+
+    The catalog is synced first; files whose row already holds a result
+    for their size and mtime aren't read again, the rest are scanned in
+    a process pool.
+    """
+    audio_dir = Path(audio_dir)
+    catalog.sync_catalog(audio_dir)
+    results = {}
+    todo = []
+    for name, (size, mtime, result) in sorted(catalog.list_integrity().items()):
+        if result is not None:
+            results[name] = result
+        else:
+            todo.append((audio_dir / name, size, mtime))
+
+    if len(todo) == 1:
+        # Not worth starting a pool (e.g. right after a single download)
+        scanned = [scan_file(todo[0][0])]
+    elif todo:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            scanned = list(pool.map(scan_file, [path for path, _, _ in todo], chunksize=4))
+    else:
+        scanned = []
+
+    for (path, _, _), result in zip(todo, scanned):
+        results[path.name] = result
+    if todo:
+        catalog.set_integrity({path.name: (size, mtime, result)
+                               for (path, size, mtime), result in zip(todo, scanned)})
+    return results
+
+
+def find_bad_tracks(audio_dir='audio'):
+    """Return {file name: issues} for every file that failed the scan"""
+    return {name: result['issues'] for name, result in scan_library(audio_dir).items()
+            if not result['ok']}
+
+
+def print_report(bad):
+    for name, issues in sorted(bad.items()):
+        print(f"  ✗ {name}")
+        for issue in issues:
+            print(f"      {issue}")
+
+
+if __name__ == '__main__':
+    if not os.path.exists('audio'):
+        print("Audio directory not found.")
+        sys.exit(1)
+
+    results = scan_library('audio')
+    bad = {name: r['issues'] for name, r in results.items() if not r['ok']}
+    print(f"Checked {len(results)} MP3 file(s): {len(results) - len(bad)} OK, {len(bad)} bad")
+    if bad:
+        print_report(bad)
+        sys.exit(1)
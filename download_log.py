@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Persistent record of YouTube download attempts, plus cleanup of the
+partial files yt-dlp leaves behind.
+
+downloads.json maps each URL to its status and the list of attempts made
+for it, so interrupted downloads can be resumed and failures inspected.
+
+run_ytdlp_with_retries() runs yt-dlp for server.py and download_mp3.py:
+timeouts and transient failures are retried with exponential backoff,
+each attempt resuming from the .part files of the previous one.
+
+Videos already in the catalog are never fetched again: single videos are
+looked up by id before yt-dlp runs, and bulk imports (playlists, channels)
+pass yt-dlp a download archive listing the ids the catalog already has.
+"""
+import collections
+import glob
+import json
+import os
+import re
+import subprocess
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import catalog
+import file_lock
+
+DOWNLOAD_LOG_FILE = 'downloads.json'
+LOCK_FILE = '.downloads.lock'
+
+# Oldest entries are dropped beyond this many URLs
+MAX_LOG_ENTRIES = 200
+
+# Partial files untouched for this long are considered abandoned
+ORPHAN_MAX_AGE = 2 * 24 * 3600
+
+# yt-dlp --download-archive file, rewritten from the catalog before each run
+ARCHIVE_FILE = '.download_archive.txt'
+
+# Where yt-dlp saves downloads; catalog.import_download() reads the id tag back
+OUTPUT_TEMPLATE = '%(title)s [%(id)s].%(ext)s'
+
+# Leftovers of interrupted yt-dlp / ffmpeg runs
+PARTIAL_SUFFIXES = ('.part', '.ytdl', '.temp.mp3')
+
+DOWNLOAD_TIMEOUT = 300  # 5 minutes per attempt
+
+# Attempts per download, with exponential backoff between them (seconds)
+DOWNLOAD_ATTEMPTS = 4
+RETRY_BASE_DELAY = 2
+RETRY_MAX_DELAY = 60
+
+# Lines of yt-dlp output kept for error messages
+YTDLP_OUTPUT_TAIL = 20
+
+# yt-dlp errors that retrying won't fix
+PERMANENT_YTDLP_ERRORS = (
+    'Unsupported URL',
+    'Video unavailable',
+    'Private video',
+    'is not a valid URL',
+    'This video has been removed',
+    'Sign in to confirm your age',
+)
+
+# Serializes updates of the log across threads and processes
+_lock = file_lock.FileLock(LOCK_FILE)
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+def _load():
+    if not os.path.exists(DOWNLOAD_LOG_FILE):
+        return {}
+    try:
+        with open(DOWNLOAD_LOG_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Warning: could not read {DOWNLOAD_LOG_FILE}: {e}")
+        return {}
+
+
+def _save(log):
+    if len(log) > MAX_LOG_ENTRIES:
+        oldest_first = sorted(log, key=lambda url: log[url].get('updated', ''))
+        for url in oldest_first[:len(log) - MAX_LOG_ENTRIES]:
+            del log[url]
+    catalog.write_json_atomic(DOWNLOAD_LOG_FILE, log, indent=2, ensure_ascii=False)
+
+
+def start_attempt(url):
+    """Record that a new attempt for url has started; returns its number"""
+    with _lock:
+        log = _load()
+        entry = log.setdefault(url, {'attempts': []})
+        entry['attempts'].append({'started': _now()})
+        entry['status'] = 'in_progress'
+        entry['updated'] = _now()
+        _save(log)
+        return len(entry['attempts'])
+
+
+def finish_attempt(url, outcome, error=None, file=None):
+    """Record how the latest attempt for url ended.
+
+    outcome is 'completed', 'timeout' or 'error'. The URL's status becomes
+    'completed', or 'failed' until another attempt starts.
+    """
+    with _lock:
+        log = _load()
+        entry = log.setdefault(url, {'attempts': [{'started': _now()}]})
+        attempt = entry['attempts'][-1]
+        attempt['ended'] = _now()
+        attempt['outcome'] = outcome
+        if error:
+            attempt['error'] = error
+        entry['status'] = 'completed' if outcome == 'completed' else 'failed'
+        if file:
+            entry['file'] = file
+        entry['updated'] = _now()
+        _save(log)
+
+
+def record_files(url, files):
+    """Note the files a completed download of url was saved as"""
+    with _lock:
+        log = _load()
+        entry = log.setdefault(url, {'attempts': []})
+        entry.pop('file', None)
+        entry['files'] = files
+        entry['updated'] = _now()
+        _save(log)
+
+
+def is_retryable_failure(output_lines, timed_out):
+    """Whether a failed yt-dlp run is worth retrying (timeouts, network errors)"""
+    if timed_out:
+        return True
+    output = '\n'.join(output_lines)
+    return not any(marker in output for marker in PERMANENT_YTDLP_ERRORS)
+
+
+def run_ytdlp(cmd, env, on_line=None, timeout=DOWNLOAD_TIMEOUT):
+    """Run one yt-dlp attempt, reading its output as it arrives.
+
+    on_line, if given, is called with every output line. Returns
+    (returncode, output_tail, files, timed_out): files lists the
+    downloads yt-dlp reported (the extracted MP3 rather than the
+    original, when there is one), and only the tail of the output is
+    kept, however chatty yt-dlp is.
+    """
+    process = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        encoding='utf-8',
+        errors='replace',
+        env=env
+    )
+    timed_out = threading.Event()
+
+    def kill_on_timeout():
+        timed_out.set()
+        process.kill()
+
+    timer = threading.Timer(timeout, kill_on_timeout)
+    timer.start()
+
+    output_tail = collections.deque(maxlen=YTDLP_OUTPUT_TAIL)
+    files = []
+    downloaded = None  # last "[download] Destination:" not extracted yet
+    try:
+        for line in process.stdout:
+            line = line.rstrip()
+            output_tail.append(line)
+            if '[download] Destination:' in line:
+                if downloaded:
+                    files.append(downloaded)
+                downloaded = line.split('Destination:', 1)[1].strip()
+            elif '[ExtractAudio] Destination:' in line:
+                files.append(line.split('Destination:', 1)[1].strip())
+                downloaded = None
+            if on_line:
+                on_line(line)
+        returncode = process.wait()
+    finally:
+        timer.cancel()
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+    if downloaded:
+        files.append(downloaded)
+    return returncode, list(output_tail), files, timed_out.is_set()
+
+
+def run_ytdlp_with_retries(url, cmd, env, on_line=None, on_retry=None):
+    """Run yt-dlp for url until it succeeds or fails for good.
+
+    Timeouts and transient failures are retried up to DOWNLOAD_ATTEMPTS
+    times with exponential backoff; on_retry, if given, is called with
+    (next attempt number, delay in seconds) before each wait. Every
+    attempt is recorded in the log, interruptions included.
+
+    Returns (files, error): the files of the successful run (see
+    run_ytdlp) and None, or an empty list and the error message.
+    """
+    for attempt in range(1, DOWNLOAD_ATTEMPTS + 1):
+        start_attempt(url)
+        try:
+            returncode, output_tail, files, timed_out = run_ytdlp(cmd, env, on_line,
+                                                                  DOWNLOAD_TIMEOUT)
+        except KeyboardInterrupt:
+            finish_attempt(url, 'error', 'Cancelled by user')
+            raise
+        except BaseException as e:
+            finish_attempt(url, 'error', str(e) or type(e).__name__)
+            raise
+
+        if returncode == 0 and not timed_out:
+            finish_attempt(url, 'completed')
+            return files, None
+
+        if timed_out:
+            error = f'Download timeout ({DOWNLOAD_TIMEOUT // 60} minutes exceeded)'
+            finish_attempt(url, 'timeout', error)
+        else:
+            error = 'yt-dlp error: ' + '\n'.join(output_tail)[-200:]
+            finish_attempt(url, 'error', error)
+
+        if attempt == DOWNLOAD_ATTEMPTS or not is_retryable_failure(output_tail, timed_out):
+            return [], error
+
+        delay = min(RETRY_BASE_DELAY * 2 ** (attempt - 1), RETRY_MAX_DELAY)
+        print(f"Download attempt {attempt} failed, retrying in {delay}s: {url}")
+        if on_retry:
+            on_retry(attempt + 1, delay)
+        time.sleep(delay)
+
+
+def youtube_video_id(url):
+    """The video id of a YouTube video URL (watch, youtu.be, shorts, embed), or None"""
+    parsed = urlparse(url)
+    host = parsed.netloc.lower()
+    if host == 'youtu.be' or host.endswith('.youtu.be'):
+        candidate = parsed.path.lstrip('/').split('/')[0]
+    elif host == 'youtube.com' or host.endswith('.youtube.com'):
+        candidate = parse_qs(parsed.query).get('v', [''])[0]
+        path_match = re.match(r'/(?:shorts|embed|live|v)/([^/]+)', parsed.path)
+        if not candidate and path_match:
+            candidate = path_match.group(1)
+    else:
+        return None
+    return candidate if re.fullmatch(r'[A-Za-z0-9_-]{11}', candidate or '') else None
+
+
+def is_bulk_import(url):
+    """Whether url can stand for several videos (playlists, even with a
+    current video, channels and anything else that isn't a single video)"""
+    return not youtube_video_id(url) or 'list' in parse_qs(urlparse(url).query)
+
+
+def find_existing_download(url, audio_dir='audio'):
+    """The catalog track a video URL was already downloaded to, if its file is still there.
+
+    Bulk imports (see is_bulk_import) return None.
+    """
+    if is_bulk_import(url):
+        return None
+    video_id = youtube_video_id(url)
+    track = catalog.find_by_video_id(video_id)
+    if track and (Path(audio_dir) / track['file']).exists():
+        return track
+    return None
+
+
+def import_downloads(url, files, audio_dir='audio'):
+    """Catalog the MP3s one yt-dlp run of url produced; returns their new paths.
+
+    files are the downloads the run reported (see run_ytdlp); nothing
+    else in audio_dir is touched. A single video yt-dlp didn't name (its
+    MP3 was already there) is found by the id tag in its file name. Each
+    file loses its tag (the id goes to the catalog) and is noted in the
+    log.
+    """
+    paths = [Path(file) for file in files
+             if file.lower().endswith('.mp3') and os.path.exists(file)]
+    video_id = None if is_bulk_import(url) else youtube_video_id(url)
+    if not paths and video_id:
+        paths = sorted(Path(audio_dir).glob(f'*{glob.escape(f"[{video_id}]")}.mp3'))
+    imported = [catalog.import_download(path, video_id) for path in paths]
+    if imported:
+        record_files(url, [path.name for path in imported])
+    return imported
+
+
+def write_archive(audio_dir='audio', path=ARCHIVE_FILE):
+    """Write the yt-dlp download archive of the videos the catalog has files for.
+
+    Returns the path, for yt-dlp's --download-archive option.
+    """
+    lines = [f'youtube {video_id}\n' for video_id, name in sorted(catalog.list_video_ids().items())
+             if (Path(audio_dir) / name).exists()]
+    catalog.write_text_atomic(path, ''.join(lines))
+    return path
+
+
+def cleanup_orphans(audio_dir='audio', max_age=ORPHAN_MAX_AGE):
+    """Delete partial download files nobody has touched for max_age seconds.
+
+    Recent partials are kept so a retried download can resume from them.
+    Returns the list of removed file names.
+    """
+    audio_dir = Path(audio_dir)
+    if not audio_dir.exists():
+        return []
+    removed = []
+    cutoff = time.time() - max_age
+    for path in audio_dir.iterdir():
+        if not path.name.endswith(PARTIAL_SUFFIXES):
+            continue
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+                removed.append(path.name)
+        except OSError as e:
+            print(f"Could not remove {path.name}: {e}")
+    if removed:
+        print(f"Removed {len(removed)} abandoned partial download(s)")
+    return removed
@@ -2,17 +2,28 @@
 """
 Simple script to download YouTube videos as MP3.
 Usage: python3 download_mp3.py "YOUTUBE_URL"
+
+Videos already in the library are skipped, so a playlist URL can be run
+again to import just its new videos.
 """
 import sys
-import subprocess
 import os
 from pathlib import Path
 
+import download_log
+
 def download_mp3(url):
     """Download YouTube video and convert to MP3"""
     audio_dir = Path('audio')
     audio_dir.mkdir(exist_ok=True)
     
+    existing = download_log.find_existing_download(url, audio_dir)
+    if existing:
+        print(f"✅ Already downloaded: {existing['title']} (audio/{existing['file']})")
+        return
+    
+    download_log.cleanup_orphans(audio_dir)
+    
     # Get SSL certificate path
     try:
         import certifi
@@ -26,7 +37,13 @@ def download_mp3(url):
         '-x',  # Extract audio
         '--audio-format', 'mp3',
         '--audio-quality', '0',  # Best quality
-        '-o', str(audio_dir / '%(title)s.%(ext)s'),
+        '--continue',  # Resume partially downloaded files
+        '--retries', '10',
+        '--fragment-retries', '10',
+        '--newline',  # One line per progress update
+        # Bulk imports skip the videos the catalog already has
+        '--download-archive', download_log.write_archive(audio_dir),
+        '-o', str(audio_dir / download_log.OUTPUT_TEMPLATE),
         url
     ]
     
@@ -38,22 +55,30 @@ def download_mp3(url):
     print(f"Downloading: {url}")
     print("This may take a moment...")
     
-    # Run yt-dlp
+    # Run yt-dlp, retrying with backoff; each attempt resumes the .part file
     try:
-        result = subprocess.run(cmd, env=env, check=True)
+        files, error = download_log.run_ytdlp_with_retries(url, cmd, env, on_line=print)
+        if error:
+            print(f"\n❌ Error: {error}")
+            sys.exit(1)
         print("\n✅ Download complete!")
         
+        # Drop the "[video_id]" tags from this run's files, keeping the ids in the catalog
+        imported = download_log.import_downloads(url, files, audio_dir)
+        if not imported:
+            print("No new videos to import.")
+            return
+        for path in imported:
+            print(f"  {path.name}")
+        
         # Regenerate playlist
         print("Updating playlist...")
         import generate_playlist
         generate_playlist.generate_playlist()
         print("✅ Playlist updated!")
         
-    except subprocess.CalledProcessError as e:
-        print(f"\n❌ Error: Download failed")
-        sys.exit(1)
     except KeyboardInterrupt:
-        print("\n\nDownload cancelled by user")
+        print("\n\nDownload cancelled by user (run again to resume)")
         sys.exit(1)
 
 if __name__ == '__main__':
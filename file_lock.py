@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Exclusive locks that hold across the threads of one process and across
+processes working in the same folder (server.py --workers runs several).
+
+Each lock is a threading.Lock plus flock() on a lock file; where fcntl is
+missing (Windows) only the threading.Lock is taken.
+"""
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows: fall back to the in-process lock only
+    fcntl = None
+
+
+class FileLock:
+    """Context manager holding lock_path locked for its block"""
+
+    def __init__(self, lock_path):
+        self.lock_path = lock_path
+        self.thread_lock = threading.Lock()
+        self.lock_file = None
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        if fcntl is None:
+            return self
+        try:
+            self.lock_file = open(self.lock_path, 'w')
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        except BaseException:
+            if self.lock_file:
+                self.lock_file.close()
+                self.lock_file = None
+            self.thread_lock.release()
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.lock_file:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+            self.lock_file.close()
+            self.lock_file = None
+        self.thread_lock.release()
@@ -1,52 +1,51 @@
 #!/usr/bin/env python3
 """
 Fix playlist.json with actual GitHub Release asset URLs
+
+The release's asset list comes from the GitHub API through a local cache
+(see release_assets.py). Pass --api-url to use another API origin.
 """
-import json
-import subprocess
+import argparse
 import sys
+import urllib.error
+from urllib.parse import unquote
+
+import catalog
+import playlist_format
+import release_assets
 
 GITHUB_REPO = "josazar/MP3_CHARLIEOLGA"
 RELEASE_TAG = "audio-files-v1.0"
 
-def get_github_release_assets():
-    """Get actual asset names from GitHub Release"""
+def asset_key(name):
+    return catalog.release_asset_key(unquote(name))
+
+def load_release_playlist(base_url):
+    """Tracks of the current playlist.json if it already points at this release"""
     try:
-        result = subprocess.run(
-            ['gh', 'release', 'view', RELEASE_TAG, '--repo', GITHUB_REPO, '--json', 'assets'],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        
-        import json as j
-        data = j.loads(result.stdout)
-        assets = data.get('assets', [])
-        
-        # Create mapping: original name -> GitHub asset name
-        asset_map = {}
-        for asset in assets:
-            name = asset['name']
-            # Try to extract the number prefix
-            if '_' in name:
-                prefix = name.split('_')[0]
-                asset_map[prefix] = {
-                    'name': name,
-                    'url': asset['url']
-                }
-        
-        return assets
-        
-    except subprocess.CalledProcessError as e:
-        print(f"❌ Error fetching GitHub Release: {e}")
-        sys.exit(1)
+        data = playlist_format.load_playlist()
+    except (OSError, ValueError):
+        return None
+    if isinstance(data, list) or data.get('bases', {}).get('release') != base_url:
+        return None
+    tracks = data.get('tracks', [])
+    if any(track.get('base') != 'release' for track in tracks):
+        return None
+    return tracks
 
-def fix_playlist():
-    """Update playlist.json with correct URLs"""
-    
-    # Get GitHub assets
+def fix_playlist(ndjson=False, api_url=None):
+    """Update playlist.json with the release's actual asset names.
+
+    Only assets that were added, removed or renamed since playlist.json
+    was written change it; if there are none the file is left alone, but
+    precache.json is still rebuilt from the refreshed release index.
+    """
     print("🔍 Récupération des assets depuis GitHub Release...")
-    assets = get_github_release_assets()
+    try:
+        assets, previous_assets = release_assets.refresh_index(GITHUB_REPO, RELEASE_TAG, api_url)
+    except (urllib.error.URLError, ValueError, KeyError) as e:
+        print(f"❌ Error fetching GitHub Release: {e}")
+        sys.exit(1)
     
     if not assets:
         print("❌ No assets found in release")
@@ -54,49 +53,105 @@ def fix_playlist():
     
     print(f"✅ Trouvé {len(assets)} fichiers")
     
-    # Sort assets by name (they have number prefixes)
-    assets.sort(key=lambda x: x['name'])
-    
-    # Create playlist
-    playlist = []
-    base_url = f"https://github.com/{GITHUB_REPO}/releases/download/{RELEASE_TAG}"
-    
-    for asset in assets:
-        filename = asset['name']
-        
-        # Extract title (remove number prefix and .mp3)
-        title = filename
-        if '_' in filename:
-            title = '_'.join(filename.split('_')[1:])
-        title = title.replace('.mp3', '').replace('.', ' ')
-        
-        # Build URL with actual filename
-        file_url = f"{base_url}/{filename}"
-        
-        playlist.append({
-            "title": title,
-            "file": file_url
-        })
+    base_url = f"https://github.com/{GITHUB_REPO}/releases/download/{RELEASE_TAG}/"
+    assets_by_key = {asset_key(asset['name']): asset for asset in assets}
+    
+    # Assets whose id is unchanged but whose name isn't: renamed on GitHub
+    previous_names = {asset['id']: asset['name'] for asset in previous_assets or []}
+    renamed = {
+        asset_key(previous_names[asset['id']]): asset
+        for asset in assets
+        if asset['id'] in previous_names and previous_names[asset['id']] != asset['name']
+    }
+    
+    # Local tracks, to give assets their catalog title, id and order
+    tracks = catalog.list_tracks()
+    tracks_by_key = {catalog.release_asset_key(track['file']): track for track in tracks}
+    positions = {track['file']: i for i, track in enumerate(tracks)}
+    
+    playlist = load_release_playlist(base_url)
+    rebuilding = playlist is None
+    if rebuilding:
+        print("   playlist.json doesn't point at this release yet: rebuilding it")
+        playlist = []
+    
+    updated = []
+    listed = set()
+    removed_count = renamed_count = 0
+    for entry in playlist:
+        key = asset_key(entry['name'])
+        if key in assets_by_key:
+            updated.append(entry)
+            listed.add(key)
+        elif key in renamed:
+            asset = renamed[key]
+            print(f"   ↻ {entry['name']} -> {asset['name']}")
+            updated.append(dict(entry, name=asset['name']))
+            listed.add(asset_key(asset['name']))
+            renamed_count += 1
+        else:
+            print(f"   - {entry['name']}")
+            removed_count += 1
+    
+    def catalog_order(asset):
+        # New assets follow the catalog order, unknown ones go last by name
+        track = tracks_by_key.get(asset_key(asset['name']))
+        return (0, positions[track['file']]) if track else (1, asset['name'])
+    
+    added = sorted((asset for key, asset in assets_by_key.items() if key not in listed),
+                   key=catalog_order)
+    for asset in added:
+        track = tracks_by_key.get(asset_key(asset['name']))
+        entry = {}
+        if track:
+            entry['id'] = track['id']
+        # Extract title (remove legacy number prefix and .mp3)
+        entry['title'] = (track['title'] if track
+                          else catalog.title_from_filename(asset['name']).replace('.', ' '))
+        # Only the actual filename is stored; the base URL is declared once
+        entry['base'] = 'release'
+        entry['name'] = asset['name']
+        updated.append(entry)
+        if not rebuilding:
+            print(f"   + {asset['name']}")
+    
+    # Remember where each local track is published (for local-first proxying)
+    catalog.set_asset_urls({
+        tracks_by_key[key]['file']: asset['url']
+        for key, asset in assets_by_key.items() if key in tracks_by_key
+    })
+    
+    if not (added or removed_count or renamed_count):
+        # The release index was just refreshed: its digests still go to precache.json
+        playlist_format.write_precache_manifest(playlist_format.load_playlist())
+        print("\n✅ playlist.json est déjà à jour")
+        return updated
     
     # Write playlist.json
-    with open('playlist.json', 'w', encoding='utf-8') as f:
-        json.dump(playlist, f, ensure_ascii=False, indent=2)
+    playlist_format.write_playlist(updated, {"release": base_url}, ndjson=ndjson)
     
-    print(f"\n✅ playlist.json mis à jour avec {len(playlist)} pistes")
+    print(f"\n✅ playlist.json mis à jour avec {len(updated)} pistes "
+          f"({len(added)} ajoutée(s), {removed_count} supprimée(s), {renamed_count} renommée(s))")
     print(f"\n📝 Exemple d'URL:")
-    print(f"   {playlist[0]['file']}")
+    print(f"   {base_url}{updated[0]['name']}")
     
-    return playlist
+    return updated
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Fix playlist.json with GitHub Release asset URLs.')
+    parser.add_argument('--ndjson', action='store_true', help='also write playlist.ndjson')
+    parser.add_argument('--api-url', help=f'GitHub API base URL (default: $GITHUB_API_URL or '
+                                          f'{release_assets.DEFAULT_API_URL})')
+    args = parser.parse_args()
+    
     print("🎵 Correction des URLs du playlist.json")
     print("=" * 70)
     
-    playlist = fix_playlist()
+    playlist = fix_playlist(ndjson=args.ndjson, api_url=args.api_url)
     
     print("\n✅ TERMINÉ!")
     print("\nMaintenant, commit et push:")
-    print("  git add playlist.json")
+    print("  git add playlist.json precache.json")
     print("  git commit -m 'Fix playlist URLs with actual GitHub Release asset names'")
     print("  git push")
 
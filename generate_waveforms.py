@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Script to precompute waveform peaks for every track in the catalog, so the
+player can draw a waveform on the seek bar without downloading the audio.
+
+Each track is decoded once with ffmpeg and reduced to min/max peaks at a
+few zoom levels, stored in waveforms/<track id>.peaks. Track ids are
+content hashes, so a track whose file already exists is unchanged and
+skipped. Requires numpy and ffmpeg.
+
+File layout (little endian):
+    b'WPK1', uint32 sample rate, uint16 number of levels,
+    then per level: uint32 samples per peak, uint32 peak count,
+    then per level: count pairs of int8 (min, max).
+"""
+import os
+import struct
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import catalog
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+WAVEFORM_DIR = Path('waveforms')
+WAVEFORM_MAGIC = b'WPK1'
+
+# Audio is decoded to mono at this rate; plenty for drawing peaks
+SAMPLE_RATE = 11025
+
+# Samples per peak for each zoom level, finest first. Each level must be a
+# multiple of the previous one (coarser levels are built from finer ones).
+LEVELS = (1024, 4096, 16384)
+
+
+def waveform_path(track_id):
+    return WAVEFORM_DIR / f'{track_id}.peaks'
+
+
+def decode_audio(audio_path):
+    """Decode a track to mono signed 16-bit samples with ffmpeg"""
+    result = subprocess.run(
+        ['ffmpeg', '-v', 'error', '-i', str(audio_path),
+         '-ac', '1', '-ar', str(SAMPLE_RATE), '-f', 's16le', '-'],
+        capture_output=True,
+        check=True
+    )
+    return np.frombuffer(result.stdout, dtype='<i2')
+
+
+def compute_peaks(samples):
+    """Return [(samples_per_peak, mins, maxs)] for every level, as int8 arrays"""
+    levels = []
+    finest = LEVELS[0]
+    count = -(-len(samples) // finest)  # ceil
+    padded = np.zeros(count * finest, dtype=np.int16)
+    padded[:len(samples)] = samples
+    blocks = padded.reshape(count, finest)
+    mins = blocks.min(axis=1)
+    maxs = blocks.max(axis=1)
+    levels.append((finest, mins, maxs))
+
+    for samples_per_peak in LEVELS[1:]:
+        factor = samples_per_peak // finest
+        count = -(-len(mins) // factor)
+        pad = count * factor - len(mins)
+        level_mins = np.pad(mins, (0, pad), constant_values=0).reshape(count, factor).min(axis=1)
+        level_maxs = np.pad(maxs, (0, pad), constant_values=0).reshape(count, factor).max(axis=1)
+        levels.append((samples_per_peak, level_mins, level_maxs))
+
+    # 16-bit -> 8-bit keeps the files tiny and is plenty for drawing
+    return [(n, (lo >> 8).astype(np.int8), (hi >> 8).astype(np.int8)) for n, lo, hi in levels]
+
+
+def encode_peaks(levels):
+    """Serialize peak levels into the .peaks binary format"""
+    parts = [WAVEFORM_MAGIC, struct.pack('<IH', SAMPLE_RATE, len(levels))]
+    for samples_per_peak, mins, _ in levels:
+        parts.append(struct.pack('<II', samples_per_peak, len(mins)))
+    for _, mins, maxs in levels:
+        interleaved = np.empty(len(mins) * 2, dtype=np.int8)
+        interleaved[0::2] = mins
+        interleaved[1::2] = maxs
+        parts.append(interleaved.tobytes())
+    return b''.join(parts)
+
+
+def build_waveform(audio_path, track_id):
+    """Decode one track and write its peaks file (runs in a worker process)"""
+    samples = decode_audio(audio_path)
+    data = encode_peaks(compute_peaks(samples))
+    out_path = waveform_path(track_id)
+    tmp_path = out_path.with_name(f'.{out_path.name}.tmp')
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, out_path)
+    return len(data)
+
+
+def generate_waveforms(workers=None):
+    if np is None:
+        print("ERROR: numpy is not installed!")
+        print("Please install it with: pip3 install numpy")
+        sys.exit(1)
+
+    audio_dir = Path('audio')
+    if not audio_dir.exists():
+        print("Audio directory not found.")
+        return
+
+    WAVEFORM_DIR.mkdir(exist_ok=True)
+    tracks = catalog.sync_catalog(audio_dir)
+
+    # Peaks of tracks that are gone (or whose content changed) are stale
+    wanted = {waveform_path(track['id']).name for track in tracks}
+    for peaks_file in WAVEFORM_DIR.glob('*.peaks'):
+        if peaks_file.name not in wanted:
+            peaks_file.unlink()
+            print(f"Removed stale {peaks_file.name}")
+
+    todo = [track for track in tracks if not waveform_path(track['id']).exists()]
+    print(f"{len(tracks) - len(todo)} waveform(s) up to date, {len(todo)} to build")
+    if not todo:
+        return
+
+    failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(build_waveform, audio_dir / track['file'], track['id']): track
+            for track in todo
+        }
+        for future in as_completed(futures):
+            track = futures[future]
+            try:
+                size = future.result()
+                print(f"  ✓ {track['title']} ({size / 1024:.1f} KB)")
+            except Exception as e:
+                failed += 1
+                print(f"  ✗ {track['title']}: {e}")
+
+    print(f"\nBuilt {len(todo) - failed} waveform(s)" + (f", {failed} failed" if failed else ""))
+
+
+if __name__ == '__main__':
+    generate_waveforms()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Minimal MPEG audio frame parser.
+
+Walks the frame sync headers of an MP3 stream (skipping ID3v2 tags and
+junk between frames) so callers can pace playback by frame duration or
+check that a file is made of whole, valid frames.
+"""
+from collections import namedtuple
+
+# Bitrates in kbps, indexed by [version is MPEG-1][layer][bitrate index]
+_BITRATES = {
+    (True, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+
+# Sample rates indexed by version bits (0 = MPEG-2.5, 2 = MPEG-2, 3 = MPEG-1)
+_SAMPLE_RATES = {
+    0: (11025, 12000, 8000),
+    2: (22050, 24000, 16000),
+    3: (44100, 48000, 32000),
+}
+
+FrameHeader = namedtuple('FrameHeader', 'version layer bitrate sample_rate padding length samples')
+
+
+def parse_frame_header(header):
+    """Decode a 4-byte frame header, or return None if it isn't a valid one"""
+    if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return None
+    version_bits = (header[1] >> 3) & 0x03
+    layer_bits = (header[1] >> 1) & 0x03
+    bitrate_index = header[2] >> 4
+    sample_rate_index = (header[2] >> 2) & 0x03
+    padding = (header[2] >> 1) & 0x01
+    if version_bits == 1 or layer_bits == 0 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        # Reserved values, or free-format bitrate we can't size
+        return None
+
+    layer = 4 - layer_bits
+    mpeg1 = version_bits == 3
+    bitrate = _BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version_bits][sample_rate_index]
+
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate // sample_rate + padding) * 4
+    elif layer == 2 or mpeg1:
+        samples = 1152
+        length = 144 * bitrate // sample_rate + padding
+    else:
+        samples = 576
+        length = 72 * bitrate // sample_rate + padding
+
+    version = {0: 2.5, 2: 2, 3: 1}[version_bits]
+    return FrameHeader(version, layer, bitrate, sample_rate, padding, length, samples)
+
+
+def id3v2_size(data):
+    """Total size of an ID3v2 tag at the start of data (0 if there is none)"""
+    if len(data) < 10 or data[:3] != b'ID3':
+        return 0
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    has_footer = data[5] & 0x10
+    return 10 + size + (10 if has_footer else 0)
+
+
+def is_info_frame(frame):
+    """Whether a frame is a Xing/Info/VBRI header rather than audio"""
+    return any(tag in frame[:64] for tag in (b'Xing', b'Info', b'VBRI'))
+
+
+def find_frame_start(data, start=0):
+    """Offset of the first frame boundary in data at or after start, or None.
+
+    A sync only counts if another valid header follows the frame (when
+    data is long enough to tell), so stray 0xFF bytes inside audio are
+    not mistaken for one.
+    """
+    pos = data.find(b'\xff', start)
+    while pos != -1:
+        header = parse_frame_header(data[pos:pos + 4])
+        if header is not None:
+            following = pos + header.length
+            if following + 4 > len(data) or parse_frame_header(data[following:following + 4]):
+                return pos
+        pos = data.find(b'\xff', pos + 1)
+    return None
+
+
+def iter_frames(stream, chunk_size=64 * 1024):
+    """Yield (offset, header, frame_bytes) for every frame in a binary stream.
+
+    Leading ID3v2 tags are skipped, and bytes that don't start a valid
+    frame (trailing ID3v1 tags, garbage) are skipped until the next sync.
+    The last frame is only yielded if it is complete.
+    """
+    buf = bytearray()
+    base = 0  # stream offset of buf[0]
+    pos = 0
+    eof = False
+
+    def fill(needed):
+        nonlocal eof
+        while len(buf) - pos < needed and not eof:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                eof = True
+            else:
+                buf.extend(chunk)
+        return len(buf) - pos >= needed
+
+    if fill(10):
+        tag_size = id3v2_size(bytes(buf[:10]))
+        if tag_size:
+            fill(tag_size)
+            pos = min(tag_size, len(buf))
+
+    while fill(4):
+        # Drop consumed bytes now and then so buf stays small
+        if pos > chunk_size:
+            del buf[:pos]
+            base += pos
+            pos = 0
+        header = parse_frame_header(buf[pos:pos + 4])
+        if header is None:
+            # Skip to the next possible sync byte
+            next_sync = buf.find(b'\xff', pos + 1)
+            pos = next_sync if next_sync != -1 else len(buf)
+            continue
+        if not fill(header.length):
+            return
+        yield base + pos, header, bytes(buf[pos:pos + header.length])
+        pos += header.length
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Reading and writing playlist.json.
+
+Version 2 declares each base URL once and stores only the asset name per
+track:
+
+    {
+      "version": 2,
+      "bases": {"release": "https://github.com/.../releases/download/TAG/"},
+      "tracks": [{"id": "...", "title": "...", "base": "release", "name": "x.mp3"}]
+    }
+
+The optional newline-delimited variant (playlist.ndjson) puts the header
+(version and bases) on the first line and one track per line after it,
+so it can be parsed as it downloads.
+
+The legacy format is a plain list of {"title", "file"} objects with full
+URLs; expand_tracks() turns either version into that shape.
+
+Every write that changes the playlist is logged in the catalog as a
+series of changes, each with its own increasing revision, and the file
+records the revision it is at ("revision"). A client holding revision N
+catches up by applying the changes after N in order:
+
+    {"type": "add", "id": key, "index": 3, "track": {...}}     insert at index
+    {"type": "update", "id": key, "index": 0, "track": {...}}  replace, move to index
+    {"type": "remove", "id": key}
+
+where key is the track's id (its file URL for tracks without one) and
+track has the legacy shape.
+
+Every write also refreshes precache.json, the manifest the player's
+service worker checks its offline copies against:
+
+    {"version": "...", "tracks": [{"url": "...", "hash": "...", "size": 123}]}
+
+The hash is the track id (a hash of the file's content), so a cached copy
+is still good exactly as long as its hash is unchanged. Release assets
+without an id use the sha256 digest GitHub publishes for them; tracks
+with neither are not cached offline.
+"""
+import hashlib
+import json
+import sqlite3
+from urllib.parse import unquote
+
+import catalog
+import release_assets
+
+PLAYLIST_FILE = 'playlist.json'
+PLAYLIST_NDJSON_FILE = 'playlist.ndjson'
+PLAYLIST_VERSION = 2
+PRECACHE_FILE = 'precache.json'
+
+# Media type clients send in Accept to get the compact format as-is
+PLAYLIST_V2_MEDIA_TYPE = 'application/vnd.playlist.v2+json'
+
+
+def build_playlist(tracks, bases):
+    """Build a version 2 playlist.
+
+    tracks are dicts with "title", "base" (a key of bases) and "name",
+    and optionally "id".
+    """
+    return {
+        'version': PLAYLIST_VERSION,
+        'bases': bases,
+        'tracks': [
+            {key: track[key] for key in ('id', 'title', 'base', 'name') if key in track}
+            for track in tracks
+        ],
+    }
+
+
+def expand_track(track, bases):
+    """Turn a compact track into the legacy {"title", "file"} shape"""
+    expanded = {}
+    if 'id' in track:
+        expanded['id'] = track['id']
+    expanded['title'] = track['title']
+    expanded['file'] = bases.get(track.get('base'), '') + track['name']
+    return expanded
+
+
+def expand_tracks(data):
+    """Return the legacy list of tracks for a playlist of any version"""
+    if isinstance(data, list):
+        return data
+    bases = data.get('bases', {})
+    return [expand_track(track, bases) for track in data.get('tracks', [])]
+
+
+def iter_ndjson_tracks(lines):
+    """Yield legacy-shaped tracks from playlist.ndjson lines as they arrive.
+
+    The reference reader for other clients; the bundled player reads
+    playlist.json.
+    """
+    bases = None
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if not line:
+            continue
+        record = json.loads(line)
+        if bases is None:
+            bases = record.get('bases', {})
+            continue
+        yield expand_track(record, bases)
+
+
+def track_key(track):
+    """Identity of a legacy-shaped track across playlist changes"""
+    return track.get('id') or track.get('file') or track.get('src')
+
+
+def diff_tracks(old_tracks, new_tracks):
+    """Changes (see above) turning the legacy track list old_tracks into new_tracks"""
+    old_by_key = {track_key(track): track for track in old_tracks}
+    new_keys = {track_key(track) for track in new_tracks}
+    changes = []
+    # What the client's list looks like as the changes are applied
+    current = []
+    for track in old_tracks:
+        key = track_key(track)
+        if key in new_keys:
+            current.append(key)
+        else:
+            changes.append({'type': 'remove', 'id': key})
+    for index, track in enumerate(new_tracks):
+        key = track_key(track)
+        if key not in old_by_key:
+            current.insert(index, key)
+            changes.append({'type': 'add', 'id': key, 'index': index, 'track': track})
+        elif current[index] != key or old_by_key[key] != track:
+            current.remove(key)
+            current.insert(index, key)
+            changes.append({'type': 'update', 'id': key, 'index': index, 'track': track})
+    return changes
+
+
+def catalog_sizes():
+    """{track id: size in bytes} from the catalog (empty if it can't be read)"""
+    try:
+        return {track['id']: track['size'] for track in catalog.list_tracks()}
+    except sqlite3.Error:
+        return {}
+
+
+def _digest_hash(asset):
+    """Content hash of a release asset from its published sha256 digest, or None"""
+    algorithm, _, digest = (asset.get('digest') or '').partition(':')
+    if algorithm != 'sha256' or not digest:
+        return None
+    return digest[:catalog.TRACK_ID_LENGTH]
+
+
+def build_precache_manifest(playlist, sizes=None, assets=None):
+    """Build the service worker manifest for a playlist of any version.
+
+    The hash of a track is its catalog id, which is derived from its
+    content, or else the sha256 digest GitHub published for its release
+    asset (see release_assets.py). Tracks with neither are left out, since
+    nothing would tell a client that a cached copy went stale. The version changes whenever
+    any track's URL, hash or size does, so clients can skip comparing
+    entries when it hasn't moved.
+    """
+    if sizes is None:
+        sizes = catalog_sizes()
+    if assets is None:
+        assets = release_assets.published_assets()
+    entries = []
+    for track in expand_tracks(playlist):
+        url = track.get('file') or track.get('src')
+        if not url:
+            continue
+        if track.get('id'):
+            entry = {'url': url, 'hash': track['id']}
+            if track['id'] in sizes:
+                entry['size'] = sizes[track['id']]
+        else:
+            asset = assets.get(unquote(url)) or {}
+            content_hash = _digest_hash(asset)
+            if not content_hash:
+                continue
+            entry = {'url': url, 'hash': content_hash, 'size': asset['size']}
+        entries.append(entry)
+    digest = hashlib.sha1(json.dumps(entries, sort_keys=True).encode('utf-8'))
+    return {'version': digest.hexdigest()[:catalog.TRACK_ID_LENGTH], 'tracks': entries}
+
+
+def write_playlist(tracks, bases, path=PLAYLIST_FILE, ndjson=False):
+    """Write a version 2 playlist (and optionally its ndjson twin) atomically.
+
+    precache.json is regenerated alongside it.
+    """
+    playlist = build_playlist(tracks, bases)
+    # One write transaction: concurrent writers log and write in turn
+    with catalog.open_catalog() as db:
+        try:
+            previous = load_tracks(path)
+        except (OSError, ValueError):
+            previous = []
+        changes = diff_tracks(previous, expand_tracks(playlist))
+        playlist['revision'] = catalog.append_playlist_changes(db, changes)
+        catalog.write_json_atomic(path, playlist, separators=(',', ':'), ensure_ascii=False)
+        if ndjson:
+            compact = {'separators': (',', ':'), 'ensure_ascii': False}
+            header = {'version': PLAYLIST_VERSION, 'revision': playlist['revision'], 'bases': bases}
+            lines = [json.dumps(header, **compact)]
+            lines += [json.dumps(track, **compact) for track in playlist['tracks']]
+            catalog.write_text_atomic(PLAYLIST_NDJSON_FILE, '\n'.join(lines) + '\n')
+    write_precache_manifest(playlist)
+    return playlist
+
+
+def write_precache_manifest(playlist):
+    """Write precache.json for a playlist (see build_precache_manifest).
+
+    write_playlist() calls this; call it directly when the playlist is
+    unchanged but the release index (and so the asset digests) may not be.
+    """
+    catalog.write_json_atomic(PRECACHE_FILE, build_precache_manifest(playlist),
+                              separators=(',', ':'), ensure_ascii=False)
+
+
+def load_playlist(path=PLAYLIST_FILE):
+    """Read a playlist file as stored (legacy list or version 2 object)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_tracks(path=PLAYLIST_FILE):
+    """Read a playlist file of any version as a legacy list of tracks"""
+    return expand_tracks(load_playlist(path))
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Cached index of the assets of a GitHub release.
+
+Assets are listed through the GitHub REST API, 100 per page, and every
+page is stored in .release_assets.json with its ETag. Later runs send
+If-None-Match, so an unchanged page costs a 304 (which GitHub doesn't
+count against the rate limit) and is read from the cache instead.
+
+The API base URL defaults to https://api.github.com and can be changed
+with the GITHUB_API_URL environment variable (or the api_url argument),
+e.g. to point at a local stand-in. GITHUB_TOKEN is sent when set.
+"""
+import json
+import os
+import re
+import urllib.error
+import urllib.request
+from urllib.parse import unquote
+
+import catalog
+import certificates
+
+INDEX_FILE = '.release_assets.json'
+DEFAULT_API_URL = 'https://api.github.com'
+ASSETS_PER_PAGE = 100
+
+
+def api_base_url(api_url=None):
+    return (api_url or os.environ.get('GITHUB_API_URL') or DEFAULT_API_URL).rstrip('/')
+
+
+def load_index(index_path=INDEX_FILE):
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def published_assets(index_path=INDEX_FILE):
+    """{download URL (unquoted): asset record} of the last indexed release"""
+    return {unquote(asset['url']): asset for asset in load_index(index_path).get('assets') or []}
+
+
+def _next_page(link_header):
+    """URL of the rel="next" page in a Link header, if any"""
+    match = re.search(r'<([^>]+)>;\s*rel="next"', link_header or '')
+    return match.group(1) if match else None
+
+
+def _get(url, cached=None):
+    """GET a JSON API page; returns (etag, data, next page URL).
+
+    cached is the page stored by a previous run ({etag, data, next}); when
+    the server answers 304 it is returned as-is.
+    """
+    request = urllib.request.Request(url, headers={
+        'Accept': 'application/vnd.github+json',
+        'User-Agent': 'MP3_CHARLIEOLGA-release-index',
+    })
+    token = os.environ.get('GITHUB_TOKEN')
+    if token:
+        request.add_header('Authorization', f'Bearer {token}')
+    if cached and cached.get('etag'):
+        request.add_header('If-None-Match', cached['etag'])
+    try:
+        with urllib.request.urlopen(request, timeout=30,
+                                    context=certificates.ssl_context()) as response:
+            data = json.load(response)
+            return response.headers.get('ETag'), data, _next_page(response.headers.get('Link'))
+    except urllib.error.HTTPError as e:
+        if e.code == 304 and cached:
+            return cached['etag'], cached['data'], cached.get('next')
+        raise
+
+
+def _asset_record(asset):
+    return {
+        'id': asset['id'],
+        'name': asset['name'],
+        'size': asset['size'],
+        'url': asset['browser_download_url'],
+        'updated_at': asset.get('updated_at'),
+        # "sha256:<hex>" on assets GitHub has hashed, else None
+        'digest': asset.get('digest'),
+    }
+
+
+def refresh_index(repo, tag, api_url=None, index_path=INDEX_FILE):
+    """Fetch the asset list of a release, reusing cached pages where possible.
+
+    Returns (assets, previous_assets): the current assets, and those of
+    the last run (None on the first one) so callers can tell renames by
+    their unchanged asset id.
+    """
+    base = api_base_url(api_url)
+    index = load_index(index_path)
+    if index.get('api_url') != base or index.get('repo') != repo or index.get('tag') != tag:
+        index = {}
+    pages = index.get('pages', {})
+
+    url = f'{base}/repos/{repo}/releases/tags/{tag}'
+    etag, release, _ = _get(url, pages.get(url))
+    new_pages = {url: {'etag': etag, 'data': release}}
+
+    assets = []
+    fetched = cached = 0
+    url = f'{base}/repos/{repo}/releases/{release["id"]}/assets?per_page={ASSETS_PER_PAGE}'
+    while url:
+        etag, data, next_url = _get(url, pages.get(url))
+        if pages.get(url) and etag == pages[url]['etag']:
+            cached += 1
+        else:
+            fetched += 1
+        new_pages[url] = {'etag': etag, 'data': data, 'next': next_url}
+        assets.extend(_asset_record(asset) for asset in data)
+        url = next_url
+    print(f"   {fetched} page(s) downloaded, {cached} unchanged")
+
+    catalog.write_json_atomic(index_path, {
+        'api_url': base,
+        'repo': repo,
+        'tag': tag,
+        'pages': new_pages,
+        'assets': assets,
+    }, ensure_ascii=False)
+    return assets, index.get('assets')
@@ -1,10 +1,13 @@
 #!/usr/bin/env python3
 """
-Script to rename all MP3 files in the audio folder with numbered prefixes.
+Script to drop the legacy numbered prefixes ("07_Title.mp3") from the MP3
+files in the audio folder. Playlist order is kept in the catalog, so this
+is a one-time migration: afterwards files keep their names for good.
 """
-import os
 from pathlib import Path
 
+import catalog
+
 def rename_audio_files():
     audio_dir = Path('audio')
     
@@ -12,43 +15,31 @@ def rename_audio_files():
         print("Audio directory not found.")
         return
     
-    # Get all MP3 files
-    mp3_files = sorted(audio_dir.glob('*.mp3'))
+    # Record the current order (taken from the prefixes) before renaming
+    tracks = catalog.sync_catalog(audio_dir)
     
-    if not mp3_files:
+    if not tracks:
         print("No MP3 files found in audio/ directory")
         return
     
-    print(f"Found {len(mp3_files)} MP3 files to rename:")
+    prefixed = [t for t in tracks if catalog.LEGACY_PREFIX.match(Path(t['file']).stem)]
+    print(f"Found {len(prefixed)} MP3 file(s) with a numbered prefix:")
     print()
     
-    # Rename files with numbered prefixes
     renamed_count = 0
-    for index, mp3_file in enumerate(mp3_files):
-        # Create new filename with zero-padded number prefix
-        prefix = f"{index:02d}_"
-        old_name = mp3_file.name
-        
-        # Check if already has a numbered prefix
-        if old_name.startswith(f"{index:02d}_"):
-            print(f"  {index:02d}. {old_name} (already has correct prefix, skipping)")
-            continue
-        
-        # Create new filename
-        new_name = prefix + old_name
-        new_path = audio_dir / new_name
-        
-        # Check if target file already exists
-        if new_path.exists() and new_path != mp3_file:
-            print(f"  {index:02d}. {old_name} -> {new_name} (target exists, skipping)")
-            continue
+    for track in prefixed:
+        old_name = track['file']
+        old_path = audio_dir / old_name
+        new_path = catalog.unique_track_path(audio_dir, catalog.title_from_filename(old_name))
         
         try:
-            mp3_file.rename(new_path)
-            print(f"  {index:02d}. {old_name} -> {new_name} ✓")
+            old_path.rename(new_path)
+            # Same row under the new name: id and order are unchanged
+            catalog.rename_track(old_name, new_path.name)
+            print(f"  {old_name} -> {new_path.name} ✓")
             renamed_count += 1
         except Exception as e:
-            print(f"  {index:02d}. {old_name} -> ERROR: {e}")
+            print(f"  {old_name} -> ERROR: {e}")
     
     print()
     print(f"Renamed {renamed_count} file(s).")
@@ -64,4 +55,3 @@ def rename_audio_files():
 
 if __name__ == '__main__':
     rename_audio_files()
-
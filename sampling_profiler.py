@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Low-overhead sampling profiler for the request handlers of server.py.
+
+A background thread wakes up every `interval` seconds and records the
+Python stack of each thread that is currently handling a request. A
+request's samples are only kept if it took at least `threshold` seconds
+(0 keeps them all), and are aggregated across requests.
+
+The result can be exported as collapsed stacks (one "a;b;c count" line
+per stack, the input of flamegraph.pl / speedscope) or as a pstats file
+(python3 -m pstats, snakeviz), where times are estimated from samples.
+"""
+import collections
+import marshal
+import os
+import sys
+import threading
+import time
+
+
+class SamplingProfiler:
+    def __init__(self, interval=0.01, threshold=0.0):
+        self.interval = interval
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        self.active = {}  # thread id -> Counter of stacks for the current request
+        self.stacks = collections.Counter()
+        self.requests = 0
+        self.slow_requests = 0
+
+    def start(self):
+        thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        thread.start()
+
+    def begin_request(self):
+        with self.lock:
+            self.active[threading.get_ident()] = (time.monotonic(), collections.Counter())
+
+    def end_request(self):
+        with self.lock:
+            started, samples = self.active.pop(threading.get_ident(), (None, None))
+            if started is None:
+                return
+            self.requests += 1
+            if time.monotonic() - started >= self.threshold:
+                self.slow_requests += 1
+                self.stacks.update(samples)
+
+    def reset(self):
+        with self.lock:
+            self.stacks.clear()
+            self.requests = self.slow_requests = 0
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                if self.active:
+                    frames = sys._current_frames()
+                    for thread_id, (_, samples) in self.active.items():
+                        frame = frames.get(thread_id)
+                        if frame is not None:
+                            samples[self._stack(frame)] += 1
+                    # Don't keep every thread's frames alive until the next sample
+                    del frames, frame
+
+    @staticmethod
+    def _stack(frame):
+        """The frame's call stack, outermost first, as pstats function keys"""
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+            frame = frame.f_back
+        stack.reverse()
+        return tuple(stack)
+
+    def _snapshot(self):
+        with self.lock:
+            return dict(self.stacks)
+
+    def collapsed(self):
+        """Aggregated stacks in collapsed ("folded") format"""
+        lines = []
+        for stack, count in sorted(self._snapshot().items(), key=lambda item: -item[1]):
+            frames = ';'.join(f'{name} ({os.path.basename(filename)}:{line})'
+                              for filename, line, name in stack)
+            lines.append(f'{frames} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def pstats_data(self):
+        """Aggregated samples in the marshal format of pstats.Stats.dump_stats()"""
+        stats = {}
+        edges = {}
+        for stack, count in self._snapshot().items():
+            seconds = count * self.interval
+            # Inclusive time counts once per stack, even for recursive functions
+            for func in set(stack):
+                entry = stats.setdefault(func, [0, 0, 0.0, 0.0])
+                entry[0] += count
+                entry[1] += count
+                entry[3] += seconds
+            stats[stack[-1]][2] += seconds
+            for caller, callee in set(zip(stack, stack[1:])):
+                edge = edges.setdefault((callee, caller), [0, 0, 0.0, 0.0])
+                edge[0] += count
+                edge[1] += count
+                edge[3] += seconds
+            edge_key = (stack[-1], stack[-2]) if len(stack) > 1 else None
+            if edge_key:
+                edges[edge_key][2] += seconds
+
+        callers = collections.defaultdict(dict)
+        for (callee, caller), edge in edges.items():
+            callers[callee][caller] = tuple(edge)
+        return marshal.dumps({
+            func: (cc, nc, tt, ct, callers.get(func, {}))
+            for func, (cc, nc, tt, ct) in stats.items()
+        })
+
+    def summary(self):
+        with self.lock:
+            return (f'{self.slow_requests} of {self.requests} request(s) profiled, '
+                    f'{sum(self.stacks.values())} sample(s)')
+
+    def dump(self, directory='profiles'):
+        """Write profile-<time>-<pid>.collapsed and .pstats; returns their paths"""
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, time.strftime('profile-%Y%m%d-%H%M%S') + f'-{os.getpid()}')
+        with open(base + '.collapsed', 'w', encoding='utf-8') as f:
+            f.write(self.collapsed())
+        with open(base + '.pstats', 'wb') as f:
+            f.write(self.pstats_data())
+        return base + '.collapsed', base + '.pstats'
@@ -4,32 +4,1014 @@ Simple HTTP server to run the audio player.
 This avoids CORS issues when loading JSON and audio files.
 Handles POST requests for downloading YouTube videos.
 """
+import time
+
+# Taken before the other imports, for the startup report
+MODULE_STARTED = time.perf_counter()
+
+import argparse
 import http.server
 import socketserver
-import webbrowser
 import os
 import json
 import subprocess
 import sys
 import mimetypes
 import re
-import ssl
+import threading
+import queue
+import signal
+import socket
+import traceback
+import collections
+import hashlib
+import urllib.request
+import urllib.error
+from functools import lru_cache
 from pathlib import Path
-from urllib.parse import urlparse, unquote
+from urllib.parse import parse_qs, urlparse, unquote
+
+import catalog
+import certificates
+import download_log
+import generate_playlist
+import mp3_frames
+import playlist_format
+import release_assets
+import sampling_profiler
+from audio_watcher import AudioWatcher
 
 PORT = 8000
 
-# Try to use certifi for SSL certificates, fallback to unverified context if not available
-try:
-    import certifi
-    ssl_context = ssl.create_default_context(cafile=certifi.where())
-except ImportError:
-    # If certifi is not available, create an unverified context (less secure but works)
-    ssl_context = ssl.create_default_context()
-    ssl_context.check_hostname = False
-    ssl_context.verify_mode = ssl.CERT_NONE
+# Persistent connections: an idle connection is closed after
+# KEEPALIVE_TIMEOUT seconds, and any connection after serving
+# MAX_KEEPALIVE_REQUESTS requests
+KEEPALIVE_TIMEOUT = 15
+MAX_KEEPALIVE_REQUESTS = 100
+
+# A client that stops reading a response for this long is dropped
+REQUEST_TIMEOUT = 300
+
+# Bandwidth caps for audio bodies in bytes per second (None = unlimited):
+# for the whole server, per client, and per client on each route. Set the
+# first two from the command line with --max-rate / --client-rate.
+GLOBAL_RATE_LIMIT = None
+CLIENT_RATE_LIMIT = None
+ROUTE_RATE_LIMITS = {'proxy': None, 'audio': None}
+
+# The first bytes of a range request are what the player needs right now,
+# so they go out ahead of bulk transfers (full files, read-ahead)
+PLAYBACK_PRIORITY_BYTES = 1024 * 1024
+
+# Bodies are throttled in pieces of this size
+THROTTLE_CHUNK = 64 * 1024
+
+# The proxy fetches and caches release assets in aligned blocks of this
+# size, whatever range the client asked for, keeping up to
+# PROXY_CACHE_SIZE bytes of them in memory
+PROXY_BLOCK_SIZE = 1024 * 1024
+PROXY_CACHE_SIZE = 64 * 1024 * 1024
+
+# Pre-fork mode (--workers N): a stopping worker lets in-flight requests
+# finish for up to SHUTDOWN_GRACE seconds, and a worker that dies within
+# WORKER_MIN_UPTIME seconds of starting is restarted after a short delay
+SHUTDOWN_GRACE = 10
+WORKER_MIN_UPTIME = 5
+WORKER_RESTART_DELAY = 2
+
+# Set by --profile: samples the stacks of requests being handled
+profiler = None
+
+# Pid of the supervisor, in pre-forked worker processes
+supervisor_pid = None
+
+@lru_cache(maxsize=None)
+def _probe_ytdlp():
+    try:
+        result = subprocess.run([sys.executable, '-m', 'yt_dlp', '--version'],
+                                capture_output=True, check=True, text=True)
+    except (subprocess.CalledProcessError, OSError):
+        return None
+    return result.stdout.strip() or 'unknown'
+
+
+_ytdlp_probe_lock = threading.Lock()
+
+
+def ytdlp_version():
+    """Version of the installed yt-dlp, or None if it can't be run.
+
+    Starting Python for yt-dlp costs hundreds of ms: it is probed once,
+    off the startup path, and concurrent first callers wait for that probe.
+    """
+    with _ytdlp_probe_lock:
+        return _probe_ytdlp()
+
+def parse_byte_range(range_header):
+    """Parse a single 'bytes=start-end' Range header.
+
+    Returns (start, end) where end is None for open ranges, or None if the
+    header is missing or uses a form we don't handle (suffix or multi-range).
+    """
+    if not range_header:
+        return None
+    match = re.fullmatch(r'\s*bytes=(\d+)-(\d*)\s*', range_header)
+    if not match:
+        return None
+    start = int(match.group(1))
+    end = int(match.group(2)) if match.group(2) else None
+    if end is not None and end < start:
+        return None
+    return start, end
+
+
+class SharedUpstreamFetch:
+    """One upstream GitHub transfer shared by every client asking for the same bytes.
+
+    A background thread downloads the response into a shared buffer and each
+    waiting client streams out of that buffer at its own pace.
+    """
+
+    def __init__(self, url, range_header):
+        self.url = url
+        self.range_header = range_header
+        self.byte_range = parse_byte_range(range_header)
+        self.status = None
+        self.headers = {}
+        self.error = None
+        self.total_size = None
+        self.start = self.byte_range[0] if self.byte_range else 0
+        self.end = None
+        self.buffer = bytearray()
+        self.done = False
+        self.interrupted = False
+        self.condition = threading.Condition()
+
+    def run(self):
+        """Fetch the upstream response and publish it chunk by chunk"""
+        try:
+            req = urllib.request.Request(self.url)
+            if self.range_header:
+                req.add_header('Range', self.range_header)
+            response = urllib.request.urlopen(req, timeout=30, context=certificates.ssl_context())
+        except urllib.error.HTTPError as e:
+            self._finish(error=(e.code, f'Error fetching file: {e.reason}'))
+            return
+        except Exception as e:
+            self._finish(error=(500, f'Error: {str(e)}'))
+            return
+
+        try:
+            with self.condition:
+                self.status = response.getcode()
+                self.headers = {
+                    'Content-Type': response.headers.get('Content-Type'),
+                    'Content-Length': response.headers.get('Content-Length'),
+                    'Content-Range': response.headers.get('Content-Range'),
+                    'Accept-Ranges': response.headers.get('Accept-Ranges', 'bytes'),
+                }
+                self._read_extent()
+                self.condition.notify_all()
+
+            chunk_size = 8192
+            while True:
+                chunk = response.read(chunk_size)
+                if not chunk:
+                    break
+                with self.condition:
+                    self.buffer.extend(chunk)
+                    self.condition.notify_all()
+            self._finish()
+        except Exception as e:
+            self._finish(error=(500, f'Error: {str(e)}'))
+        finally:
+            response.close()
+
+    def _read_extent(self):
+        """Work out which absolute bytes of the asset this transfer carries"""
+        content_range = self.headers.get('Content-Range')
+        content_length = self.headers.get('Content-Length')
+        if self.status == 206 and content_range:
+            match = re.match(r'bytes (\d+)-(\d+)/(\d+|\*)', content_range)
+            if match:
+                self.start = int(match.group(1))
+                self.end = int(match.group(2))
+                if match.group(3) != '*':
+                    self.total_size = int(match.group(3))
+        elif self.status == 200:
+            # The whole asset, whatever range was asked for
+            self.start = 0
+            if content_length:
+                self.total_size = int(content_length)
+                self.end = self.total_size - 1
+
+    def _finish(self, error=None):
+        with self.condition:
+            if error and self.status is None:
+                self.error = error
+            elif error:
+                # Failed mid-body: clients have already been sent headers
+                self.interrupted = True
+            self.done = True
+            self.condition.notify_all()
+        if error is None:
+            proxy_blocks.add_transfer(self)
+        upstream_fetches.release(self)
+
+    def wait_for_headers(self):
+        """Block until the upstream status is known (or the fetch failed)"""
+        with self.condition:
+            while self.status is None and self.error is None:
+                self.condition.wait()
+
+    def covers(self, start, end):
+        """Whether this transfer will carry absolute bytes start..end"""
+        if self.status is None or self.error is not None:
+            return False
+        if self.end is None or start < self.start:
+            return False
+        if end is None:
+            return self.total_size is not None and self.end == self.total_size - 1
+        return end <= self.end
+
+    def iter_chunks(self, offset=0, length=None):
+        """Yield buffered bytes from offset (relative to this transfer's start)"""
+        position = offset
+        stop = offset + length if length is not None else None
+        while True:
+            with self.condition:
+                while len(self.buffer) <= position and not self.done:
+                    if stop is not None and position >= stop:
+                        break
+                    self.condition.wait()
+                limit = len(self.buffer) if stop is None else min(stop, len(self.buffer))
+                chunk = bytes(self.buffer[position:limit])
+                finished = self.done
+            if chunk:
+                position += len(chunk)
+                yield chunk
+            if (stop is not None and position >= stop) or (finished and not chunk):
+                return
+
+
+class UpstreamFetchRegistry:
+    """Single-flight registry of in-progress upstream transfers.
+
+    Requests for the same URL and Range share one transfer, and a request
+    whose byte range falls inside a running transfer reads its slice of it.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.fetches = {}
+
+    def acquire(self, url, range_header):
+        """Return (fetch, offset, length) for the bytes this client wants"""
+        requested = parse_byte_range(range_header)
+        with self.lock:
+            running = self.fetches.get(url, [])
+            for fetch in running:
+                if fetch.range_header == range_header:
+                    return fetch, 0, None
+            if requested:
+                start, end = requested
+                for fetch in running:
+                    if fetch.covers(start, end):
+                        last = end if end is not None else fetch.end
+                        return fetch, start - fetch.start, last - start + 1
+            fetch = SharedUpstreamFetch(url, range_header)
+            self.fetches.setdefault(url, []).append(fetch)
+        threading.Thread(target=fetch.run, daemon=True).start()
+        return fetch, 0, None
+
+    def release(self, fetch):
+        """Forget a finished transfer so later requests start a fresh one"""
+        with self.lock:
+            running = self.fetches.get(fetch.url, [])
+            if fetch in running:
+                running.remove(fetch)
+            if not running:
+                self.fetches.pop(fetch.url, None)
+
+
+upstream_fetches = UpstreamFetchRegistry()
+
+
+class ProxyBlockCache:
+    """LRU cache of aligned PROXY_BLOCK_SIZE blocks of release assets.
+
+    Filled from every completed upstream transfer, along with each asset's
+    size and content type, so later requests for any range inside those
+    blocks are answered without going upstream.
+    """
+
+    # Sizes and types are remembered for this many assets
+    MAX_ASSETS = 1024
+
+    def __init__(self, capacity=PROXY_CACHE_SIZE, block_size=PROXY_BLOCK_SIZE):
+        self.capacity = capacity
+        self.block_size = block_size
+        self.lock = threading.Lock()
+        self.blocks = collections.OrderedDict()  # (url, index) -> bytes
+        self.assets = collections.OrderedDict()  # url -> (total size, content type)
+        self.size = 0
+
+    def get(self, url, index):
+        with self.lock:
+            data = self.blocks.get((url, index))
+            if data is not None:
+                self.blocks.move_to_end((url, index))
+            return data
+
+    def asset_info(self, url):
+        """(total size, content type) of an asset seen before, or None"""
+        with self.lock:
+            return self.assets.get(url)
+
+    def set_asset_info(self, url, total_size, content_type):
+        with self.lock:
+            self.assets[url] = (total_size, content_type)
+            self.assets.move_to_end(url)
+            while len(self.assets) > self.MAX_ASSETS:
+                self.assets.popitem(last=False)
+
+    def add_transfer(self, fetch):
+        """Keep every whole block contained in a completed transfer"""
+        total = fetch.total_size
+        if total is None:
+            return
+        self.set_asset_info(fetch.url, total, proxy_content_type(fetch.headers['Content-Type']))
+        size = self.block_size
+        end = fetch.start + len(fetch.buffer)
+        index = -(-fetch.start // size)  # first block starting inside the transfer
+        with self.lock:
+            while index * size < end:
+                block_end = min((index + 1) * size, total)
+                if block_end > end:
+                    break
+                key = (fetch.url, index)
+                if key not in self.blocks:
+                    data = bytes(fetch.buffer[index * size - fetch.start:block_end - fetch.start])
+                    self.blocks[key] = data
+                    self.size += len(data)
+                index += 1
+            while self.size > self.capacity:
+                _, data = self.blocks.popitem(last=False)
+                self.size -= len(data)
+
+
+proxy_blocks = ProxyBlockCache()
+
+
+def proxy_content_type(content_type):
+    """GitHub serves assets as octet-stream; the player wants audio/mpeg"""
+    if not content_type or content_type == 'application/octet-stream':
+        return 'audio/mpeg'
+    return content_type
+
+
+def open_proxy_block(url, index):
+    """Start reading one aligned block of a release asset.
+
+    Returns (total size, content type, chunk iterator), from the cache or
+    from an upstream request for exactly that block (shared with anyone
+    asking for the same block), or an (status, message) error tuple.
+    """
+    data = proxy_blocks.get(url, index)
+    info = proxy_blocks.asset_info(url)
+    if data is not None and info is not None:
+        return info[0], info[1], iter((data,))
+
+    block_start = index * PROXY_BLOCK_SIZE
+    fetch, _, _ = upstream_fetches.acquire(
+        url, f'bytes={block_start}-{block_start + PROXY_BLOCK_SIZE - 1}')
+    fetch.wait_for_headers()
+    if fetch.error:
+        return fetch.error
+    if fetch.total_size is None:
+        return 502, 'Upstream did not report the size of the file'
+    total = fetch.total_size
+    content_type = proxy_content_type(fetch.headers['Content-Type'])
+    length = max(0, min(PROXY_BLOCK_SIZE, total - block_start))
+    # The transfer may have started before this block (e.g. GitHub ignored the range)
+    return total, content_type, fetch.iter_chunks(block_start - fetch.start, length)
+
+
+class LocalAssetIndex:
+    """Maps GitHub release asset URLs to copies in the local audio folder.
+
+    Candidates are the catalog track recorded at the asset URL, or the
+    tracks whose names normalize like the asset's (the way GitHub renames
+    uploads). A candidate is only served if it is the published asset:
+    its size must match the release index (.release_assets.json, see
+    release_assets.py) and, when GitHub published one, its SHA-256 digest
+    too. Assets the index doesn't list are always fetched upstream.
+    """
+
+    def __init__(self, audio_dir='audio', index_path=release_assets.INDEX_FILE):
+        self.audio_dir = audio_dir
+        self.index_path = index_path
+        self.lock = threading.Lock()
+        self.index_mtime = None
+        self.assets = {}
+        self.digests = {}  # (path, size, mtime) -> "sha256:<hex>"
+
+    def published_asset(self, url):
+        """The release index record of url, re-reading the index when it changes"""
+        try:
+            mtime = os.stat(self.index_path).st_mtime
+        except OSError:
+            mtime = None
+        with self.lock:
+            if mtime != self.index_mtime:
+                self.assets = release_assets.published_assets(self.index_path) if mtime else {}
+                self.index_mtime = mtime
+            return self.assets.get(unquote(url))
+
+    def file_digest(self, path, stat):
+        key = (path, stat.st_size, stat.st_mtime)
+        with self.lock:
+            digest = self.digests.get(key)
+        if digest is None:
+            sha256 = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    sha256.update(block)
+            digest = 'sha256:' + sha256.hexdigest()
+            with self.lock:
+                self.digests[key] = digest
+        return digest
+
+    def resolve(self, url):
+        """Return the local path serving url, or None to go upstream"""
+        asset = self.published_asset(url)
+        if asset is None:
+            return None
+        recorded = catalog.find_by_asset_url(url)
+        candidates = [recorded] if recorded else []
+        candidates += catalog.find_by_asset_name(urlparse(url).path.rsplit('/', 1)[-1])
+        for track in candidates:
+            path = os.path.join(self.audio_dir, track['file'])
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if stat.st_size != asset['size']:
+                continue
+            digest = asset.get('digest') or ''
+            if digest.startswith('sha256:') and self.file_digest(path, stat) != digest:
+                continue
+            return path
+        return None
+
+
+local_assets = LocalAssetIndex()
+
+
+class TokenBucket:
+    """Byte budget refilling at rate bytes/s, holding at most burst bytes"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        # now can predate a bucket created while it was being handled
+        self.tokens = min(self.burst, self.tokens + max(0.0, now - self.updated) * self.rate)
+        self.updated = max(self.updated, now)
+
+    def shortfall(self, amount):
+        """Seconds until amount tokens are available (0 if they already are)"""
+        amount = min(amount, self.burst)
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+    def debt_delay(self):
+        """Seconds until a negative balance is paid back"""
+        return max(0.0, -self.tokens / self.rate)
+
+
+class BandwidthLimiter:
+    """Token-bucket rate limiting of response bodies.
+
+    Each write is charged to a global bucket, the client's bucket and the
+    client's bucket for the route, whichever are configured. Playback
+    writes may overdraw the buckets and just sleep off the debt; bulk
+    writes wait until the tokens are actually there, so whenever the caps
+    are reached playback goes first.
+    """
+
+    # Idle per-client buckets are dropped after this many seconds
+    IDLE_TIMEOUT = 60
+
+    def __init__(self, global_rate=None, client_rate=None, route_rates=None):
+        self.lock = threading.Lock()
+        self.configure(global_rate, client_rate, route_rates)
+
+    def configure(self, global_rate=None, client_rate=None, route_rates=None):
+        with self.lock:
+            self.client_rate = client_rate
+            self.route_rates = dict(route_rates or {})
+            self.global_bucket = TokenBucket(global_rate) if global_rate else None
+            self.buckets = {}  # client or (client, route) -> [bucket, last used]
+            self.enabled = bool(global_rate or client_rate or any(self.route_rates.values()))
+
+    def _client_buckets(self, client, route, now):
+        buckets = [self.global_bucket] if self.global_bucket else []
+        for key, rate in ((client, self.client_rate),
+                          ((client, route), self.route_rates.get(route))):
+            if not rate:
+                continue
+            entry = self.buckets.get(key)
+            if entry is None:
+                self._forget_idle(now)
+                entry = self.buckets[key] = [TokenBucket(rate), now]
+            entry[1] = now
+            buckets.append(entry[0])
+        return buckets
+
+    def _forget_idle(self, now):
+        idle = [key for key, (_, used) in self.buckets.items() if now - used > self.IDLE_TIMEOUT]
+        for key in idle:
+            del self.buckets[key]
+
+    def throttle(self, client, route, amount, playback):
+        """Block until amount bytes may be sent to client on route"""
+        if not self.enabled:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                buckets = self._client_buckets(client, route, now)
+                for bucket in buckets:
+                    bucket.refill(now)
+                wait = max((bucket.shortfall(amount) for bucket in buckets), default=0.0)
+                if playback or wait == 0:
+                    for bucket in buckets:
+                        bucket.tokens -= amount
+                    wait = max((bucket.debt_delay() for bucket in buckets), default=0.0)
+                    break
+            # Bulk: check again later, playback may take the tokens first
+            time.sleep(wait)
+        if wait:
+            time.sleep(wait)
+
+
+bandwidth_limiter = BandwidthLimiter(GLOBAL_RATE_LIMIT, CLIENT_RATE_LIMIT, ROUTE_RATE_LIMITS)
+
+class InFlightRequests:
+    """Counts the requests being handled, so a stopping worker can wait for them"""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.count = 0
+        self.draining = False
+
+    def begin(self):
+        with self.condition:
+            self.count += 1
+
+    def end(self):
+        with self.condition:
+            self.count -= 1
+            self.condition.notify_all()
+
+    def drain(self, timeout):
+        """Close connections after their current request; wait until none is left.
+
+        Returns False if requests were still running after timeout seconds.
+        """
+        with self.condition:
+            self.draining = True
+            return self.condition.wait_for(lambda: self.count == 0, timeout)
+
+
+in_flight = InFlightRequests()
+
+# How long a download reply waits for the playlist to include the new track
+PLAYLIST_UPDATE_TIMEOUT = 60
+
+class PlaylistRebuilder:
+    """Debounces playlist regeneration requests into as few rebuilds as possible.
+
+    The first request opens a short window; every request that arrives
+    before the window closes is served by the same rebuild. Rebuilds
+    themselves are serialized by generate_playlist's lock.
+    """
+
+    def __init__(self, rebuild, delay=0.5):
+        self.rebuild = rebuild
+        self.delay = delay
+        self.condition = threading.Condition()
+        self.requested = 0
+        self.completed = 0
+        self.timer = None
+
+    def request(self):
+        """Ask for a rebuild; returns a ticket to pass to wait()"""
+        with self.condition:
+            self.requested += 1
+            ticket = self.requested
+            if self.timer is None:
+                self.timer = threading.Timer(self.delay, self._run)
+                self.timer.daemon = True
+                self.timer.start()
+        return ticket
+
+    def wait(self, ticket, timeout=None):
+        """Block until a rebuild started after this ticket has finished"""
+        with self.condition:
+            return self.condition.wait_for(lambda: self.completed >= ticket, timeout)
+
+    def _run(self):
+        with self.condition:
+            self.timer = None
+            target = self.requested
+        try:
+            self.rebuild()
+        except Exception as e:
+            print(f"Error regenerating playlist: {e}")
+        finally:
+            with self.condition:
+                self.completed = max(self.completed, target)
+                self.condition.notify_all()
+
+
+class LivePlaylist:
+    """In-memory copy of playlist.json that pushes changes to subscribers.
+
+    Each subscriber is a queue receiving (event, data) tuples; the SSE
+    endpoint drains one queue per connected player. Events are the
+    changes logged in the catalog since the last reload (see
+    playlist_format), or "sync" when they can't be replayed.
+    """
+
+    def __init__(self, playlist_path='playlist.json'):
+        self.playlist_path = playlist_path
+        self.lock = threading.Lock()
+        self.tracks = []
+        self.revision = None
+        self.subscribers = set()
+        self.closed = False
+
+    def reload(self):
+        """Re-read playlist.json and publish only what changed"""
+        try:
+            data = playlist_format.load_playlist(self.playlist_path)
+        except (OSError, ValueError) as e:
+            print(f"Could not read {self.playlist_path}: {e}")
+            return
+        revision = data.get('revision', 0) if isinstance(data, dict) else 0
+        new_tracks = playlist_format.expand_tracks(data)
+
+        with self.lock:
+            events = []
+            if self.revision is not None and revision > self.revision:
+                _, changes = catalog.playlist_changes_since(self.revision)
+                if changes is None:
+                    events.append(('sync', {'revision': revision}))
+                else:
+                    events.extend((change['type'], change) for change in changes
+                                  if change['revision'] <= revision)
+            elif self.revision is not None and new_tracks != self.tracks:
+                # Rewritten outside write_playlist (or the log was reset)
+                events.append(('sync', {'revision': revision}))
+            self.tracks = new_tracks
+            self.revision = revision
+            subscribers = list(self.subscribers)
+
+        for event in events:
+            for subscriber in subscribers:
+                subscriber.put(event)
+
+    def subscribe(self):
+        subscriber = queue.Queue()
+        with self.lock:
+            if self.closed:
+                subscriber.put(None)
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def close(self):
+        """End every event stream: subscribers receive None"""
+        with self.lock:
+            self.closed = True
+            for subscriber in self.subscribers:
+                subscriber.put(None)
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+
+live_playlist = LivePlaylist()
+
+
+def rebuild_playlist():
+    """Regenerate playlist.json and push the differences to connected players"""
+    generate_playlist.generate_playlist()
+    live_playlist.reload()
+    if supervisor_pid:
+        # The supervisor relays SIGHUP to every worker, so their players hear too
+        os.kill(supervisor_pid, signal.SIGHUP)
+
+
+playlist_rebuilder = PlaylistRebuilder(rebuild_playlist)
+
+# Seconds between keep-alive comments on idle event streams
+SSE_KEEPALIVE = 15
+
+# Routes whose responses stream for as long as the client listens
+STREAMING_ROUTES = ('/api/playlist/events', '/api/radio')
+
+# Radio ring buffer size (about a minute of 256 kbps audio)
+RADIO_BUFFER_SIZE = 2 * 1024 * 1024
+# How far ahead of real time the radio reader runs, in seconds
+RADIO_LEAD = 3.0
+# Bytes sent immediately to a new listener so playback starts quickly
+RADIO_JOIN_BURST = 64 * 1024
+# Listeners that fall behind more often than this are disconnected
+RADIO_MAX_RESYNCS = 3
+
+
+class RadioRingBuffer:
+    """Fixed-size ring of the most recent radio bytes.
+
+    Positions are absolute byte counts since the station started. One
+    writer appends; any number of listeners read from their own position.
+    A listener more than a full buffer behind has lost data and must
+    resync to the live edge.
+    """
+
+    def __init__(self, capacity=RADIO_BUFFER_SIZE):
+        self.capacity = capacity
+        self.data = None  # allocated by the first write, not at startup
+        self.head = 0  # absolute position of the next byte to be written
+        self.closed = False  # set when the server stops: listeners leave
+        self.condition = threading.Condition()
+
+    def write(self, chunk):
+        with self.condition:
+            if self.data is None:
+                self.data = bytearray(self.capacity)
+            start = self.head % self.capacity
+            first = min(len(chunk), self.capacity - start)
+            self.data[start:start + first] = chunk[:first]
+            if first < len(chunk):
+                self.data[:len(chunk) - first] = chunk[first:]
+            self.head += len(chunk)
+            self.condition.notify_all()
+
+    def live_position(self, burst=RADIO_JOIN_BURST):
+        """Position a new (or resyncing) listener should start from.
+
+        That is the first frame boundary in the last `burst` bytes, so
+        players never start decoding in the middle of a frame.
+        """
+        with self.condition:
+            start = max(0, self.head - min(burst, self.capacity))
+            if start == self.head:
+                return start
+            offset = mp3_frames.find_frame_start(self._copy(start, self.head))
+            return start + offset if offset is not None else start
+
+    def close(self):
+        """Wake every reader; they get empty chunks from now on"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def read(self, position, max_bytes=64 * 1024, timeout=None):
+        """Return (chunk, new_position); chunk is None if position was overrun"""
+        with self.condition:
+            self.condition.wait_for(lambda: self.head > position or self.closed, timeout)
+            if self.closed:
+                return b'', position
+            if self.head - position > self.capacity:
+                return None, position
+            end = min(self.head, position + max_bytes)
+            return self._copy(position, end), end
+
+    def _copy(self, start, end):
+        """Bytes between two absolute positions still in the ring (lock held)"""
+        start_index = start % self.capacity
+        end_index = start_index + (end - start)
+        if end_index <= self.capacity:
+            return bytes(self.data[start_index:end_index])
+        return bytes(self.data[start_index:]) + bytes(self.data[:end_index - self.capacity])
+
+
+class RadioStation:
+    """Plays the playlist back to back into a shared ring buffer.
+
+    A single reader thread opens each track once (local file or upstream
+    URL) and writes whole MP3 frames, paced to real time by frame
+    duration. Every listener reads the same bytes from the ring, so an
+    extra listener only costs its socket writes.
+    """
+
+    def __init__(self, playlist):
+        self.playlist = playlist
+        self.buffer = RadioRingBuffer()
+        self.lock = threading.Lock()
+        self.listeners = 0
+        self.listeners_changed = threading.Condition(self.lock)
+        self.thread = None
+        self.now_playing = None
+
+    def add_listener(self):
+        with self.lock:
+            self.listeners += 1
+            self.listeners_changed.notify_all()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+        return self.buffer.live_position()
+
+    def remove_listener(self):
+        with self.lock:
+            self.listeners -= 1
+
+    def _wait_for_listeners(self):
+        with self.lock:
+            self.listeners_changed.wait_for(lambda: self.listeners > 0)
+
+    def _open_track(self, track):
+        source = track.get('file') or track.get('src')
+        if source.startswith(('http://', 'https://')):
+            # Published URLs are already percent-encoded
+            return urllib.request.urlopen(source, timeout=30, context=certificates.ssl_context())
+        # Local tracks are plain paths ("audio/100% Pure.mp3")
+        return open(source, 'rb')
+
+    def _run(self):
+        index = 0
+        clock = None  # (monotonic start, seconds of audio written since)
+        while True:
+            self._wait_for_listeners()
+            tracks = list(self.playlist.tracks)
+            if not tracks:
+                time.sleep(5)
+                continue
+            track = tracks[index % len(tracks)]
+            index += 1
+            self.now_playing = track.get('title')
+            try:
+                with self._open_track(track) as stream:
+                    for number, (_, header, frame) in enumerate(mp3_frames.iter_frames(stream)):
+                        if number == 0 and mp3_frames.is_info_frame(frame):
+                            # The VBR header describes one file, not the stream
+                            continue
+                        if clock is None:
+                            clock = [time.monotonic(), 0.0]
+                        self.buffer.write(frame)
+                        clock[1] += header.samples / header.sample_rate
+                        ahead = clock[0] + clock[1] - time.monotonic()
+                        if ahead > RADIO_LEAD:
+                            time.sleep(ahead - RADIO_LEAD)
+                        if self.listeners == 0:
+                            # Nobody is listening: pause, and restart the
+                            # clock when someone tunes back in
+                            self._wait_for_listeners()
+                            clock = None
+            except Exception as e:
+                print(f"Radio: skipping {self.now_playing}: {e}")
+                time.sleep(1)
+
+
+radio_station = RadioStation(live_playlist)
+
+# yt-dlp progress line, e.g. "[download]  42.1% of ~ 5.21MiB at 1.20MiB/s ETA 00:03"
+YTDLP_PROGRESS_RE = re.compile(
+    r'^\[download\]\s+(?P<percent>[\d.]+)%'
+    r'(?:\s+of\s+~?\s*(?P<size>\S+))?'
+    r'(?:\s+at\s+(?P<speed>\S+))?'
+    r'(?:\s+ETA\s+(?P<eta>\S+))?'
+)
+
+# yt-dlp post-processors and the stage name reported to the browser
+YTDLP_STAGES = {
+    'ExtractAudio': 'converting',
+    'Metadata': 'tagging',
+    'EmbedThumbnail': 'tagging',
+    'MoveFiles': 'finishing',
+    'FixupM4a': 'finishing',
+}
+
+
+def parse_ytdlp_line(line):
+    """Turn one line of yt-dlp output into a progress update, or None"""
+    match = YTDLP_PROGRESS_RE.match(line)
+    if match:
+        return {
+            'stage': 'downloading',
+            'percent': float(match.group('percent')),
+            'size': match.group('size'),
+            'speed': match.group('speed'),
+            'eta': match.group('eta'),
+        }
+    stage_match = re.match(r'^\[(\w+)\]', line)
+    if stage_match and stage_match.group(1) in YTDLP_STAGES:
+        return {'stage': YTDLP_STAGES[stage_match.group(1)]}
+    return None
+
 
 class MyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    timeout = KEEPALIVE_TIMEOUT
+
+    def setup(self):
+        super().setup()
+        self.requests_served = 0
+
+    def handle_one_request(self):
+        # Idle wait for the next request on this connection
+        self.connection.settimeout(KEEPALIVE_TIMEOUT)
+        self.request_started = False
+        try:
+            super().handle_one_request()
+        finally:
+            if self.request_started:
+                in_flight.end()
+                startup.request_served()
+            if profiler:
+                profiler.end_request()
+
+    def parse_request(self):
+        # A request arrived: give slow readers more room than an idle connection
+        self.connection.settimeout(REQUEST_TIMEOUT)
+        self.requests_served += 1
+        self.request_started = True
+        in_flight.begin()
+        parsed = super().parse_request()
+        if profiler and parsed and urlparse(self.path).path not in STREAMING_ROUTES:
+            profiler.begin_request()
+        return parsed
+
+    def send_response(self, code, message=None):
+        super().send_response(code, message)
+        if self.requests_served >= MAX_KEEPALIVE_REQUESTS or in_flight.draining:
+            self.close_connection = True
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        else:
+            remaining = MAX_KEEPALIVE_REQUESTS - self.requests_served
+            self.send_header('Keep-Alive', f'timeout={KEEPALIVE_TIMEOUT}, max={remaining}')
+
+    def send_unsized_body_headers(self):
+        """Announce a body whose length isn't known yet; returns True if chunked.
+
+        HTTP/1.0 clients can't read chunks, so their connection is closed
+        at the end of the body instead.
+        """
+        if self.request_version == 'HTTP/1.1':
+            self.send_header('Transfer-Encoding', 'chunked')
+            return True
+        self.send_header('Connection', 'close')
+        return False
+
+    def write_body(self, data, chunked):
+        """Write part of a body sent with send_unsized_body_headers()"""
+        if not data:
+            return
+        if chunked:
+            self.wfile.write(b'%x\r\n' % len(data) + data + b'\r\n')
+        else:
+            self.wfile.write(data)
+
+    def write_throttled(self, data, route, position, chunked=False):
+        """Write part of an audio body once the bandwidth limiter allows it.
+
+        position is the number of body bytes already sent; the first
+        PLAYBACK_PRIORITY_BYTES of a range request go out at playback
+        priority, everything else (full files, read-ahead) as bulk.
+        """
+        playback_bytes = PLAYBACK_PRIORITY_BYTES if self.headers.get('Range') else 0
+        for i in range(0, len(data), THROTTLE_CHUNK):
+            piece = data[i:i + THROTTLE_CHUNK]
+            bandwidth_limiter.throttle(self.client_address[0], route, len(piece),
+                                       playback=position + i < playback_bytes)
+            self.write_body(piece, chunked)
+
+    def send_file_body(self, path, start, length, route):
+        """Stream length bytes of a file from start, throttled"""
+        with open(path, 'rb') as f:
+            f.seek(start)
+            sent = 0
+            while sent < length:
+                chunk = f.read(min(THROTTLE_CHUNK, length - sent))
+                if not chunk:
+                    # File shrank under us: the body can only be cut short
+                    self.close_connection = True
+                    return
+                self.write_throttled(chunk, route, sent)
+                sent += len(chunk)
+
+    def end_chunked_body(self, chunked):
+        if chunked:
+            self.wfile.write(b'0\r\n\r\n')
+
     def end_headers(self):
         # Add CORS headers to allow loading resources
         self.send_header('Access-Control-Allow-Origin', '*')
@@ -47,6 +1029,33 @@ class MyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
             print(f"[DEBUG] Proxy request: {self.path}")
             self.handle_proxy_request()
             return
+        elif path_without_query == '/playlist.json':
+            self.handle_playlist_request()
+            return
+        elif path_without_query == '/precache.json':
+            self.handle_precache_request()
+            return
+        elif path_without_query == '/api/playlist/changes':
+            self.handle_playlist_changes()
+            return
+        elif path_without_query == '/api/playlist/events':
+            self.handle_playlist_events()
+            return
+        elif path_without_query == '/api/radio':
+            self.handle_radio_request()
+            return
+        elif path_without_query == '/api/profile':
+            self.handle_profile_request()
+            return
+        elif path_without_query == '/api/radio/now':
+            self.send_json_response(200, {
+                'title': radio_station.now_playing,
+                'listeners': radio_station.listeners
+            })
+            return
+        elif path_without_query.startswith('/waveforms/'):
+            self.handle_waveform_request(path_without_query)
+            return
         # Check if this is a request for an audio file
         elif self.path.endswith(('.mp3', '.m4a', '.ogg', '.wav', '.flac')):
             self.handle_range_request()
@@ -66,9 +1075,9 @@ class MyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
     
     def handle_proxy_request(self, head_only=False):
         """Proxy audio files from GitHub releases with CORS headers"""
+        self.proxy_headers_sent = False
         try:
-            from urllib.parse import parse_qs, urlparse
-            import urllib.request
+            from urllib.parse import parse_qs
             
             # Get URL from query parameter
             parsed_path = urlparse(self.path)
@@ -81,6 +1090,7 @@ class MyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
                     self.send_response(200)
                     self.send_header('Access-Control-Allow-Origin', '*')
                     self.send_header('Access-Control-Allow-Methods', 'GET, HEAD, OPTIONS')
+                    self.send_header('Content-Length', '0')
                     self.end_headers()
                     return
                 self.send_error_response(400, 'Missing url parameter')
@@ -93,92 +1103,382 @@ class MyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
                     self.send_response(200)
                     self.send_header('Access-Control-Allow-Origin', '*')
                     self.send_header('Access-Control-Allow-Methods', 'GET, HEAD, OPTIONS')
+                    self.send_header('Content-Length', '0')
                     self.end_headers()
                     return
                 self.send_error_response(400, 'Invalid URL. Must be a GitHub release download URL')
                 return
             
+            # Serve our own copy of the asset when we have a verified one
+            local_path = local_assets.resolve(url)
+            if local_path:
+                self.handle_range_request(local_path, head_only=head_only, route='proxy')
+                return
+
             # Get Range header for partial content support
             range_header = self.headers.get('Range', '')
-            
-            # Create request to GitHub
-            req = urllib.request.Request(url)
-            
-            # Forward Range header if present
-            if range_header:
-                req.add_header('Range', range_header)
-            
-            # Fetch the file
-            try:
-                # Use SSL context to handle certificate verification
-                response = urllib.request.urlopen(req, timeout=30, context=ssl_context)
-                
-                # Get status code
-                status_code = response.getcode()
-                
-                # Get headers from GitHub response
-                content_type = response.headers.get('Content-Type', 'audio/mpeg')
-                if not content_type or content_type == 'application/octet-stream':
-                    if url.endswith('.mp3'):
-                        content_type = 'audio/mpeg'
-                    else:
-                        content_type = 'audio/mpeg'
-                
-                content_length = response.headers.get('Content-Length')
-                content_range = response.headers.get('Content-Range')
-                accept_ranges = response.headers.get('Accept-Ranges', 'bytes')
-                
-                # Send response headers
-                if status_code == 206:  # Partial content
-                    self.send_response(206)
-                else:
-                    self.send_response(200)
-                
-                self.send_header('Content-Type', content_type)
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
-                self.send_header('Access-Control-Allow-Headers', 'Content-Type, Range')
-                self.send_header('Access-Control-Expose-Headers', 'Content-Length, Content-Range, Accept-Ranges')
-                
-                if content_length:
-                    self.send_header('Content-Length', content_length)
-                if content_range:
-                    self.send_header('Content-Range', content_range)
-                self.send_header('Accept-Ranges', accept_ranges)
-                self.send_header('Cache-Control', 'public, max-age=31536000')
-                
-                self.end_headers()
-                
-                # For HEAD requests, don't send body
-                if head_only:
-                    response.close()
-                    return
-                
-                # Stream the file in chunks
-                chunk_size = 8192
-                try:
-                    while True:
-                        chunk = response.read(chunk_size)
-                        if not chunk:
-                            break
-                        self.wfile.write(chunk)
-                finally:
-                    response.close()
-                    
-            except urllib.error.HTTPError as e:
-                self.send_error_response(e.code, f'Error fetching file: {e.reason}')
-            except Exception as e:
+
+            if head_only:
+                self.proxy_head_request(url, range_header)
+                return
+
+            requested = parse_byte_range(range_header) if range_header else (0, None)
+            if requested is None:
+                # Suffix or multi-part range: pass it through as-is
+                self.relay_upstream(url, range_header)
+            else:
+                self.send_proxy_blocks(url, *requested, partial=bool(range_header))
+
+        except (BrokenPipeError, ConnectionResetError):
+            # Client went away; the shared transfer carries on for the others
+            self.close_connection = True
+        except Exception as e:
+            if self.proxy_headers_sent:
+                self.close_connection = True
+            else:
                 self.send_error_response(500, f'Error: {str(e)}')
-                
+
+    def send_proxy_blocks(self, url, start, end, partial):
+        """Answer a proxied request from aligned blocks.
+
+        Whatever the client's range, upstream only ever sees requests for
+        whole PROXY_BLOCK_SIZE blocks, which are cached and shared; the
+        client's exact bytes are sliced out of them.
+        """
+        size = PROXY_BLOCK_SIZE
+        index = start // size
+        info = proxy_blocks.asset_info(url)
+        if info is not None and start >= info[0]:
+            opened = info[0], info[1], iter(())
+        else:
+            opened = open_proxy_block(url, index)
+        if len(opened) == 2:
+            self.send_error_response(*opened)
+            return
+        total, content_type, chunks = opened
+
+        end = total - 1 if end is None else min(end, total - 1)
+        if start > end:
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{total}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(206 if partial else 200)
+        self.send_proxy_headers(content_type, str(end - start + 1),
+                                f'bytes {start}-{end}/{total}' if partial else None, 'bytes')
+
+        sent = 0
+        while True:
+            # Absolute position of the next byte this block yields
+            position = index * size
+            for chunk in chunks:
+                chunk_start, chunk_end = position, position + len(chunk)
+                position = chunk_end
+                if chunk_end <= start + sent:
+                    continue
+                piece = chunk[max(0, start + sent - chunk_start):end + 1 - chunk_start]
+                self.write_throttled(piece, 'proxy', sent)
+                sent += len(piece)
+                if start + sent > end:
+                    return
+            if position < min((index + 1) * size, total):
+                # Upstream failed mid-block: the body can only be cut short
+                self.close_connection = True
+                return
+            index += 1
+            opened = open_proxy_block(url, index)
+            if len(opened) == 2:
+                self.close_connection = True
+                return
+            _, _, chunks = opened
+
+    def relay_upstream(self, url, range_header):
+        """Proxy a request verbatim, sharing the upstream transfer when possible"""
+        # Share the upstream transfer with any identical or overlapping request
+        fetch, offset, length = upstream_fetches.acquire(url, range_header)
+        fetch.wait_for_headers()
+        if fetch.error:
+            self.send_error_response(*fetch.error)
+            return
+
+        content_type = proxy_content_type(fetch.headers['Content-Type'])
+
+        if length is None:
+            # Same request as the one sent upstream: relay its headers
+            status_code = 206 if fetch.status == 206 else 200
+            content_length = fetch.headers['Content-Length']
+            content_range = fetch.headers['Content-Range']
+        else:
+            # A slice of a larger transfer that is already running
+            start = fetch.start + offset
+            total = fetch.total_size if fetch.total_size is not None else '*'
+            status_code = 206
+            content_length = str(length)
+            content_range = f'bytes {start}-{start + length - 1}/{total}'
+
+        self.send_response(status_code)
+        chunked = self.send_proxy_headers(content_type, content_length, content_range,
+                                          fetch.headers['Accept-Ranges'])
+
+        sent = 0
+        for chunk in fetch.iter_chunks(offset, length):
+            self.write_throttled(chunk, 'proxy', sent, chunked)
+            sent += len(chunk)
+
+        if fetch.interrupted or (content_length and sent != int(content_length)):
+            # The body came up short: closing is the only way to tell the client
+            self.close_connection = True
+        else:
+            self.end_chunked_body(chunked)
+
+    def proxy_head_request(self, url, range_header):
+        """Answer a proxy HEAD request without fetching the body"""
+        req = urllib.request.Request(url, method='HEAD')
+        if range_header:
+            req.add_header('Range', range_header)
+        try:
+            response = urllib.request.urlopen(req, timeout=30, context=certificates.ssl_context())
+        except urllib.error.HTTPError as e:
+            self.send_error_response(e.code, f'Error fetching file: {e.reason}')
+            return
         except Exception as e:
             self.send_error_response(500, f'Error: {str(e)}')
+            return
+
+        try:
+            content_type = proxy_content_type(response.headers.get('Content-Type'))
+            self.send_response(206 if response.getcode() == 206 else 200)
+            self.send_proxy_headers(content_type,
+                                    response.headers.get('Content-Length'),
+                                    response.headers.get('Content-Range'),
+                                    response.headers.get('Accept-Ranges', 'bytes'),
+                                    head_only=True)
+        finally:
+            response.close()
+
+    def send_proxy_headers(self, content_type, content_length, content_range, accept_ranges,
+                           head_only=False):
+        """Send the headers shared by every proxied audio response.
+
+        Returns True if the body has to be sent chunked (upstream gave no length).
+        """
+        chunked = False
+        self.send_header('Content-Type', content_type)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Range')
+        self.send_header('Access-Control-Expose-Headers', 'Content-Length, Content-Range, Accept-Ranges')
+
+        if content_length:
+            self.send_header('Content-Length', content_length)
+        elif not head_only:
+            chunked = self.send_unsized_body_headers()
+        if content_range:
+            self.send_header('Content-Range', content_range)
+        self.send_header('Accept-Ranges', accept_ranges)
+        self.send_header('Cache-Control', 'public, max-age=31536000')
+
+        self.end_headers()
+        self.proxy_headers_sent = True
+        return chunked
     
-    def handle_range_request(self):
-        """Handle HTTP range requests for audio streaming"""
-        import re
-        
+    def handle_playlist_request(self):
+        """Serve playlist.json, compact (v2) or legacy depending on the client.
+
+        Clients that ask for v2 (Accept header or ?format=2) get the file as
+        stored; older players get the expanded list of {"title", "file"}.
+        """
+        query = urlparse(self.path).query
+        wants_v2 = ('format=2' in query.split('&') or
+                    playlist_format.PLAYLIST_V2_MEDIA_TYPE in self.headers.get('Accept', ''))
+        try:
+            data = playlist_format.load_playlist()
+        except (OSError, ValueError):
+            self.send_error(404, "File not found")
+            return
+        if not wants_v2:
+            data = playlist_format.expand_tracks(data)
+        self.send_json_response(200, data)
+    
+    def handle_playlist_changes(self):
+        """Playlist changes after ?since=<revision>, or a full snapshot.
+
+        The reply is {"revision", "changes"}, or {"revision", "snapshot"}
+        (the playlist as stored) when the client is too far behind for the
+        change log or didn't say where it is.
+        """
+        query = parse_qs(urlparse(self.path).query)
+        try:
+            since = int(query['since'][0])
+        except (KeyError, ValueError):
+            since = None
+        if since is not None:
+            revision, changes = catalog.playlist_changes_since(since)
+            if changes is not None:
+                self.send_json_response(200, {'revision': revision, 'changes': changes})
+                return
+        try:
+            data = playlist_format.load_playlist()
+        except (OSError, ValueError):
+            self.send_error(404, "File not found")
+            return
+        revision = data.get('revision', 0) if isinstance(data, dict) else 0
+        self.send_json_response(200, {'revision': revision, 'snapshot': data})
+    
+    def handle_precache_request(self):
+        """Serve the service worker manifest of the current playlist.
+
+        It is built from playlist.json on the fly, so it can't lag behind
+        it; the ETag is the manifest version.
+        """
+        try:
+            manifest = playlist_format.build_precache_manifest(playlist_format.load_playlist())
+        except (OSError, ValueError):
+            self.send_error(404, "File not found")
+            return
+        etag = f'"{manifest["version"]}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        body = json.dumps(manifest, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('ETag', etag)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+    
+    def handle_radio_request(self):
+        """Stream the shared radio: the whole playlist as one endless MP3"""
+        position = radio_station.add_listener()
+        resyncs = 0
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'audio/mpeg')
+            self.send_header('Cache-Control', 'no-cache, no-store')
+            # Endless: the body only ends when the listener leaves
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            while not radio_station.buffer.closed:
+                chunk, position = radio_station.buffer.read(position, timeout=SSE_KEEPALIVE)
+                if chunk is None:
+                    # Too slow: the ring overwrote our data. Jump to live.
+                    resyncs += 1
+                    if resyncs > RADIO_MAX_RESYNCS:
+                        print("Radio: dropping a listener that keeps falling behind")
+                        return
+                    position = radio_station.buffer.live_position()
+                    continue
+                if chunk:
+                    self.wfile.write(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            radio_station.remove_listener()
+    
+    def handle_profile_request(self):
+        """Admin endpoint: the profile gathered by --profile (local clients only).
+
+        Returns collapsed stacks, or a pstats file with ?format=pstats;
+        ?reset=1 starts over after answering.
+        """
+        if profiler is None:
+            self.send_error_response(404, 'Profiling is off (start the server with --profile)')
+            return
+        if self.client_address[0] not in ('127.0.0.1', '::1'):
+            self.send_error_response(403, 'Only available from this machine')
+            return
+        query = urlparse(self.path).query.split('&')
+        if 'format=pstats' in query:
+            body = profiler.pstats_data()
+            content_type = 'application/octet-stream'
+        else:
+            body = profiler.collapsed().encode('utf-8')
+            content_type = 'text/plain; charset=utf-8'
+        if 'reset=1' in query:
+            profiler.reset()
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_waveform_request(self, path):
+        """Serve a precomputed waveform peaks file.
+
+        Files are named after the track's content hash, so they never change
+        and can be cached forever.
+        """
+        match = re.fullmatch(r'/waveforms/([0-9a-f]+(?:-\d+)?)\.peaks', path)
+        if not match:
+            self.send_error(404, "File not found")
+            return
+        track_id = match.group(1)
+        etag = f'"{track_id}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        try:
+            with open(os.path.join('waveforms', f'{track_id}.peaks'), 'rb') as f:
+                content = f.read()
+        except FileNotFoundError:
+            self.send_error(404, "File not found")
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(content)))
+        self.send_header('Cache-Control', 'public, max-age=31536000, immutable')
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(content)
+    
+    def handle_playlist_events(self):
+        """Stream playlist add/remove events to the player (Server-Sent Events)"""
+        subscriber = live_playlist.subscribe()
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.wfile.write(b'retry: 3000\n\n')
+            self.wfile.flush()
+            while True:
+                try:
+                    item = subscriber.get(timeout=SSE_KEEPALIVE)
+                    if item is None:
+                        # The server is stopping; players reconnect to another worker
+                        return
+                    event, data = item
+                    message = f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+                except queue.Empty:
+                    message = ': keep-alive\n\n'
+                self.wfile.write(message.encode('utf-8'))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            live_playlist.unsubscribe(subscriber)
+    
+    def handle_range_request(self, path=None, head_only=False, route='audio'):
+        """Handle HTTP range requests for audio streaming.
+
+        path defaults to the file named by the request URL; the proxy passes
+        a local copy of a release asset instead (and its own route, for rate
+        limiting).
+        """
         # Get the file path
-        path = self.translate_path(self.path)
+        if path is None:
+            path = self.translate_path(self.path)
         
         try:
             # Check if file exists
@@ -203,11 +1503,6 @@ class MyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
                         self.send_error(416, "Range Not Satisfiable")
                         return
                     
-                    # Read the requested range
-                    with open(path, 'rb') as f:
-                        f.seek(start)
-                        content = f.read(end - start + 1)
-                    
                     # Send partial content response
                     content_type, _ = mimetypes.guess_type(path)
                     if not content_type:
@@ -216,16 +1511,14 @@ class MyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
                     self.send_response(206)
                     self.send_header('Content-Type', content_type)
                     self.send_header('Content-Range', f'bytes {start}-{end}/{file_size}')
-                    self.send_header('Content-Length', str(len(content)))
+                    self.send_header('Content-Length', str(end - start + 1))
                     self.send_header('Accept-Ranges', 'bytes')
                     self.end_headers()
-                    self.wfile.write(content)
+                    if not head_only:
+                        self.send_file_body(path, start, end - start + 1, route)
                     return
             
             # No range header - send full file
-            with open(path, 'rb') as f:
-                content = f.read()
-            
             content_type, _ = mimetypes.guess_type(path)
             if not content_type:
                 content_type = 'application/octet-stream'
@@ -235,8 +1528,11 @@ class MyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
             self.send_header('Content-Length', str(file_size))
             self.send_header('Accept-Ranges', 'bytes')
             self.end_headers()
-            self.wfile.write(content)
+            if not head_only:
+                self.send_file_body(path, 0, file_size, route)
             
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
         except Exception as e:
             self.send_error(500, f"Server error: {str(e)}")
     
@@ -256,6 +1552,7 @@ class MyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
     def do_OPTIONS(self):
         """Handle preflight requests"""
         self.send_response(200)
+        self.send_header('Content-Length', '0')
         self.end_headers()
 
     def do_POST(self):
@@ -277,41 +1574,141 @@ class MyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
                     self.send_error_response(400, 'Invalid YouTube URL')
                     return
 
+                if data.get('stream'):
+                    self.handle_streaming_download(url)
+                    return
+
                 # Download the video
                 result = self.download_video(url)
                 
                 if result['success']:
-                    # Regenerate playlist (this will also rename all files with prefixes)
-                    try:
-                        self.regenerate_playlist()
-                        # Small delay to ensure file system sync
-                        import time
-                        time.sleep(0.5)
-                    except Exception as e:
-                        print(f"Warning: Playlist regeneration had issues: {e}")
-                    
-                    self.send_json_response(200, {
-                        'success': True,
-                        'title': result['title'],
-                        'message': 'Download completed successfully',
-                        'playlist_updated': True
-                    })
+                    self.send_json_response(200, self.finish_download(result))
                 else:
                     self.send_error_response(500, result.get('error', 'Download failed'))
 
             except json.JSONDecodeError:
                 self.send_error_response(400, 'Invalid JSON in request')
             except Exception as e:
+                # The body may not have been read in full
+                self.close_connection = True
                 self.send_error_response(500, f'Server error: {str(e)}')
         else:
+            # The body wasn't read, so the connection can't carry another request
+            self.close_connection = True
             self.send_error_response(404, 'Not found')
 
-    def download_video(self, url):
-        """Download video from YouTube and convert to MP3"""
+    def finish_download(self, result):
+        """Update the playlist after a successful download and build the reply"""
+        if result.get('existing'):
+            return {
+                'success': True,
+                'title': result['title'],
+                'message': 'Already in the library',
+                'existing': True,
+                'playlist_updated': False
+            }
+        
+        # Regenerate playlist (batched with any other recent downloads)
+        updated = False
+        try:
+            updated = self.regenerate_playlist()
+            if not updated:
+                print(f"Warning: playlist update still pending after {PLAYLIST_UPDATE_TIMEOUT}s")
+        except Exception as e:
+            print(f"Warning: Playlist regeneration had issues: {e}")
+        
+        return {
+            'success': True,
+            'title': result['title'],
+            'message': ('Download completed successfully' if updated
+                        else 'Download completed, playlist update pending'),
+            'playlist_updated': updated
+        }
+
+    def handle_streaming_download(self, url):
+        """Run a download, streaming progress as newline-delimited JSON.
+
+        Every line is an object with a "type": "progress" lines carry the
+        yt-dlp stage, percent, speed and ETA; the last line is "result"
+        with the same fields as the non-streaming reply.
+        """
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Cache-Control', 'no-cache')
+        chunked = self.send_unsized_body_headers()
+        self.end_headers()
+
+        client_connected = True
+        last_sent = {'time': 0.0, 'stage': None}
+
+        def send_event(event):
+            nonlocal client_connected
+            if not client_connected:
+                return
+            try:
+                self.write_body((json.dumps(event, ensure_ascii=False) + '\n').encode('utf-8'),
+                                chunked)
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # Keep downloading; the track still lands in the playlist
+                client_connected = False
+
+        def on_progress(progress):
+            # At most a few updates per second, but never drop a stage change
+            now = time.monotonic()
+            if progress['stage'] == last_sent['stage'] and now - last_sent['time'] < 0.25:
+                return
+            last_sent.update(time=now, stage=progress['stage'])
+            send_event(dict(progress, type='progress'))
+
+        result = self.download_video(url, on_progress=on_progress)
+        if result['success']:
+            send_event(dict(self.finish_download(result), type='result'))
+        else:
+            send_event({
+                'type': 'result',
+                'success': False,
+                'error': result.get('error', 'Download failed')
+            })
+        if client_connected:
+            try:
+                self.end_chunked_body(chunked)
+            except (BrokenPipeError, ConnectionResetError):
+                client_connected = False
+        if not client_connected:
+            self.close_connection = True
+
+    def download_video(self, url, on_progress=None):
+        """Download video from YouTube and convert to MP3.
+
+        on_progress, if given, is called with each parsed progress update
+        (stage, percent, speed, ETA) while yt-dlp runs. Timeouts and
+        transient failures are retried with exponential backoff; yt-dlp
+        resumes from the .part files left by the previous attempt.
+        """
         try:
             audio_dir = Path('audio')
             audio_dir.mkdir(exist_ok=True)
 
+            # Already downloaded: answer with the existing track, no yt-dlp run
+            existing = download_log.find_existing_download(url, audio_dir)
+            if existing:
+                print(f"Already in the library: {url} -> {existing['file']}")
+                return {
+                    'success': True,
+                    'title': existing['title'],
+                    'file': str(audio_dir / existing['file']),
+                    'existing': True
+                }
+
+            if not ytdlp_version():
+                return {
+                    'success': False,
+                    'error': 'yt-dlp is not installed on the server (pip3 install yt-dlp)'
+                }
+
+            download_log.cleanup_orphans(audio_dir)
+
             # Get SSL certificate path
             try:
                 import certifi
@@ -325,7 +1722,13 @@ class MyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
                 '-x',  # Extract audio
                 '--audio-format', 'mp3',
                 '--audio-quality', '0',  # Best quality
-                '-o', str(audio_dir / '%(title)s.%(ext)s'),
+                '--continue',  # Resume partially downloaded files
+                '--retries', '10',
+                '--fragment-retries', '10',
+                '--newline',  # One line per progress update
+                # Playlists skip the videos the catalog already has
+                '--download-archive', download_log.write_archive(audio_dir),
+                '-o', str(audio_dir / download_log.OUTPUT_TEMPLATE),
                 url
             ]
 
@@ -334,135 +1737,71 @@ class MyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
             if cert_path:
                 env['SSL_CERT_FILE'] = cert_path
 
-            # Run yt-dlp
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                env=env,
-                timeout=300  # 5 minute timeout
-            )
-
-            if result.returncode != 0:
-                error_msg = result.stderr or result.stdout
+            def on_line(line):
+                progress = parse_ytdlp_line(line)
+                if progress:
+                    on_progress(progress)
+
+            def on_retry(attempt, delay):
+                on_progress({'stage': 'retrying', 'attempt': attempt, 'delay': delay})
+
+            files, error = download_log.run_ytdlp_with_retries(
+                url, cmd, env,
+                on_line=on_line if on_progress else None,
+                on_retry=on_retry if on_progress else None)
+            if error:
                 return {
                     'success': False,
-                    'error': f'yt-dlp error: {error_msg[:200]}'
+                    'error': error
                 }
-
-            # Find the downloaded file
-            # yt-dlp outputs the filename, try to extract it
-            output_lines = result.stdout.split('\n')
-            downloaded_file = None
-            
-            for line in output_lines:
-                if '[download] Destination:' in line or '[ExtractAudio] Destination:' in line:
-                    # Extract filename from line
-                    parts = line.split('Destination:')
-                    if len(parts) > 1:
-                        downloaded_file = parts[1].strip()
-                        break
-
-            # If we can't find it in output, search for newest MP3 file
-            if not downloaded_file or not os.path.exists(downloaded_file):
-                mp3_files = sorted(audio_dir.glob('*.mp3'), key=os.path.getmtime, reverse=True)
-                if mp3_files:
-                    downloaded_file = str(mp3_files[0])
-
-            if downloaded_file and os.path.exists(downloaded_file):
-                # Rename the downloaded file with numeric prefix
-                renamed_file = self.rename_with_prefix(Path(downloaded_file))
-                title = renamed_file.stem
-                # Remove prefix from title for display
-                import re
-                prefix_match = re.match(r'^(\d{2})_(.+)$', title)
-                if prefix_match:
-                    title = prefix_match.group(2)
-                title = re.sub(r'\[.*?\]', '', title).strip()
-                
+            # Final, stable names (no tag), cataloged with their video ids
+            imported = download_log.import_downloads(url, files, audio_dir)
+            if imported:
+                titles = [catalog.title_from_filename(path.name) for path in imported]
                 return {
                     'success': True,
-                    'title': title,
-                    'file': str(renamed_file)
+                    'title': titles[0] if len(titles) == 1 else f'{len(titles)} tracks',
+                    'file': str(imported[0]),
+                    'files': [str(path) for path in imported]
                 }
-            else:
+            if download_log.is_bulk_import(url):
+                # Every video of the playlist is in the library already
                 return {
-                    'success': False,
-                    'error': 'Downloaded file not found'
+                    'success': True,
+                    'title': 'every video of this playlist',
+                    'files': [],
+                    'existing': True
                 }
-
-        except subprocess.TimeoutExpired:
+            download_log.finish_attempt(url, 'error', 'Downloaded file not found')
             return {
                 'success': False,
-                'error': 'Download timeout (5 minutes exceeded)'
+                'error': 'Downloaded file not found'
             }
+
         except Exception as e:
             return {
                 'success': False,
                 'error': str(e)
             }
 
-    def rename_with_prefix(self, file_path):
-        """Rename a file with the next available numeric prefix"""
-        audio_dir = file_path.parent
-        
-        # Get all existing MP3 files sorted by modification time
-        existing_files = sorted(audio_dir.glob('*.mp3'), key=lambda f: f.stat().st_mtime)
-        
-        # Find the highest existing prefix
-        import re
-        max_prefix = -1
-        for existing_file in existing_files:
-            prefix_match = re.match(r'^(\d{2})_', existing_file.name)
-            if prefix_match:
-                prefix_num = int(prefix_match.group(1))
-                max_prefix = max(max_prefix, prefix_num)
-        
-        # Next prefix
-        next_prefix = max_prefix + 1
-        prefix_str = f"{next_prefix:02d}"
-        
-        # Get the title from the file (remove extension)
-        title = file_path.stem
-        # Remove YouTube ID patterns
-        title = re.sub(r'\[.*?\]', '', title).strip()
-        
-        # Create new filename
-        new_name = f"{prefix_str}_{title}.mp3"
-        new_path = audio_dir / new_name
-        
-        # Rename the file
-        if file_path != new_path:
-            # Handle case where target already exists
-            counter = 1
-            while new_path.exists() and new_path != file_path:
-                new_name = f"{prefix_str}_{title}_{counter}.mp3"
-                new_path = audio_dir / new_name
-                counter += 1
-            
-            file_path.rename(new_path)
-            print(f"Renamed downloaded file: {file_path.name} -> {new_name}")
-        
-        return new_path
-    
     def regenerate_playlist(self):
-        """Regenerate the playlist.json file"""
-        try:
-            # Import and call the playlist generator function
-            import importlib.util
-            spec = importlib.util.spec_from_file_location("generate_playlist", "generate_playlist.py")
-            generate_playlist_module = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(generate_playlist_module)
-            generate_playlist_module.generate_playlist()
-        except Exception as e:
-            print(f"Error regenerating playlist: {e}")
+        """Regenerate playlist.json and wait (a while) until it includes our change.
+
+        Returns False if the rebuild didn't finish within PLAYLIST_UPDATE_TIMEOUT;
+        it still completes in the background.
+        """
+        ticket = playlist_rebuilder.request()
+        return playlist_rebuilder.wait(ticket, PLAYLIST_UPDATE_TIMEOUT)
 
     def send_json_response(self, status_code, data):
         """Send JSON response"""
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
         self.send_response(status_code)
         self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
         self.end_headers()
-        self.wfile.write(json.dumps(data).encode('utf-8'))
+        if self.command != 'HEAD':
+            self.wfile.write(body)
 
     def send_error_response(self, status_code, message):
         """Send error response"""
@@ -473,28 +1812,300 @@ class MyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
 
     def log_message(self, format, *args):
         """Override to customize logging"""
-        # Only log errors and important messages
-        if '404' not in format % args:
-            super().log_message(format, *args)
+        # Only log errors and important messages (idle keep-alive
+        # connections timing out is routine)
+        message = format % args
+        if '404' not in message and not message.startswith('Request timed out'):
+            super().log_message('%s', message)
+
+def start_profiler(interval, threshold):
+    """Enable --profile; SIGUSR1 writes the profile gathered so far to profiles/"""
+    global profiler
+    profiler = sampling_profiler.SamplingProfiler(interval, threshold)
+    profiler.start()
+
+    def dump_profile(signum, frame):
+        paths = profiler.dump()
+        print(f"Profile written to {', '.join(paths)} ({profiler.summary()})")
+
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, dump_profile)
+    print(f"Profiling requests slower than {threshold * 1000:g} ms, "
+          f"sampling every {interval * 1000:g} ms (GET /api/profile, kill -USR1 {os.getpid()})")
+
+class StartupReport:
+    """How long each startup phase took, for the "Startup:" log line.
+
+    The time to the first completed request is logged once, when it happens.
+    """
+
+    def __init__(self, started):
+        self.started = started
+        self.last = started
+        self.phases = []
+        self.first_request_seen = False
+        self.lock = threading.Lock()
+
+    def mark(self, phase):
+        """End the running phase, naming it `phase`"""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def summary(self):
+        phases = ', '.join(f'{phase} {seconds * 1000:.0f} ms' for phase, seconds in self.phases)
+        return f"{phases} (total {(self.last - self.started) * 1000:.0f} ms)"
+
+    def request_served(self):
+        with self.lock:
+            if self.first_request_seen:
+                return
+            self.first_request_seen = True
+        print(f"First request served {(time.perf_counter() - self.started) * 1000:.0f} ms "
+              f"after start")
+
+
+startup = StartupReport(MODULE_STARTED)
+
+
+def start_background_tasks(watch=True):
+    """Finish starting up in a thread, once the server is accepting requests.
+
+    Drops old partial downloads, starts the audio/ watcher (when `watch`)
+    and probes yt-dlp, none of which the first requests need.
+    """
+    def run():
+        report = StartupReport(time.perf_counter())
+        # Drop partial downloads abandoned long ago (recent ones can be resumed)
+        download_log.cleanup_orphans('audio')
+        report.mark('cleanup')
+        if watch:
+            # Keep players in sync with audio/ as tracks come and go
+            backend = AudioWatcher('audio', playlist_rebuilder.request).start()
+            report.mark('watcher')
+            print(f"Watching audio/ for new tracks ({backend})")
+        version = ytdlp_version()
+        report.mark('yt-dlp probe')
+        if version:
+            print(f"Using yt-dlp {version}")
+        else:
+            print("WARNING: yt-dlp is not installed, downloads won't work!")
+            print("Please install it with: pip3 install yt-dlp")
+        print(f"Background startup: {report.summary()}")
+
+    threading.Thread(target=run, name='startup', daemon=True).start()
+
+def open_browser(url):
+    """Open the player in a background thread; requests are served meanwhile"""
+    def run():
+        import webbrowser
+        webbrowser.open(url)
+
+    threading.Thread(target=run, daemon=True).start()
+
+def close_streams():
+    """End the responses that never finish on their own (playlist events,
+    radio), so a stopping worker doesn't wait SHUTDOWN_GRACE for them"""
+    live_playlist.close()
+    radio_station.buffer.close()
+
+
+class ReusePortServer(socketserver.ThreadingTCPServer):
+    """Threaded server that several worker processes bind to the same port.
+
+    With SO_REUSEPORT the kernel spreads incoming connections across them.
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def server_bind(self):
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+def run_worker(number, args):
+    """Serve PORT from a pre-forked worker until the supervisor sends SIGTERM"""
+    global supervisor_pid
+    supervisor_pid = os.getppid()
+    # Ctrl+C reaches the whole process group: let the supervisor handle it
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Another worker rebuilt the playlist: tell our own players
+    signal.signal(signal.SIGHUP, lambda signum, frame: threading.Thread(
+        target=live_playlist.reload, daemon=True).start())
+
+    if args.profile:
+        start_profiler(args.profile_interval / 1000, args.profile_threshold / 1000)
+    live_playlist.reload()
+    startup.mark('playlist')
+
+    with ReusePortServer(("", PORT), MyHTTPRequestHandler) as httpd:
+        def stop(signum, frame):
+            # shutdown() waits for serve_forever(), which runs in this thread
+            threading.Thread(target=httpd.shutdown, daemon=True).start()
+
+        signal.signal(signal.SIGTERM, stop)
+        startup.mark('bind')
+        print(f"Worker {number} started (pid {os.getpid()}), startup: {startup.summary()}")
+        if number == 0:
+            # One watcher (and yt-dlp probe) is enough; its playlist
+            # rebuilds reach the others through SIGHUP
+            start_background_tasks()
+        httpd.serve_forever()
+        # New connections now go to the remaining workers
+        httpd.server_close()
+        close_streams()
+        if not in_flight.drain(SHUTDOWN_GRACE):
+            print(f"Worker {number}: {in_flight.count} request(s) still running, closing anyway")
+
+class Supervisor:
+    """Keeps `count` pre-forked workers serving; restarts those that die.
+
+    SIGINT/SIGTERM stop the workers gracefully (SIGKILL after a grace
+    period); SIGHUP and SIGUSR1 are relayed to every worker.
+    """
+
+    def __init__(self, count, target):
+        self.count = count
+        self.target = target
+        self.workers = {}  # pid -> (worker number, start time)
+
+    def spawn(self, number):
+        sys.stdout.flush()
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                self.target(number)
+                code = 0
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+        self.workers[pid] = (number, time.monotonic())
+
+    def relay(self, signum, frame):
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    @staticmethod
+    def interrupt(signum, frame):
+        raise KeyboardInterrupt
+
+    def run(self, on_started=None):
+        signal.signal(signal.SIGHUP, self.relay)
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, self.relay)
+        signal.signal(signal.SIGTERM, self.interrupt)
+        try:
+            for number in range(self.count):
+                self.spawn(number)
+            if on_started:
+                on_started()
+            while True:
+                pid, status = os.wait()
+                number, started = self.workers.pop(pid, (None, 0))
+                if number is None:
+                    continue
+                print(f"Worker {number} (pid {pid}) exited with status "
+                      f"{os.waitstatus_to_exitcode(status)}, restarting it")
+                if time.monotonic() - started < WORKER_MIN_UPTIME:
+                    # Don't spin if it dies right away (e.g. the port is taken)
+                    time.sleep(WORKER_RESTART_DELAY)
+                self.spawn(number)
+        except KeyboardInterrupt:
+            self.stop()
+
+    def stop(self):
+        print("\nStopping workers...")
+        self.relay(signal.SIGTERM, None)
+        deadline = time.monotonic() + SHUTDOWN_GRACE + 5
+        try:
+            while self.workers and time.monotonic() < deadline:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+                if pid:
+                    self.workers.pop(pid, None)
+                else:
+                    time.sleep(0.1)
+        except KeyboardInterrupt:
+            pass
+        for pid in list(self.workers):
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        print("Server stopped.")
 
 def main():
+    parser = argparse.ArgumentParser(description='Run the audio player server.')
+    parser.add_argument('--max-rate', type=float, metavar='KBPS',
+                        help='cap total audio bandwidth (KB/s)')
+    parser.add_argument('--client-rate', type=float, metavar='KBPS',
+                        help='cap audio bandwidth per client (KB/s)')
+    parser.add_argument('--profile', action='store_true',
+                        help='sample request handler stacks (see /api/profile, SIGUSR1)')
+    parser.add_argument('--profile-interval', type=float, default=10, metavar='MS',
+                        help='sampling interval (default: 10 ms)')
+    parser.add_argument('--profile-threshold', type=float, default=0, metavar='MS',
+                        help='only keep samples of requests slower than this (default: all)')
+    parser.add_argument('--workers', type=int, default=1, metavar='N',
+                        help='serve from N processes sharing the port (default: 1)')
+    startup.mark('imports')
+    args = parser.parse_args()
+
     os.chdir(os.path.dirname(os.path.abspath(__file__)))
     
-    # Check if yt-dlp is installed
-    try:
-        subprocess.run([sys.executable, '-m', 'yt_dlp', '--version'], 
-                      capture_output=True, check=True)
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        print("ERROR: yt-dlp is not installed!")
-        print("Please install it with: pip3 install yt-dlp")
-        sys.exit(1)
+    if args.workers > 1 and not (hasattr(socket, 'SO_REUSEPORT') and hasattr(os, 'fork')):
+        print("--workers needs SO_REUSEPORT and fork(), which this system lacks: "
+              "running a single process")
+        args.workers = 1
+    
+    if args.max_rate or args.client_rate:
+        global_rate = args.max_rate * 1024 if args.max_rate else GLOBAL_RATE_LIMIT
+        if global_rate and args.workers > 1:
+            # Each worker enforces its share of the total
+            global_rate /= args.workers
+        bandwidth_limiter.configure(
+            global_rate,
+            args.client_rate * 1024 if args.client_rate else CLIENT_RATE_LIMIT,
+            ROUTE_RATE_LIMITS)
+    
+    startup.mark('setup')
+    url = f"http://localhost:{PORT}/index.html"
     
-    with socketserver.TCPServer(("", PORT), MyHTTPRequestHandler) as httpd:
-        url = f"http://localhost:{PORT}/index.html"
+    if args.workers > 1:
+        # Workers don't share memory: split the proxy block cache between them
+        proxy_blocks.capacity = PROXY_CACHE_SIZE // args.workers
+        
+        def started():
+            print(f"Server running at {url} with {args.workers} worker processes")
+            print("Press Ctrl+C to stop the server")
+            print("\nOpening browser...")
+            # Not from a thread: the supervisor forks replacement workers
+            import webbrowser
+            webbrowser.open(url)
+        
+        Supervisor(args.workers, lambda number: run_worker(number, args)).run(started)
+        return
+    
+    if args.profile:
+        start_profiler(args.profile_interval / 1000, args.profile_threshold / 1000)
+    
+    live_playlist.reload()
+    startup.mark('playlist')
+    
+    # Threads let concurrent listeners share upstream transfers
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    socketserver.ThreadingTCPServer.daemon_threads = True
+    with socketserver.ThreadingTCPServer(("", PORT), MyHTTPRequestHandler) as httpd:
+        startup.mark('bind')
         print(f"Server running at {url}")
+        print(f"Startup: {startup.summary()}")
         print("Press Ctrl+C to stop the server")
+        start_background_tasks()
         print("\nOpening browser...")
-        webbrowser.open(url)
+        open_browser(url)
         try:
             httpd.serve_forever()
         except KeyboardInterrupt:
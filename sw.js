@@ -0,0 +1,331 @@
+// Offline cache for the KPOP Music Player.
+//
+// Tracks the player has played or favorited are stored whole in Cache
+// Storage and served from there (range requests included), so replays
+// cost no network at all. A played track is kept from the response the
+// player itself downloads when that covers the whole file; otherwise the
+// page asks for a copy once playback has ended. precache.json (written by the playlist tools,
+// served live by server.py) gives each track's content hash: a cached
+// copy is dropped when its hash changes or it leaves the playlist,
+// and nothing else is touched. Copies are evicted least recently used
+// first, non-favorites before favorites, to stay under CACHE_BUDGET.
+
+const AUDIO_CACHE = 'kpop-audio-v1';
+const SHELL_CACHE = 'kpop-shell-v1';
+const META_CACHE = 'kpop-meta-v1';
+const META_KEY = '/__sw/meta.json';
+const MANIFEST_URL = 'precache.json';
+const CACHE_BUDGET = 200 * 1024 * 1024;
+
+// App shell, refreshed from the network whenever it is reachable
+const SHELL_URLS = [
+    './',
+    'index.html',
+    'styles.css',
+    'favicon.svg',
+    'playlist.json?format=2',
+    'https://cdn.jsdelivr.net/npm/howler@2.2.4/dist/howler.min.js'
+];
+
+self.addEventListener('install', event => {
+    event.waitUntil(
+        caches.open(SHELL_CACHE)
+            .then(cache => Promise.all(SHELL_URLS.map(url =>
+                fetch(url, { mode: 'no-cors' })
+                    .then(response => cache.put(new URL(url, self.registration.scope).href, response))
+                    .catch(() => {}))))
+            .then(() => self.skipWaiting())
+    );
+});
+
+self.addEventListener('activate', event => {
+    event.waitUntil(
+        self.clients.claim().then(() => syncManifest()).catch(() => {})
+    );
+});
+
+// ---- metadata: {version, tracks: {key: {hash, size, lastUsed, favorite}}} ----
+
+// Metadata updates are chained so concurrent events never lose a write
+let metaQueue = Promise.resolve();
+
+function updateMeta(change) {
+    const run = metaQueue.then(async () => {
+        const cache = await caches.open(META_CACHE);
+        const stored = await cache.match(META_KEY);
+        const meta = stored ? await stored.json() : { version: null, tracks: {} };
+        const result = await change(meta);
+        await cache.put(META_KEY, new Response(JSON.stringify(meta), {
+            headers: { 'Content-Type': 'application/json' }
+        }));
+        return result;
+    });
+    metaQueue = run.catch(() => {});
+    return run;
+}
+
+// Cache key of a track URL: the release URL behind /api/proxy, else the absolute URL
+function trackKey(url) {
+    const parsed = new URL(url, self.registration.scope);
+    if (parsed.pathname.endsWith('/api/proxy')) {
+        const target = parsed.searchParams.get('url');
+        return target ? new URL(target).href : null;
+    }
+    return parsed.href;
+}
+
+let manifest = null; // {version, tracks: Map(key -> {url, hash, size})}
+
+async function loadManifest(response) {
+    const data = await response.json();
+    manifest = {
+        version: data.version,
+        tracks: new Map(data.tracks.map(track => [trackKey(track.url), track]))
+    };
+    return manifest;
+}
+
+// Fetch the latest manifest and drop the cached copies it invalidates
+async function syncManifest() {
+    let response;
+    try {
+        response = await fetch(MANIFEST_URL, { cache: 'no-cache' });
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+    } catch (error) {
+        if (!manifest) {
+            // Offline: keep serving against the last manifest we saw
+            response = await caches.match(MANIFEST_URL, { cacheName: META_CACHE });
+            if (response) await loadManifest(response);
+        }
+        return;
+    }
+    const metaCache = await caches.open(META_CACHE);
+    await metaCache.put(MANIFEST_URL, response.clone());
+    await loadManifest(response);
+
+    await updateMeta(async meta => {
+        if (meta.version === manifest.version) return;
+        const audio = await caches.open(AUDIO_CACHE);
+        for (const [key, entry] of Object.entries(meta.tracks)) {
+            const current = manifest.tracks.get(key);
+            if (!current || current.hash !== entry.hash) {
+                await audio.delete(key);
+                delete meta.tracks[key];
+            }
+        }
+        meta.version = manifest.version;
+    });
+}
+
+async function currentManifest() {
+    if (!manifest) await syncManifest();
+    return manifest;
+}
+
+// ---- storing tracks ----
+
+const storing = new Map(); // key -> promise, so a track is downloaded once
+
+async function storeTrack(url, favorite) {
+    const key = trackKey(url);
+    const known = await currentManifest();
+    const track = known && known.tracks.get(key);
+    if (!track) return;
+
+    const cached = await updateMeta(meta => {
+        const entry = meta.tracks[key];
+        if (entry && entry.hash === track.hash) {
+            entry.lastUsed = Date.now();
+            entry.favorite = entry.favorite || favorite;
+            return true;
+        }
+        return false;
+    });
+    if (cached || storing.has(key)) return;
+    if (track.size && track.size > CACHE_BUDGET) return;
+
+    await saveTrack(key, track, favorite, (async () => {
+        const response = await fetch(new URL(url, self.registration.scope).href);
+        return response.status === 200 ? response : null;
+    })());
+}
+
+// Store the body of a whole-file response (or of a promise for one) under key
+async function saveTrack(key, track, favorite, responsePromise) {
+    const download = (async () => {
+        const response = await responsePromise;
+        if (!response) return;
+        const blob = await response.blob();
+        const audio = await caches.open(AUDIO_CACHE);
+        await audio.put(key, new Response(blob, {
+            headers: {
+                'Content-Type': response.headers.get('Content-Type') || 'audio/mpeg',
+                'Content-Length': String(blob.size)
+            }
+        }));
+        await updateMeta(async meta => {
+            meta.tracks[key] = {
+                hash: track.hash,
+                size: blob.size,
+                lastUsed: Date.now(),
+                favorite: favorite || Boolean(meta.tracks[key] && meta.tracks[key].favorite)
+            };
+            await evict(meta, audio);
+        });
+    })();
+    storing.set(key, download);
+    try {
+        await download;
+    } finally {
+        storing.delete(key);
+    }
+}
+
+// True if a response to the player carries the whole file
+function isWholeFile(response) {
+    if (response.status === 200) return true;
+    if (response.status !== 206) return false;
+    const match = /^bytes 0-(\d+)\/(\d+)$/.exec(response.headers.get('Content-Range') || '');
+    return Boolean(match) && Number(match[1]) + 1 === Number(match[2]);
+}
+
+// Fetch a track for the player, keeping a copy of the body as it streams by
+async function fetchAndKeep(event, key) {
+    const response = await fetch(event.request);
+    const track = manifest && manifest.tracks.get(key);
+    if (track && !storing.has(key) && isWholeFile(response) &&
+            !(track.size && track.size > CACHE_BUDGET)) {
+        event.waitUntil(saveTrack(key, track, false, Promise.resolve(response.clone()))
+            .catch(error => console.warn('Service worker: cache', error)));
+    }
+    return response;
+}
+
+// Drop least recently used copies (non-favorites first) until under budget
+async function evict(meta, audio) {
+    const entries = Object.entries(meta.tracks);
+    let total = entries.reduce((sum, [, entry]) => sum + entry.size, 0);
+    entries.sort(([, a], [, b]) => (a.favorite - b.favorite) || (a.lastUsed - b.lastUsed));
+    for (const [key, entry] of entries) {
+        if (total <= CACHE_BUDGET) break;
+        await audio.delete(key);
+        delete meta.tracks[key];
+        total -= entry.size;
+    }
+}
+
+function setFavorite(url, favorite) {
+    const key = trackKey(url);
+    return updateMeta(meta => {
+        if (meta.tracks[key]) meta.tracks[key].favorite = favorite;
+    });
+}
+
+self.addEventListener('message', event => {
+    const { type, url, favorite } = event.data || {};
+    let work;
+    if (type === 'sync') {
+        work = syncManifest();
+    } else if (type === 'cache') {
+        work = storeTrack(url, Boolean(favorite));
+    } else if (type === 'unfavorite') {
+        work = setFavorite(url, false);
+    }
+    if (work) {
+        event.waitUntil(work.catch(error => console.warn('Service worker:', type, error)));
+    }
+});
+
+// ---- serving ----
+
+// Answer a (possibly ranged) request from a whole cached body
+async function respondFromCache(request, cached) {
+    const blob = await cached.blob();
+    const type = cached.headers.get('Content-Type') || 'audio/mpeg';
+    const match = /^bytes=(\d*)-(\d*)$/.exec((request.headers.get('Range') || '').trim());
+    if (!match || (match[1] === '' && match[2] === '')) {
+        return new Response(blob, {
+            status: 200,
+            headers: { 'Content-Type': type, 'Content-Length': String(blob.size), 'Accept-Ranges': 'bytes' }
+        });
+    }
+    let start, end;
+    if (match[1] === '') {
+        // Suffix range: the last N bytes
+        start = Math.max(blob.size - Number(match[2]), 0);
+        end = blob.size - 1;
+    } else {
+        start = Number(match[1]);
+        end = match[2] === '' ? blob.size - 1 : Math.min(Number(match[2]), blob.size - 1);
+    }
+    if (start > end || start >= blob.size) {
+        return new Response(null, { status: 416, headers: { 'Content-Range': `bytes */${blob.size}` } });
+    }
+    return new Response(blob.slice(start, end + 1), {
+        status: 206,
+        headers: {
+            'Content-Type': type,
+            'Content-Length': String(end - start + 1),
+            'Content-Range': `bytes ${start}-${end}/${blob.size}`,
+            'Accept-Ranges': 'bytes'
+        }
+    });
+}
+
+async function handleAudio(event, key) {
+    const audio = await caches.open(AUDIO_CACHE);
+    const cached = await audio.match(key);
+    if (!cached) return fetchAndKeep(event, key);
+    const known = manifest && manifest.tracks.get(key);
+    const fresh = await updateMeta(meta => {
+        const entry = meta.tracks[key];
+        if (!entry || (known && entry.hash !== known.hash)) return false;
+        entry.lastUsed = Date.now();
+        return true;
+    });
+    return fresh ? respondFromCache(event.request, cached) : fetchAndKeep(event, key);
+}
+
+// Network first, falling back to the cached shell when offline
+async function handleShell(request) {
+    try {
+        const response = await fetch(request);
+        if (response.ok || response.type === 'opaque') {
+            const cache = await caches.open(SHELL_CACHE);
+            await cache.put(shellKey(request), response.clone());
+        }
+        return response;
+    } catch (error) {
+        const cached = await caches.match(shellKey(request), { cacheName: SHELL_CACHE });
+        if (cached) return cached;
+        throw error;
+    }
+}
+
+// The playlist is requested with a cache-busting parameter; store it under one key
+function shellKey(request) {
+    const url = new URL(request.url);
+    if (url.pathname.endsWith('/playlist.json')) {
+        return new URL('playlist.json?format=2', self.registration.scope).href;
+    }
+    if (request.mode === 'navigate') {
+        return new URL('./', self.registration.scope).href;
+    }
+    return request.url;
+}
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    if (request.method !== 'GET') return;
+    const url = new URL(request.url);
+
+    if (url.pathname.endsWith('/api/proxy') || /\.(mp3|m4a|ogg|wav|flac)$/i.test(url.pathname)) {
+        const key = trackKey(request.url);
+        if (key) event.respondWith(handleAudio(event, key));
+        return;
+    }
+    if (request.mode === 'navigate' || SHELL_URLS.some(shellUrl =>
+            shellKey(request) === new URL(shellUrl, self.registration.scope).href)) {
+        event.respondWith(handleShell(request));
+    }
+});
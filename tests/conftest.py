@@ -0,0 +1,41 @@
+import os
+import socketserver
+import sys
+import threading
+
+import pytest
+
+# The modules live at the repository root, next to this folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz, no padding: 417-byte frames
+FRAME_HEADER = b'\xff\xfb\x90\x00'
+FRAME_LENGTH = 417
+
+
+def mp3_data(frames=10, payload=b'\x00'):
+    """Bytes of `frames` valid MP3 frames; payload tells different files apart"""
+    body = (payload * FRAME_LENGTH)[:FRAME_LENGTH - len(FRAME_HEADER)]
+    return (FRAME_HEADER + body) * frames
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Run in an empty directory (catalog.db and friends are relative paths)"""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'audio').mkdir()
+    return tmp_path
+
+
+@pytest.fixture
+def local_server(monkeypatch):
+    """Port of a server.py handler on a free port, serving the repository"""
+    import server
+    monkeypatch.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    monkeypatch.setattr(server, 'SSE_KEEPALIVE', 0.05)
+    httpd = socketserver.ThreadingTCPServer(('127.0.0.1', 0), server.MyHTTPRequestHandler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True).start()
+    yield httpd.server_address[1]
+    httpd.shutdown()
+    httpd.server_close()
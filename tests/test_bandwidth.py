@@ -0,0 +1,46 @@
+import pytest
+
+import server
+from server import BandwidthLimiter, TokenBucket
+
+
+def test_bucket_refills_up_to_its_burst():
+    bucket = TokenBucket(rate=100, burst=50)
+    bucket.tokens = 0
+    bucket.refill(bucket.updated + 0.2)
+    assert bucket.tokens == pytest.approx(20)
+    bucket.refill(bucket.updated + 10)
+    assert bucket.tokens == 50
+
+
+def test_shortfall_and_debt():
+    bucket = TokenBucket(rate=100)
+    bucket.tokens = 30
+    assert bucket.shortfall(20) == 0
+    assert bucket.shortfall(80) == pytest.approx(0.5)
+    # Never asks for more than the bucket can hold
+    assert bucket.shortfall(10_000) == pytest.approx(0.7)
+    bucket.tokens = -50
+    assert bucket.debt_delay() == pytest.approx(0.5)
+
+
+def test_disabled_limiter_never_sleeps(monkeypatch):
+    monkeypatch.setattr(server.time, 'sleep', lambda seconds: pytest.fail('slept'))
+    BandwidthLimiter().throttle('client', 'audio', 10 ** 9, playback=False)
+
+
+def test_playback_overdraws_and_sleeps_off_the_debt(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(server.time, 'sleep', sleeps.append)
+    limiter = BandwidthLimiter(client_rate=1000)
+    limiter.throttle('client', 'audio', 3000, playback=True)
+    assert sleeps == [pytest.approx(2, abs=0.01)]
+
+
+def test_clients_have_separate_buckets(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(server.time, 'sleep', sleeps.append)
+    limiter = BandwidthLimiter(client_rate=1000)
+    limiter.throttle('a', 'audio', 1000, playback=False)
+    limiter.throttle('b', 'audio', 1000, playback=False)
+    assert sleeps == []
@@ -0,0 +1,135 @@
+import os
+
+import catalog
+from conftest import mp3_data
+
+
+def write_track(audio_dir, name, payload=b'\x00', mtime=None):
+    path = audio_dir / name
+    path.write_bytes(mp3_data(payload=payload))
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_title_strips_two_digit_prefix_and_video_id():
+    assert catalog.title_from_filename('07_Golden.mp3') == 'Golden'
+    assert catalog.title_from_filename('Soda Pop [abcdefghijk].mp3') == 'Soda Pop'
+
+
+def test_title_keeps_longer_numbers_that_are_part_of_it():
+    assert catalog.title_from_filename('1979_Smashing.mp3') == '1979_Smashing'
+    assert catalog.title_from_filename('2024_Recap [abcdefghijk].mp3') == '2024_Recap'
+
+
+def test_release_asset_key_matches_github_renaming():
+    assert (catalog.release_asset_key('01_Golden (Cover) 🎧.mp3')
+            == catalog.release_asset_key('01_Golden.Cover.mp3'))
+
+
+def test_sync_appends_new_files_oldest_first(workdir):
+    audio = workdir / 'audio'
+    write_track(audio, 'Second.mp3', b'\x02', mtime=2000)
+    write_track(audio, 'First.mp3', b'\x01', mtime=1000)
+    tracks = catalog.sync_catalog(audio)
+    assert [track['title'] for track in tracks] == ['First', 'Second']
+    assert tracks[0]['duration'] == round(10 * 1152 / 44100, 3)
+
+
+def test_sync_keeps_id_and_position_across_renames(workdir):
+    audio = workdir / 'audio'
+    write_track(audio, 'A.mp3', b'\x01', mtime=1000)
+    write_track(audio, 'B.mp3', b'\x02', mtime=2000)
+    before = catalog.sync_catalog(audio)
+    os.rename(audio / 'A.mp3', audio / 'Renamed.mp3')
+    after = catalog.sync_catalog(audio)
+    assert [track['file'] for track in after] == ['Renamed.mp3', 'B.mp3']
+    assert after[0]['id'] == before[0]['id']
+
+
+def test_sync_drops_removed_files(workdir):
+    audio = workdir / 'audio'
+    write_track(audio, 'A.mp3', b'\x01')
+    write_track(audio, 'B.mp3', b'\x02')
+    catalog.sync_catalog(audio)
+    os.remove(audio / 'A.mp3')
+    assert [track['file'] for track in catalog.sync_catalog(audio)] == ['B.mp3']
+
+
+def test_identical_audio_under_two_names_gets_distinct_ids(workdir):
+    audio = workdir / 'audio'
+    write_track(audio, 'Copy 1.mp3', mtime=1000)
+    write_track(audio, 'Copy 2.mp3', mtime=2000)
+    first, second = catalog.sync_catalog(audio)
+    assert first['id'] != second['id']
+    assert second['id'] == first['id'] + '-2'
+    # Stable across syncs
+    assert [track['id'] for track in catalog.sync_catalog(audio)] == [first['id'], second['id']]
+
+
+def test_add_track_does_not_reuse_an_existing_id(workdir):
+    audio = workdir / 'audio'
+    write_track(audio, 'Original.mp3')
+    catalog.sync_catalog(audio)
+    catalog.add_track(write_track(audio, 'Duplicate.mp3'))
+    ids = [track['id'] for track in catalog.list_tracks()]
+    assert len(set(ids)) == 2
+
+
+def test_unique_track_path_avoids_clashes(tmp_path):
+    (tmp_path / 'Song.mp3').write_bytes(b'')
+    assert catalog.unique_track_path(tmp_path, 'Song').name == 'Song_1.mp3'
+
+
+def test_databases_from_before_video_ids_are_migrated(workdir):
+    import sqlite3
+    db = sqlite3.connect(catalog.CATALOG_DB)
+    db.executescript("""
+        CREATE TABLE tracks (file TEXT PRIMARY KEY, id TEXT NOT NULL, title TEXT NOT NULL,
+                             position INTEGER NOT NULL, size INTEGER NOT NULL, mtime REAL NOT NULL,
+                             duration REAL, asset_url TEXT, asset_key TEXT NOT NULL);
+        INSERT INTO tracks VALUES ('Old.mp3', 'abc', 'Old', 0, 10, 1.0, 2.5, NULL, 'old.mp3');
+    """)
+    db.close()
+    assert catalog.list_tracks() == [{'id': 'abc', 'file': 'Old.mp3', 'title': 'Old', 'size': 10,
+                                      'mtime': 1.0, 'duration': 2.5, 'asset_url': None,
+                                      'video_id': None}]
+    write_track(workdir / 'audio', 'New.mp3')
+    catalog.add_track(workdir / 'audio' / 'New.mp3', video_id='abcdefghijk')
+    assert catalog.list_video_ids() == {'abcdefghijk': 'New.mp3'}
+    assert catalog.list_integrity()['Old.mp3'] == (10, 1.0, None)
+
+
+def test_files_are_read_outside_the_write_transaction(workdir, monkeypatch):
+    import sqlite3
+    write_track(workdir / 'audio', 'A.mp3')
+    catalog.sync_catalog(workdir / 'audio')  # creates the database
+    write_track(workdir / 'audio', 'B.mp3', payload=b'b')
+    scan_track = catalog.scan_track
+
+    def scan_while_writing(path):
+        # Another writer (a download's add_track) gets the lock right away
+        db = sqlite3.connect(catalog.CATALOG_DB, timeout=0.1, isolation_level=None)
+        db.execute('BEGIN IMMEDIATE')
+        db.execute('ROLLBACK')
+        db.close()
+        return scan_track(path)
+
+    monkeypatch.setattr(catalog, 'scan_track', scan_while_writing)
+    tracks = catalog.sync_catalog(workdir / 'audio')
+    assert [track['file'] for track in tracks] == ['A.mp3', 'B.mp3']
+
+
+def test_download_synced_before_import_keeps_its_row(workdir):
+    audio = workdir / 'audio'
+    write_track(audio, 'First.mp3', payload=b'1')
+    write_track(audio, 'Song [abcdefghijk].mp3', payload=b's')
+    before = {track['file']: track for track in catalog.sync_catalog(audio)}
+    tagged = before['Song [abcdefghijk].mp3']
+
+    catalog.import_download(audio / 'Song [abcdefghijk].mp3')
+    tracks = catalog.list_tracks()
+    assert [track['file'] for track in tracks] == ['First.mp3', 'Song.mp3']
+    assert tracks[1]['id'] == tagged['id'] and '-' not in tracks[1]['id']
+    assert tracks[1]['video_id'] == 'abcdefghijk'
+    assert catalog.sync_catalog(audio) == tracks
@@ -0,0 +1,54 @@
+import catalog
+import check_audio
+from conftest import mp3_data
+
+
+def scan(tmp_path, data):
+    path = tmp_path / 'track.mp3'
+    path.write_bytes(data)
+    return check_audio.scan_file(path)
+
+
+def test_clean_file_passes(tmp_path):
+    result = scan(tmp_path, mp3_data(20) + b'TAG' + b'\x00' * 125)
+    assert result['ok'] and result['frames'] == 20
+
+
+def test_a_few_stray_bytes_are_tolerated(tmp_path):
+    assert scan(tmp_path, mp3_data(10) + b'\x00\x00\x00' + mp3_data(10))['ok']
+
+
+def test_garbage_between_frames_fails(tmp_path):
+    result = scan(tmp_path, mp3_data(10) + b'\x00' * 2000 + mp3_data(10))
+    assert not result['ok'] and 'garbage' in result['issues'][0]
+
+
+def test_truncated_last_frame_fails_however_short(tmp_path):
+    result = scan(tmp_path, mp3_data(21)[:-300])
+    assert not result['ok'] and result['issues'][0].startswith('truncated')
+
+
+def test_too_few_frames_fails(tmp_path):
+    assert not scan(tmp_path, mp3_data(3))['ok']
+
+
+def test_results_are_stored_in_the_catalog(workdir, monkeypatch):
+    audio = workdir / 'audio'
+    (audio / 'Good.mp3').write_bytes(mp3_data(20))
+    assert check_audio.find_bad_tracks(audio) == {}
+    size, mtime, result = catalog.list_integrity()['Good.mp3']
+    assert result['ok'] and size == len(mp3_data(20))
+
+    scanned = []
+    monkeypatch.setattr(check_audio, 'scan_file', lambda path: scanned.append(path))
+    check_audio.scan_library(audio)
+    assert scanned == []
+
+
+def test_changed_files_are_scanned_again(workdir):
+    audio = workdir / 'audio'
+    path = audio / 'Song.mp3'
+    path.write_bytes(mp3_data(20))
+    assert check_audio.find_bad_tracks(audio) == {}
+    path.write_bytes(mp3_data(20)[:-100])
+    assert list(check_audio.find_bad_tracks(audio)) == ['Song.mp3']
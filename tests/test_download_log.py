@@ -0,0 +1,149 @@
+import json
+import os
+import sys
+
+import pytest
+
+import catalog
+import download_log
+from conftest import mp3_data
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(workdir, monkeypatch):
+    monkeypatch.setattr(download_log, 'RETRY_BASE_DELAY', 0)
+
+
+def fake_ytdlp(script):
+    """A yt-dlp stand-in running `script`"""
+    return [sys.executable, '-c', script]
+
+
+def attempts(url):
+    with open(download_log.DOWNLOAD_LOG_FILE, encoding='utf-8') as f:
+        return json.load(f)[url]['attempts']
+
+
+def test_run_reports_the_extracted_files():
+    script = ("print('[download] Destination: audio/A [aaaaaaaaaaa].webm');"
+              "print('[ExtractAudio] Destination: audio/A [aaaaaaaaaaa].mp3');"
+              "print('[download] Destination: audio/B [bbbbbbbbbbb].mp3')")
+    returncode, _, files, timed_out = download_log.run_ytdlp(fake_ytdlp(script), None)
+    assert returncode == 0 and not timed_out
+    assert files == ['audio/A [aaaaaaaaaaa].mp3', 'audio/B [bbbbbbbbbbb].mp3']
+
+
+def test_permanent_errors_are_not_retried():
+    url = 'https://www.youtube.com/watch?v=abcdefghijk'
+    script = "print('ERROR: [youtube] abcdefghijk: Video unavailable'); raise SystemExit(1)"
+    files, error = download_log.run_ytdlp_with_retries(url, fake_ytdlp(script), None)
+    assert files == [] and 'Video unavailable' in error
+    assert [attempt['outcome'] for attempt in attempts(url)] == ['error']
+
+
+def test_transient_failures_are_retried(workdir):
+    url = 'https://www.youtube.com/watch?v=abcdefghijk'
+    script = ("import os\n"
+              "if not os.path.exists('tried'):\n"
+              "    open('tried', 'w').close()\n"
+              "    print('ERROR: Connection reset by peer'); raise SystemExit(1)\n"
+              "print('[download] Destination: audio/A.mp3')")
+    retries = []
+    files, error = download_log.run_ytdlp_with_retries(
+        url, fake_ytdlp(script), None, on_retry=lambda *args: retries.append(args))
+    assert error is None and files == ['audio/A.mp3']
+    assert retries == [(2, 0)]
+    assert [attempt['outcome'] for attempt in attempts(url)] == ['error', 'completed']
+
+
+def test_attempts_time_out(monkeypatch):
+    monkeypatch.setattr(download_log, 'DOWNLOAD_TIMEOUT', 0.2)
+    monkeypatch.setattr(download_log, 'DOWNLOAD_ATTEMPTS', 2)
+    url = 'https://www.youtube.com/watch?v=abcdefghijk'
+    files, error = download_log.run_ytdlp_with_retries(
+        url, fake_ytdlp('import time; time.sleep(30)'), None)
+    assert 'timeout' in error
+    assert [attempt['outcome'] for attempt in attempts(url)] == ['timeout', 'timeout']
+
+
+def test_an_exception_still_finishes_the_attempt():
+    url = 'https://www.youtube.com/watch?v=abcdefghijk'
+
+    def broken(line):
+        raise RuntimeError('progress callback failed')
+
+    with pytest.raises(RuntimeError):
+        download_log.run_ytdlp_with_retries(url, fake_ytdlp("print('hello')"), None, on_line=broken)
+    attempt, = attempts(url)
+    assert attempt['outcome'] == 'error' and 'ended' in attempt
+
+
+def test_cleanup_orphans_keeps_recent_partials(workdir):
+    audio = workdir / 'audio'
+    (audio / 'old.webm.part').write_bytes(b'x')
+    (audio / 'new.webm.part').write_bytes(b'x')
+    (audio / 'Song.mp3').write_bytes(b'x')
+    os.utime(audio / 'old.webm.part', (0, 0))
+    assert download_log.cleanup_orphans(audio) == ['old.webm.part']
+    assert sorted(path.name for path in audio.iterdir()) == ['Song.mp3', 'new.webm.part']
+
+
+@pytest.mark.parametrize('url, video_id', [
+    ('https://www.youtube.com/watch?v=abcdefghijk', 'abcdefghijk'),
+    ('https://youtube.com/watch?feature=share&v=abcdefghijk', 'abcdefghijk'),
+    ('https://m.youtube.com/watch?v=abcdefghijk&list=PL123', 'abcdefghijk'),
+    ('https://youtu.be/abcdefghijk?t=10', 'abcdefghijk'),
+    ('https://www.youtube.com/shorts/abcdefghijk', 'abcdefghijk'),
+    ('https://www.youtube.com/embed/abcdefghijk', 'abcdefghijk'),
+    ('https://www.youtube.com/playlist?list=PL123', None),
+    ('https://www.youtube.com/watch?v=short', None),
+    ('https://example.com/watch?v=abcdefghijk', None),
+    ('https://notyoutube.com/watch?v=abcdefghijk', None),
+])
+def test_youtube_video_id(url, video_id):
+    assert download_log.youtube_video_id(url) == video_id
+
+
+def test_playlists_are_bulk_imports():
+    assert download_log.is_bulk_import('https://www.youtube.com/playlist?list=PL123')
+    assert download_log.is_bulk_import('https://www.youtube.com/watch?v=abcdefghijk&list=PL123')
+    assert download_log.is_bulk_import('https://www.youtube.com/@channel')
+    assert not download_log.is_bulk_import('https://youtu.be/abcdefghijk')
+
+
+def test_existing_download_needs_its_file(workdir):
+    (workdir / 'audio' / 'Song [abcdefghijk].mp3').write_bytes(mp3_data())
+    [path] = download_log.import_downloads('https://youtu.be/abcdefghijk',
+                                           ['audio/Song [abcdefghijk].mp3'])
+    assert path.name == 'Song.mp3'
+    assert download_log.find_existing_download('https://youtu.be/abcdefghijk')['file'] == 'Song.mp3'
+    # Playlists are always handed to yt-dlp (with the archive)
+    assert download_log.find_existing_download(
+        'https://www.youtube.com/watch?v=abcdefghijk&list=PL123') is None
+    path.unlink()
+    assert download_log.find_existing_download('https://youtu.be/abcdefghijk') is None
+
+
+def test_import_touches_only_the_reported_files(workdir):
+    audio = workdir / 'audio'
+    (audio / 'A [aaaaaaaaaaa].mp3').write_bytes(mp3_data(payload=b'a'))
+    (audio / 'B [bbbbbbbbbbb].mp3').write_bytes(mp3_data(payload=b'b'))
+    (audio / 'Other [ccccccccccc].mp3').write_bytes(mp3_data(payload=b'c'))
+    url = 'https://www.youtube.com/playlist?list=PL123'
+    imported = download_log.import_downloads(
+        url, ['audio/A [aaaaaaaaaaa].mp3', 'audio/B [bbbbbbbbbbb].mp3'])
+    assert [path.name for path in imported] == ['A.mp3', 'B.mp3']
+    assert (audio / 'Other [ccccccccccc].mp3').exists()
+    assert catalog.list_video_ids() == {'aaaaaaaaaaa': 'A.mp3', 'bbbbbbbbbbb': 'B.mp3'}
+    with open(download_log.DOWNLOAD_LOG_FILE, encoding='utf-8') as f:
+        assert json.load(f)[url]['files'] == ['A.mp3', 'B.mp3']
+
+
+def test_unreported_single_video_is_found_by_its_tag(workdir):
+    audio = workdir / 'audio'
+    (audio / 'Song [abcdefghijk].mp3').write_bytes(mp3_data(payload=b'a'))
+    (audio / 'Newer [bbbbbbbbbbb].mp3').write_bytes(mp3_data(payload=b'b'))
+    [path] = download_log.import_downloads('https://youtu.be/abcdefghijk', [])
+    assert path.name == 'Song.mp3'
+    assert (audio / 'Newer [bbbbbbbbbbb].mp3').exists()
+    assert download_log.import_downloads('https://www.youtube.com/playlist?list=PL123', []) == []
@@ -0,0 +1,35 @@
+import threading
+import time
+
+from file_lock import FileLock
+
+
+def test_lock_is_exclusive_across_threads(tmp_path):
+    lock = FileLock(str(tmp_path / '.test.lock'))
+    inside = []
+    overlaps = []
+
+    def hold():
+        with lock:
+            inside.append(threading.get_ident())
+            time.sleep(0.02)
+            overlaps.append(len(inside) > 1)
+            inside.pop()
+
+    threads = [threading.Thread(target=hold) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert overlaps == [False] * 4
+    assert (tmp_path / '.test.lock').exists()
+
+
+def test_lock_is_released_after_an_error(tmp_path):
+    lock = FileLock(str(tmp_path / '.test.lock'))
+    try:
+        with lock:
+            raise ValueError
+    except ValueError:
+        pass
+    assert lock.thread_lock.acquire(blocking=False)
@@ -0,0 +1,57 @@
+import http.server
+import json
+import threading
+
+import pytest
+
+import fix_playlist_urls
+import playlist_format
+
+BASE = 'https://github.com/o/r/releases/download/v1/'
+
+
+class FakeRelease(http.server.BaseHTTPRequestHandler):
+    """Release v1 with one asset, whose digest can change between runs"""
+    digest = 'sha256:' + 'a' * 64
+
+    def do_GET(self):
+        if self.path == '/repos/o/r/releases/tags/v1':
+            data = {'id': 7}
+        else:
+            data = [{'id': 1, 'name': 'Golden.mp3', 'size': 10, 'digest': self.digest,
+                     'browser_download_url': BASE + 'Golden.mp3'}]
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def api_url(monkeypatch):
+    monkeypatch.setattr(fix_playlist_urls, 'GITHUB_REPO', 'o/r')
+    monkeypatch.setattr(fix_playlist_urls, 'RELEASE_TAG', 'v1')
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), FakeRelease)
+    threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True).start()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}'
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def precache_hashes():
+    with open(playlist_format.PRECACHE_FILE, encoding='utf-8') as f:
+        return [track['hash'] for track in json.load(f)['tracks']]
+
+
+def test_precache_is_refreshed_when_the_playlist_is_unchanged(workdir, api_url, monkeypatch):
+    fix_playlist_urls.fix_playlist(api_url=api_url)
+    assert precache_hashes() == ['a' * 16]
+    playlist = (workdir / playlist_format.PLAYLIST_FILE).read_bytes()
+
+    monkeypatch.setattr(FakeRelease, 'digest', 'sha256:' + 'b' * 64)
+    fix_playlist_urls.fix_playlist(api_url=api_url)
+    assert (workdir / playlist_format.PLAYLIST_FILE).read_bytes() == playlist
+    assert precache_hashes() == ['b' * 16]
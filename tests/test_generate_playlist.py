@@ -0,0 +1,16 @@
+import catalog
+import generate_playlist
+import playlist_format
+from conftest import mp3_data
+
+
+def test_removing_the_last_track_empties_the_playlist(workdir):
+    song = workdir / 'audio' / 'Song.mp3'
+    song.write_bytes(mp3_data())
+    generate_playlist.generate_playlist()
+    revision = playlist_format.load_playlist()['revision']
+    song.unlink()
+    generate_playlist.generate_playlist()
+    assert playlist_format.load_tracks() == []
+    _, changes = catalog.playlist_changes_since(revision)
+    assert [change['type'] for change in changes] == ['remove']
@@ -0,0 +1,70 @@
+import hashlib
+import json
+import os
+
+import catalog
+import release_assets
+import server
+from conftest import mp3_data
+
+BASE = 'https://github.com/o/r/releases/download/v1/'
+
+
+def publish(assets):
+    with open(release_assets.INDEX_FILE, 'w', encoding='utf-8') as f:
+        json.dump({'assets': assets}, f)
+
+
+def asset(name, data, digest=True):
+    record = {'id': 1, 'name': name, 'size': len(data), 'url': BASE + name}
+    if digest:
+        record['digest'] = 'sha256:' + hashlib.sha256(data).hexdigest()
+    return record
+
+
+def library(workdir, files):
+    for name, data in files.items():
+        (workdir / 'audio' / name).write_bytes(data)
+    catalog.sync_catalog(workdir / 'audio')
+    return server.LocalAssetIndex('audio')
+
+
+def test_verified_copy_is_served(workdir):
+    data = mp3_data(payload=b'\x01')
+    index = library(workdir, {'Golden (Cover).mp3': data})
+    publish([asset('Golden.Cover.mp3', data)])
+    assert index.resolve(BASE + 'Golden.Cover.mp3') == 'audio/Golden (Cover).mp3'
+
+
+def test_assets_missing_from_the_index_go_upstream(workdir):
+    index = library(workdir, {'Golden.mp3': mp3_data()})
+    assert index.resolve(BASE + 'Golden.mp3') is None
+
+
+def test_a_copy_of_another_size_is_not_served(workdir):
+    index = library(workdir, {'Golden.mp3': mp3_data(10)})
+    publish([asset('Golden.mp3', mp3_data(11), digest=False)])
+    assert index.resolve(BASE + 'Golden.mp3') is None
+
+
+def test_a_copy_with_another_digest_is_not_served(workdir):
+    index = library(workdir, {'Golden.mp3': mp3_data(payload=b'\x01')})
+    publish([asset('Golden.mp3', mp3_data(payload=b'\x02'))])
+    assert index.resolve(BASE + 'Golden.mp3') is None
+
+
+def test_name_collisions_are_settled_by_content(workdir):
+    first, second = mp3_data(payload=b'\x01'), mp3_data(payload=b'\x02')
+    index = library(workdir, {'Golden!.mp3': first, 'Golden?.mp3': second})
+    publish([asset('Golden.mp3', second)])
+    assert index.resolve(BASE + 'Golden.mp3') == 'audio/Golden?.mp3'
+
+
+def test_the_index_is_reread_when_it_changes(workdir):
+    data = mp3_data()
+    index = library(workdir, {'Golden.mp3': data})
+    publish([])
+    assert index.resolve(BASE + 'Golden.mp3') is None
+    publish([asset('Golden.mp3', data)])
+    os.utime(release_assets.INDEX_FILE, (1, 1))
+    assert index.resolve(BASE + 'Golden.mp3') == 'audio/Golden.mp3'
@@ -0,0 +1,46 @@
+import io
+
+import mp3_frames
+from conftest import FRAME_LENGTH, mp3_data
+
+
+def frames_of(data, chunk_size=64 * 1024):
+    return list(mp3_frames.iter_frames(io.BytesIO(data), chunk_size))
+
+
+def test_parse_frame_header():
+    header = mp3_frames.parse_frame_header(b'\xff\xfb\x90\x00')
+    assert (header.version, header.layer, header.bitrate, header.sample_rate) == (1, 3, 128000, 44100)
+    assert header.length == FRAME_LENGTH and header.samples == 1152
+    assert mp3_frames.parse_frame_header(b'\xff\xfb\xf0\x00') is None  # bad bitrate
+    assert mp3_frames.parse_frame_header(b'\x00\x00\x00\x00') is None
+
+
+def test_iter_frames_walks_every_frame():
+    frames = frames_of(mp3_data(5))
+    assert [offset for offset, _, _ in frames] == [i * FRAME_LENGTH for i in range(5)]
+    assert all(len(frame) == FRAME_LENGTH for _, _, frame in frames)
+
+
+def test_iter_frames_skips_id3_tags_and_junk():
+    id3 = b'ID3\x04\x00\x00\x00\x00\x00\x0a' + b'\xff' * 10
+    data = id3 + mp3_data(2) + b'junk' + mp3_data(1) + b'TAG' + b'\x00' * 125
+    frames = frames_of(data, chunk_size=100)
+    assert [offset for offset, _, _ in frames] == [20, 20 + FRAME_LENGTH, 20 + 2 * FRAME_LENGTH + 4]
+
+
+def test_truncated_last_frame_is_not_yielded():
+    assert len(frames_of(mp3_data(3)[:-10])) == 2
+
+
+def test_find_frame_start_skips_partial_frames():
+    data = mp3_data(3)
+    assert mp3_frames.find_frame_start(data) == 0
+    assert mp3_frames.find_frame_start(data[100:]) == FRAME_LENGTH - 100
+
+
+def test_find_frame_start_ignores_lone_sync_bytes():
+    # A header-like byte pattern not followed by another frame
+    data = b'\x00' * 10 + b'\xff\xfb\x90\x00' + b'\x00' * 500 + mp3_data(2)
+    assert mp3_frames.find_frame_start(data) == 514
+    assert mp3_frames.find_frame_start(b'\x00' * 100) is None
@@ -0,0 +1,64 @@
+import itertools
+
+import pytest
+
+import catalog
+import playlist_format
+
+TRACKS = [
+    {'id': 'a', 'title': 'A', 'file': 'audio/A.mp3'},
+    {'id': 'b', 'title': 'B', 'file': 'audio/B.mp3'},
+    {'id': 'c', 'title': 'C', 'file': 'audio/C.mp3'},
+    {'title': 'D', 'file': 'audio/D.mp3'},
+]
+
+
+def apply_changes(tracks, changes):
+    """What the player does with a list of changes"""
+    tracks = list(tracks)
+    for change in changes:
+        keys = [playlist_format.track_key(track) for track in tracks]
+        if change['id'] in keys:
+            del tracks[keys.index(change['id'])]
+        if change['type'] != 'remove':
+            tracks.insert(change['index'], change['track'])
+    return tracks
+
+
+@pytest.mark.parametrize('old', [list(p) for n in range(3) for p in itertools.permutations(TRACKS, n)]
+                         + [TRACKS])
+def test_changes_turn_old_into_new(old):
+    renamed = dict(TRACKS[1], title='B (live)')
+    for new in ([], TRACKS, TRACKS[::-1], [TRACKS[3], renamed, TRACKS[0]]):
+        assert apply_changes(old, playlist_format.diff_tracks(old, new)) == new
+
+
+def test_unchanged_playlist_has_no_changes():
+    assert playlist_format.diff_tracks(TRACKS, [dict(track) for track in TRACKS]) == []
+
+
+def test_tracks_without_id_are_keyed_by_file():
+    changes = playlist_format.diff_tracks(TRACKS, TRACKS[:3])
+    assert changes == [{'type': 'remove', 'id': 'audio/D.mp3'}]
+
+
+def test_changes_since_a_revision(workdir):
+    with catalog.open_catalog() as db:
+        first = catalog.append_playlist_changes(db, [{'type': 'remove', 'id': 'a'}])
+        latest = catalog.append_playlist_changes(db, [{'type': 'remove', 'id': 'b'},
+                                                      {'type': 'remove', 'id': 'c'}])
+    assert latest == first + 2
+    assert catalog.playlist_changes_since(first) == (latest, [
+        {'type': 'remove', 'id': 'b', 'revision': first + 1},
+        {'type': 'remove', 'id': 'c', 'revision': first + 2},
+    ])
+    assert catalog.playlist_changes_since(latest) == (latest, [])
+
+
+def test_unknown_or_forgotten_revisions_need_a_snapshot(workdir, monkeypatch):
+    monkeypatch.setattr(catalog, 'MAX_PLAYLIST_CHANGES', 2)
+    with catalog.open_catalog() as db:
+        latest = catalog.append_playlist_changes(db, [{'type': 'remove', 'id': key} for key in 'abc'])
+    assert catalog.playlist_changes_since(latest + 1) == (latest, None)
+    assert catalog.playlist_changes_since(latest - 3) == (latest, None)
+    assert len(catalog.playlist_changes_since(latest - 2)[1]) == 2
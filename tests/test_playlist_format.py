@@ -0,0 +1,64 @@
+import json
+
+import playlist_format
+
+BASES = {'release': 'https://github.com/o/r/releases/download/v1/', 'local': 'audio/'}
+
+
+def test_build_playlist_keeps_only_compact_fields():
+    playlist = playlist_format.build_playlist(
+        [{'id': 'abc', 'title': 'Golden', 'base': 'release', 'name': 'Golden.mp3', 'size': 3}],
+        BASES)
+    assert playlist == {
+        'version': 2,
+        'bases': BASES,
+        'tracks': [{'id': 'abc', 'title': 'Golden', 'base': 'release', 'name': 'Golden.mp3'}],
+    }
+
+
+def test_expand_tracks_restores_full_urls():
+    playlist = playlist_format.build_playlist([
+        {'id': 'abc', 'title': 'Golden', 'base': 'release', 'name': 'Golden.mp3'},
+        {'title': 'Local', 'base': 'local', 'name': 'Local%20Song.mp3'},
+    ], BASES)
+    assert playlist_format.expand_tracks(playlist) == [
+        {'id': 'abc', 'title': 'Golden',
+         'file': 'https://github.com/o/r/releases/download/v1/Golden.mp3'},
+        {'title': 'Local', 'file': 'audio/Local%20Song.mp3'},
+    ]
+
+
+def test_expand_tracks_passes_legacy_lists_through():
+    legacy = [{'title': 'Old', 'file': 'audio/Old.mp3'}]
+    assert playlist_format.expand_tracks(legacy) is legacy
+
+
+def test_ndjson_lines_expand_like_the_json_file():
+    playlist = playlist_format.build_playlist(
+        [{'title': 'Golden', 'base': 'release', 'name': 'Golden.mp3'}], BASES)
+    lines = [json.dumps({'version': 2, 'bases': BASES}).encode('utf-8'), b'\n']
+    lines += [json.dumps(track) for track in playlist['tracks']]
+    assert list(playlist_format.iter_ndjson_tracks(lines)) == playlist_format.expand_tracks(playlist)
+
+
+def test_precache_manifest_uses_content_hashes():
+    playlist = playlist_format.build_playlist([
+        {'id': 'abc', 'title': 'Local', 'base': 'local', 'name': 'Local.mp3'},
+        {'title': 'Golden', 'base': 'release', 'name': 'Golden.mp3'},
+        {'title': 'Unpublished', 'base': 'release', 'name': 'Unpublished.mp3'},
+    ], BASES)
+    assets = {BASES['release'] + 'Golden.mp3': {'size': 20, 'digest': 'sha256:' + 'f' * 64}}
+    manifest = playlist_format.build_precache_manifest(playlist, sizes={'abc': 10}, assets=assets)
+    assert manifest['tracks'] == [
+        {'url': 'audio/Local.mp3', 'hash': 'abc', 'size': 10},
+        {'url': BASES['release'] + 'Golden.mp3', 'hash': 'f' * 16, 'size': 20},
+    ]
+
+
+def test_precache_version_follows_content():
+    playlist = playlist_format.build_playlist(
+        [{'id': 'abc', 'title': 'Local', 'base': 'local', 'name': 'Local.mp3'}], BASES)
+    first = playlist_format.build_precache_manifest(playlist, sizes={'abc': 10}, assets={})
+    again = playlist_format.build_precache_manifest(playlist, sizes={'abc': 10}, assets={})
+    resized = playlist_format.build_precache_manifest(playlist, sizes={'abc': 11}, assets={})
+    assert first['version'] == again['version'] != resized['version']
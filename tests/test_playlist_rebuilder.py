@@ -0,0 +1,28 @@
+import threading
+
+from server import PlaylistRebuilder
+
+
+def test_requests_in_one_window_share_a_rebuild():
+    calls = []
+    rebuilder = PlaylistRebuilder(lambda: calls.append(1), delay=0.05)
+    tickets = [rebuilder.request() for _ in range(5)]
+    assert all(rebuilder.wait(ticket, timeout=5) for ticket in tickets)
+    assert calls == [1]
+
+
+def test_wait_gives_up_on_a_hung_rebuild():
+    release = threading.Event()
+    rebuilder = PlaylistRebuilder(release.wait, delay=0)
+    ticket = rebuilder.request()
+    assert rebuilder.wait(ticket, timeout=0.1) is False
+    release.set()
+    assert rebuilder.wait(ticket, timeout=5) is True
+
+
+def test_failed_rebuild_still_releases_waiters():
+    def fail():
+        raise OSError('disk full')
+
+    rebuilder = PlaylistRebuilder(fail, delay=0)
+    assert rebuilder.wait(rebuilder.request(), timeout=5)
@@ -0,0 +1,37 @@
+import http.client
+import time
+
+import pytest
+
+import sampling_profiler
+import server
+
+
+@pytest.fixture
+def profiler(monkeypatch):
+    profiler = sampling_profiler.SamplingProfiler(interval=0.001)
+    monkeypatch.setattr(server, 'profiler', profiler)
+    return profiler
+
+
+def test_streaming_routes_are_not_profiled(profiler, local_server):
+    port = local_server
+    events = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    events.request('GET', '/api/playlist/events')
+    response = events.getresponse()
+    assert response.status == 200
+    assert response.fp.readline() == b'retry: 3000\n'
+    assert profiler.active == {}
+    events.close()
+
+    page = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    page.request('GET', '/favicon.svg')
+    response = page.getresponse()
+    response.read()
+    page.close()
+    assert response.status == 200
+    # The request is counted once the handler returns, just after the reply
+    deadline = time.monotonic() + 5
+    while profiler.requests == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert profiler.requests == 1
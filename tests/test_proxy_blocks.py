@@ -0,0 +1,44 @@
+from types import SimpleNamespace
+
+from server import ProxyBlockCache
+
+
+def transfer(start, data, total, url='u/A.mp3'):
+    """A completed upstream transfer of data, which starts at byte start"""
+    return SimpleNamespace(url=url, start=start, buffer=bytearray(data), total_size=total,
+                           headers={'Content-Type': 'application/octet-stream'})
+
+
+def test_keeps_whole_blocks_only():
+    cache = ProxyBlockCache(capacity=1000, block_size=10)
+    data = bytes(range(25))
+    cache.add_transfer(transfer(5, data[5:25], 25))
+    assert cache.get('u/A.mp3', 0) is None               # starts before the transfer
+    assert cache.get('u/A.mp3', 1) == data[10:20]
+    assert cache.get('u/A.mp3', 2) == data[20:25]        # the short last block
+    assert cache.asset_info('u/A.mp3') == (25, 'audio/mpeg')
+
+
+def test_partial_last_block_is_not_kept():
+    cache = ProxyBlockCache(capacity=1000, block_size=10)
+    cache.add_transfer(transfer(0, bytes(15), 40))
+    assert cache.get('u/A.mp3', 0) == bytes(10)
+    assert cache.get('u/A.mp3', 1) is None
+
+
+def test_transfer_without_size_is_ignored():
+    cache = ProxyBlockCache(capacity=1000, block_size=10)
+    cache.add_transfer(transfer(0, bytes(10), None))
+    assert cache.get('u/A.mp3', 0) is None
+    assert cache.asset_info('u/A.mp3') is None
+
+
+def test_least_recently_used_blocks_are_evicted():
+    cache = ProxyBlockCache(capacity=20, block_size=10)
+    cache.add_transfer(transfer(0, bytes(20), 100, url='u/A.mp3'))
+    cache.get('u/A.mp3', 0)
+    cache.add_transfer(transfer(0, bytes(10), 100, url='u/B.mp3'))
+    assert cache.get('u/A.mp3', 0) is not None
+    assert cache.get('u/A.mp3', 1) is None
+    assert cache.get('u/B.mp3', 0) is not None
+    assert cache.size == 20
@@ -0,0 +1,35 @@
+import server
+from conftest import FRAME_LENGTH, mp3_data
+
+
+def test_ring_buffer_wraps_around():
+    ring = server.RadioRingBuffer(10)
+    ring.write(b'abcdefgh')
+    ring.write(b'ijkl')
+    assert ring.read(4, timeout=0) == (b'efghijkl', 12)
+    # Overrun: more than a full buffer behind
+    assert ring.read(0, timeout=0) == (None, 0)
+
+
+def test_join_burst_starts_on_a_frame_boundary():
+    ring = server.RadioRingBuffer(64 * 1024)
+    ring.write(mp3_data(20))
+    position = ring.live_position(burst=1000)
+    assert position % FRAME_LENGTH == 0
+    assert 20 * FRAME_LENGTH - position <= 1000
+
+
+def test_local_tracks_open_by_their_raw_name(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'audio').mkdir()
+    (tmp_path / 'audio' / '100%20Pure.mp3').write_bytes(b'local')
+    (tmp_path / 'audio' / '100 Pure.mp3').write_bytes(b'wrong')
+    station = server.RadioStation(server.LivePlaylist())
+    with station._open_track({'file': 'audio/100%20Pure.mp3'}) as f:
+        assert f.read() == b'local'
+
+
+def test_close_wakes_waiting_readers():
+    ring = server.RadioRingBuffer(10)
+    ring.close()
+    assert ring.read(0, timeout=5) == (b'', 0)
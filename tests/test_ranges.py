@@ -0,0 +1,19 @@
+from server import parse_byte_range
+
+
+def test_closed_and_open_ranges():
+    assert parse_byte_range('bytes=0-499') == (0, 499)
+    assert parse_byte_range('bytes=500-') == (500, None)
+    assert parse_byte_range(' bytes=7-7 ') == (7, 7)
+
+
+def test_unhandled_forms_are_passed_through():
+    assert parse_byte_range(None) is None
+    assert parse_byte_range('') is None
+    assert parse_byte_range('bytes=-500') is None          # suffix
+    assert parse_byte_range('bytes=0-1,5-9') is None       # multi-part
+    assert parse_byte_range('items=0-1') is None
+
+
+def test_backwards_range_is_rejected():
+    assert parse_byte_range('bytes=10-5') is None
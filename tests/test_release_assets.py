@@ -0,0 +1,85 @@
+import http.server
+import json
+import threading
+
+import pytest
+
+import release_assets
+
+
+class FakeGitHub(http.server.BaseHTTPRequestHandler):
+    """Release v1 with three assets, two per page, ETags on every page"""
+    pages = {
+        '/repos/o/r/releases/tags/v1': ({'id': 7}, None),
+        '/repos/o/r/releases/7/assets?per_page=100': (
+            [{'id': 1, 'name': 'A.mp3', 'size': 10, 'browser_download_url': 'u/A.mp3'},
+             {'id': 2, 'name': 'B.mp3', 'size': 20, 'browser_download_url': 'u/B.mp3'}],
+            '/repos/o/r/releases/7/assets?per_page=100&page=2'),
+        '/repos/o/r/releases/7/assets?per_page=100&page=2': (
+            [{'id': 3, 'name': 'C.mp3', 'size': 30, 'browser_download_url': 'u/C.mp3',
+              'digest': 'sha256:00'}],
+            None),
+    }
+    requests = []
+
+    def do_GET(self):
+        data, next_page = self.pages[self.path]
+        etag = f'"{self.path}"'
+        self.requests.append((self.path, self.headers.get('If-None-Match')))
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        if next_page:
+            host = self.headers['Host']
+            self.send_header('Link', f'<http://{host}{next_page}>; rel="next"')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def api_url():
+    FakeGitHub.requests = []
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), FakeGitHub)
+    threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True).start()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}'
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_follows_pagination(workdir, api_url):
+    assets, previous = release_assets.refresh_index('o/r', 'v1', api_url)
+    assert [asset['name'] for asset in assets] == ['A.mp3', 'B.mp3', 'C.mp3']
+    assert assets[2]['digest'] == 'sha256:00'
+    assert previous is None
+
+
+def test_unchanged_pages_are_revalidated(workdir, api_url):
+    release_assets.refresh_index('o/r', 'v1', api_url)
+    assets, previous = release_assets.refresh_index('o/r', 'v1', api_url)
+    assert assets == previous
+    second_run = FakeGitHub.requests[3:]
+    assert len(second_run) == 3 and all(etag for _, etag in second_run)
+
+
+def test_index_of_another_release_is_not_reused(workdir, api_url):
+    release_assets.refresh_index('o/r', 'v1', api_url)
+    with open(release_assets.INDEX_FILE, encoding='utf-8') as f:
+        index = json.load(f)
+    index['tag'] = 'v0'
+    with open(release_assets.INDEX_FILE, 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    release_assets.refresh_index('o/r', 'v1', api_url)
+    assert all(etag is None for _, etag in FakeGitHub.requests[3:])
+
+
+def test_published_assets_by_url(workdir, api_url):
+    release_assets.refresh_index('o/r', 'v1', api_url)
+    assert release_assets.published_assets()['u/B.mp3']['size'] == 20
@@ -0,0 +1,10 @@
+import rename_audio
+from conftest import mp3_data
+
+
+def test_only_two_digit_prefixes_are_dropped(workdir):
+    audio = workdir / 'audio'
+    (audio / '07_Golden.mp3').write_bytes(mp3_data(payload=b'a'))
+    (audio / '1979_Smashing.mp3').write_bytes(mp3_data(payload=b'b'))
+    rename_audio.rename_audio_files()
+    assert sorted(path.name for path in audio.iterdir()) == ['1979_Smashing.mp3', 'Golden.mp3']
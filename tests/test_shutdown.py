@@ -0,0 +1,33 @@
+import http.client
+import time
+
+import pytest
+
+import server
+
+
+@pytest.fixture
+def streams(monkeypatch):
+    """Fresh playlist and radio, so closing them doesn't leak into other tests"""
+    playlist = server.LivePlaylist()
+    monkeypatch.setattr(server, 'live_playlist', playlist)
+    monkeypatch.setattr(server, 'radio_station', server.RadioStation(playlist))
+
+
+@pytest.mark.parametrize('path', ['/api/playlist/events', '/api/radio'])
+def test_close_streams_ends_endless_responses(streams, local_server, path):
+    connection = http.client.HTTPConnection('127.0.0.1', local_server, timeout=5)
+    connection.request('GET', path)
+    response = connection.getresponse()
+    assert response.status == 200
+    started = time.monotonic()
+    server.close_streams()
+    response.read()  # returns once the server ends the body
+    connection.close()
+    assert time.monotonic() - started < server.SHUTDOWN_GRACE / 2
+
+
+def test_closed_playlist_ends_new_subscribers():
+    playlist = server.LivePlaylist()
+    playlist.close()
+    assert playlist.subscribe().get(timeout=0) is None
@@ -0,0 +1,32 @@
+import threading
+
+import server
+
+
+def test_first_request_is_reported_once(capsys):
+    report = server.StartupReport(0.0)
+    threads = [threading.Thread(target=report.request_served) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert capsys.readouterr().out.count('First request served') == 1
+
+
+def test_ytdlp_is_probed_once(monkeypatch):
+    calls = []
+
+    def run(*args, **kwargs):
+        calls.append(args)
+        raise OSError
+
+    server._probe_ytdlp.cache_clear()
+    monkeypatch.setattr(server.subprocess, 'run', run)
+    threads = [threading.Thread(target=server.ytdlp_version) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert server.ytdlp_version() is None
+    assert len(calls) == 1
+    server._probe_ytdlp.cache_clear()
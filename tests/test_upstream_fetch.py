@@ -0,0 +1,97 @@
+import http.server
+import threading
+
+import pytest
+
+import server
+
+ASSET = bytes(range(256)) * 160  # 40960 bytes: its first half fills whole read chunks
+
+
+class SlowAsset(http.server.BaseHTTPRequestHandler):
+    """Serves ASSET with Range support; holds the body until `release` is set"""
+    requests = []
+    release = threading.Event()
+
+    def do_GET(self):
+        self.requests.append(self.headers.get('Range'))
+        start, end = server.parse_byte_range(self.headers.get('Range')) or (0, None)
+        end = len(ASSET) - 1 if end is None else min(end, len(ASSET) - 1)
+        body = ASSET[start:end + 1]
+        self.send_response(206)
+        self.send_header('Content-Range', f'bytes {start}-{end}/{len(ASSET)}')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        # Half now, the rest once every client has joined
+        half = len(body) // 2
+        self.wfile.write(body[:half])
+        self.wfile.flush()
+        self.release.wait(5)
+        self.wfile.write(body[half:])
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def asset_url(monkeypatch):
+    SlowAsset.requests = []
+    SlowAsset.release = threading.Event()
+    monkeypatch.setattr(server, 'upstream_fetches', server.UpstreamFetchRegistry())
+    monkeypatch.setattr(server, 'proxy_blocks', server.ProxyBlockCache())
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), SlowAsset)
+    threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True).start()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}/A.mp3'
+    SlowAsset.release.set()
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def read(fetch, offset, length):
+    fetch.wait_for_headers()
+    return b''.join(fetch.iter_chunks(offset, length))
+
+
+def test_identical_requests_share_one_transfer(asset_url):
+    acquired = [server.upstream_fetches.acquire(asset_url, 'bytes=1000-') for _ in range(5)]
+    assert len({id(fetch) for fetch, _, _ in acquired}) == 1
+    bodies = [None] * 5
+
+    def client(i):
+        bodies[i] = read(*acquired[i])
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(5)]
+    for thread in threads:
+        thread.start()
+    SlowAsset.release.set()
+    for thread in threads:
+        thread.join(5)
+    assert bodies == [ASSET[1000:]] * 5
+    assert SlowAsset.requests == ['bytes=1000-']
+
+
+def test_overlapping_request_joins_late_and_gets_its_slice(asset_url):
+    first, offset, length = server.upstream_fetches.acquire(asset_url, 'bytes=0-')
+    with first.condition:
+        assert first.condition.wait_for(lambda: len(first.buffer) >= 8192, 5)
+    # Joins after the first half has been buffered: reads from that buffer,
+    # then from the rest as it arrives
+    late = server.upstream_fetches.acquire(asset_url, 'bytes=100-8999')
+    open_ended = server.upstream_fetches.acquire(asset_url, 'bytes=9000-')
+    assert late[0] is first and late[1:] == (100, 8900)
+    assert open_ended[0] is first and open_ended[1:] == (9000, len(ASSET) - 9000)
+    SlowAsset.release.set()
+    assert read(first, offset, length) == ASSET
+    assert read(*late) == ASSET[100:9000]
+    assert read(*open_ended) == ASSET[9000:]
+    assert SlowAsset.requests == ['bytes=0-']
+
+
+def test_range_outside_a_transfer_starts_another(asset_url):
+    first, _, _ = server.upstream_fetches.acquire(asset_url, 'bytes=5000-5999')
+    first.wait_for_headers()
+    other, offset, length = server.upstream_fetches.acquire(asset_url, 'bytes=4000-4999')
+    assert other is not first
+    SlowAsset.release.set()
+    assert read(other, offset, length) == ASSET[4000:5000]
+    assert sorted(SlowAsset.requests) == ['bytes=4000-4999', 'bytes=5000-5999']
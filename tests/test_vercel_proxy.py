@@ -0,0 +1,109 @@
+import http.client
+import http.server
+import threading
+
+import pytest
+
+from api import proxy
+
+ASSET_PATH = '/o/r/releases/download/v1/A.mp3'
+ASSET = bytes(range(250))
+
+
+class FakeRelease(http.server.BaseHTTPRequestHandler):
+    """One 250-byte release asset that honours single byte ranges"""
+    requests = []
+
+    def do_GET(self):
+        self.requests.append((self.path, self.headers.get('Range')))
+        if self.path.split('?')[0] != ASSET_PATH:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        byte_range = proxy.parse_byte_range(self.headers.get('Range'))
+        start, end = byte_range
+        end = len(ASSET) - 1 if end is None else min(end, len(ASSET) - 1)
+        body = ASSET[start:end + 1]
+        self.send_response(206 if self.headers.get('Range') else 200)
+        if self.headers.get('Range'):
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(ASSET)}')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(handler):
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True).start()
+    return httpd
+
+
+@pytest.fixture
+def get(monkeypatch):
+    """GET the proxy for the fake asset: get(headers) -> (status, headers, body)"""
+    monkeypatch.setattr(proxy, 'BLOCK_SIZE', 100)
+    monkeypatch.setattr(proxy, 'EDGE_ORIGIN', '')
+    FakeRelease.requests = []
+    upstream = serve(FakeRelease)
+    function = serve(proxy.handler)
+    # The URL check only looks for a GitHub release download path
+    url = f'http://127.0.0.1:{upstream.server_address[1]}{ASSET_PATH}?github.com'
+
+    def get(headers=None):
+        headers = {name: value.replace('UPSTREAM', f'127.0.0.1:{upstream.server_address[1]}')
+                   for name, value in (headers or {}).items()}
+        connection = http.client.HTTPConnection('127.0.0.1', function.server_address[1], timeout=5)
+        connection.request('GET', '/api/proxy?' + proxy.urllib.parse.urlencode({'url': url}),
+                           headers=headers)
+        response = connection.getresponse()
+        body = response.read()
+        connection.close()
+        return response.status, response.headers, body
+
+    yield get
+    for httpd in (upstream, function):
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def test_parse_byte_range():
+    assert proxy.parse_byte_range(None) == (0, None)
+    assert proxy.parse_byte_range('bytes=5-') == (5, None)
+    assert proxy.parse_byte_range('bytes=5-9') == (5, 9)
+    assert proxy.parse_byte_range('bytes=-5') is None
+    with pytest.raises(ValueError):
+        proxy.parse_byte_range('bytes=9-5')
+
+
+def test_open_range_ends_with_its_block(get):
+    status, headers, body = get({'Range': 'bytes=150-'})
+    assert status == 206
+    assert headers['Content-Range'] == 'bytes 150-199/250'
+    assert body == ASSET[150:200]
+    assert FakeRelease.requests == [(ASSET_PATH + '?github.com', 'bytes=100-199')]
+
+
+def test_closed_range_spans_blocks(get):
+    status, headers, body = get({'Range': 'bytes=50-220'})
+    assert status == 206
+    assert body == ASSET[50:221]
+    assert [r for _, r in FakeRelease.requests] == ['bytes=0-99', 'bytes=100-199', 'bytes=200-299']
+
+
+def test_whole_file_is_one_upstream_request(get):
+    status, _, body = get()
+    assert status == 200
+    assert body == ASSET
+    assert FakeRelease.requests == [(ASSET_PATH + '?github.com', None)]
+
+
+def test_host_header_is_not_used_to_fetch_blocks(get):
+    # A Host naming some other server must not make the function request it
+    status, _, body = get({'Range': 'bytes=0-9', 'Host': 'UPSTREAM', 'X-Forwarded-Proto': 'http'})
+    assert status == 206
+    assert body == ASSET[:10]
+    assert all(path.startswith(ASSET_PATH) for path, _ in FakeRelease.requests)
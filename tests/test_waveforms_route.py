@@ -0,0 +1,21 @@
+import http.client
+
+
+def get(port, path):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    connection.request('GET', path)
+    response = connection.getresponse()
+    body = response.read()
+    connection.close()
+    return response.status, body
+
+
+def test_suffixed_track_ids_are_served(local_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'waveforms').mkdir()
+    (tmp_path / 'waveforms' / 'e4b51469fdaa04de.peaks').write_bytes(b'first')
+    (tmp_path / 'waveforms' / 'e4b51469fdaa04de-2.peaks').write_bytes(b'second')
+    assert get(local_server, '/waveforms/e4b51469fdaa04de.peaks') == (200, b'first')
+    assert get(local_server, '/waveforms/e4b51469fdaa04de-2.peaks') == (200, b'second')
+    assert get(local_server, '/waveforms/e4b51469fdaa04de-x.peaks')[0] == 404
+    assert get(local_server, '/waveforms/..%2Fcatalog.peaks')[0] == 404
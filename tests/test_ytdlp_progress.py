@@ -0,0 +1,29 @@
+from server import parse_ytdlp_line
+
+
+def test_download_progress_line():
+    update = parse_ytdlp_line('[download]  42.1% of ~ 5.21MiB at 1.20MiB/s ETA 00:03')
+    assert update == {
+        'stage': 'downloading',
+        'percent': 42.1,
+        'size': '5.21MiB',
+        'speed': '1.20MiB/s',
+        'eta': '00:03',
+    }
+
+
+def test_progress_line_without_speed_or_eta():
+    update = parse_ytdlp_line('[download] 100% of 5.21MiB')
+    assert update['percent'] == 100.0
+    assert update['speed'] is None and update['eta'] is None
+
+
+def test_post_processor_stages():
+    assert parse_ytdlp_line('[ExtractAudio] Destination: audio/Song.mp3') == {'stage': 'converting'}
+    assert parse_ytdlp_line('[Metadata] Adding metadata') == {'stage': 'tagging'}
+
+
+def test_other_lines_are_ignored():
+    assert parse_ytdlp_line('[youtube] abcdefghijk: Downloading webpage') is None
+    assert parse_ytdlp_line('[download] Destination: audio/Song.webm') is None
+    assert parse_ytdlp_line('') is None
@@ -3,50 +3,57 @@
 Script to upload MP3 files to GitHub Releases and update playlist.json
 """
 import os
-import json
 import sys
 
+import catalog
+import playlist_format
+
 GITHUB_REPO = "josazar/MP3_CHARLIEOLGA"
 RELEASE_TAG = "audio-files-v1.0"
 RELEASE_NAME = "Audio Files"
 
 def get_audio_files():
-    """Get all MP3 files from audio directory"""
-    audio_dir = "audio"
-    if not os.path.exists(audio_dir):
-        print(f"❌ Error: '{audio_dir}' directory not found")
+    """Get all MP3 files from the catalog, in playlist order"""
+    if not os.path.exists("audio"):
+        print("❌ Error: 'audio' directory not found")
         sys.exit(1)
     
-    mp3_files = [f for f in os.listdir(audio_dir) if f.endswith('.mp3')]
-    mp3_files.sort()
-    return mp3_files
+    # The catalog was synced with audio/ when the playlist was generated
+    return [track['file'] for track in catalog.list_tracks()]
 
-def generate_playlist_with_github_urls():
+def generate_playlist_with_github_urls(ndjson=False):
     """Generate playlist.json with GitHub Release URLs"""
-    mp3_files = get_audio_files()
+    if not os.path.exists("audio"):
+        print("❌ Error: 'audio' directory not found")
+        sys.exit(1)
+    tracks = catalog.sync_catalog("audio")
     
     playlist = []
-    base_url = f"https://github.com/{GITHUB_REPO}/releases/download/{RELEASE_TAG}"
-    
-    for filename in mp3_files:
-        # Remove number prefix and .mp3 extension for title
-        title = filename
-        if '_' in filename:
-            title = '_'.join(filename.split('_')[1:])
-        title = title.replace('.mp3', '')
+    asset_urls = {}
+    base_url = f"https://github.com/{GITHUB_REPO}/releases/download/{RELEASE_TAG}/"
+    
+    for track in tracks:
+        filename = track['file']
+        # Remove legacy number prefix and .mp3 extension for title
+        title = catalog.title_from_filename(filename)
         
         # URL encode the filename for GitHub
         from urllib.parse import quote
         encoded_filename = quote(filename)
         
         playlist.append({
+            "id": track['id'],
             "title": title,
-            "file": f"{base_url}/{encoded_filename}"
+            "base": "release",
+            "name": encoded_filename
         })
+        # Remember where the track is published, for local-first proxying
+        asset_urls[filename] = base_url + encoded_filename
+    
+    catalog.set_asset_urls(asset_urls)
     
-    # Write playlist.json
-    with open('playlist.json', 'w', encoding='utf-8') as f:
-        json.dump(playlist, f, ensure_ascii=False, indent=2)
+    # Write playlist.json (base URL declared once)
+    playlist_format.write_playlist(playlist, {"release": base_url}, ndjson=ndjson)
     
     print(f"✅ Generated playlist.json with {len(playlist)} tracks")
     return playlist
@@ -118,8 +125,18 @@ if __name__ == "__main__":
     print("🎵 Configuration GitHub Releases pour les MP3")
     print("=" * 70)
     
-    # Generate playlist with GitHub URLs
-    playlist = generate_playlist_with_github_urls()
+    # Don't publish truncated or corrupt files (--skip-check to override)
+    if '--skip-check' not in sys.argv:
+        import check_audio
+        bad = check_audio.find_bad_tracks("audio")
+        if bad:
+            print(f"❌ {len(bad)} fichier(s) MP3 corrompu(s), upload annulé:")
+            check_audio.print_report(bad)
+            print("\nRetélécharge-les ou supprime-les, puis relance (ou --skip-check)")
+            sys.exit(1)
+    
+    # Generate playlist with GitHub URLs (--ndjson also writes playlist.ndjson)
+    playlist = generate_playlist_with_github_urls(ndjson='--ndjson' in sys.argv)
     
     # Create upload script for GitHub CLI
     create_gh_cli_script()